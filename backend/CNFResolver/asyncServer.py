@@ -0,0 +1,302 @@
+import asyncio
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any,Dict,Iterator,Tuple,Union
+
+import server
+import wire
+
+# asyncio front end with the same routes as server.py, GET /metrics included.
+# The event loop only parses requests and writes responses, the solver runs on a bounded
+# thread pool so a long resolution never stalls other connections. When every worker is busy
+# and the wait queue is full new requests are turned away with 503 instead of piling up.
+# If a client hangs up while its / or /stream request is running the search is cancelled.
+# /stream answers with a chunked response, one chunk per event, fed through a bounded queue
+# so a client that reads slowly holds the search back instead of letting events pile up.
+# Threads rather than processes so /resolvent can keep using the shared session store.
+# An /upload body is not read up front, the loader on the solver thread asks the event loop
+# for it a chunk at a time, so a clause file of any size never has to fit in memory at once.
+
+hostName = server.hostName
+serverPort = server.serverPort
+solverWorkers = 4
+# requests allowed to wait for a worker on top of the ones running
+solverQueue = 16
+keepAliveSeconds = 15
+# events a /stream search may get ahead of its client
+streamBuffer = 64
+maxHeaderBytes = 64*1024
+# for requests read whole, /upload bodies are streamed and not bounded
+maxBodyBytes = 64*1024*1024
+
+REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 408: "Request Timeout", 413: "Payload Too Large", 500: "Internal Server Error", 503: "Service Unavailable"}
+
+class BadRequest(Exception):
+    def __init__(self, status:int, message:str):
+        super().__init__(message)
+        self.status = status
+
+def readJSON(headers:Dict[str,str], body:bytes) -> Any:
+    if headers.get("content-type", "").split(";")[0].strip() != "application/json":
+        raise BadRequest(400, "body not JSON")
+    try:
+        return json.loads(body)
+    except ValueError:
+        raise BadRequest(400, "body not JSON")
+
+class Connection:
+    # buffered reading of http/1.1 requests off one client connection
+    def __init__(self, reader:asyncio.StreamReader, writer:asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
+        self.buffer = b""
+        self.closed = False
+        # what is left of an /upload body nobody read yet
+        self.unread = 0
+    async def fill(self) -> bool:
+        chunk = await self.reader.read(65536)
+        if len(chunk) == 0:
+            self.closed = True
+            return False
+        self.buffer += chunk
+        return True
+    async def readRequest(self) -> Union[Tuple[str,str,Dict[str,str],Union[bytes,None]],None]:
+        # the body is None for an /upload, see readSome
+        while b"\r\n\r\n" not in self.buffer:
+            if len(self.buffer) > maxHeaderBytes:
+                raise BadRequest(400, "headers too large")
+            if not await self.fill():
+                return None
+        head, self.buffer = self.buffer.split(b"\r\n\r\n", 1)
+        lines = head.decode("latin-1").split("\r\n")
+        try:
+            method, path, _ = lines[0].split(" ", 2)
+        except ValueError:
+            raise BadRequest(400, "malformed request line")
+        headers = {}
+        for line in lines[1:]:
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+        length = int(headers.get("content-length", "0") or 0)
+        if method == "POST" and path.partition("?")[0] == "/upload":
+            self.unread = length
+            return method, path, headers, None
+        if length > maxBodyBytes:
+            raise BadRequest(413, "body too large")
+        while len(self.buffer) < length:
+            if not await self.fill():
+                return None
+        body, self.buffer = self.buffer[:length], self.buffer[length:]
+        return method, path, headers, body
+    async def readSome(self) -> bytes:
+        # the next chunk of an /upload body, empty at its end or when the client went away
+        if self.unread == 0 or (len(self.buffer) == 0 and not await self.fill()):
+            return b""
+        chunk, self.buffer = self.buffer[:self.unread], self.buffer[self.unread:]
+        self.unread -= len(chunk)
+        return chunk
+    def bodyLines(self, loop:asyncio.AbstractEventLoop, read:asyncio.Event) -> Iterator[str]:
+        # the /upload body as lines of text, on a solver thread, read sets once all of it is in
+        pending = b""
+        try:
+            while True:
+                chunk = asyncio.run_coroutine_threadsafe(self.readSome(), loop).result()
+                if len(chunk) == 0:
+                    break
+                *lines, pending = (pending + chunk).split(b"\n")
+                for line in lines:
+                    yield (line + b"\n").decode("utf-8")
+            if len(pending) > 0:
+                yield pending.decode("utf-8")
+        finally:
+            loop.call_soon_threadsafe(read.set)
+    async def watchDisconnect(self, cancel:threading.Event, read:Union[asyncio.Event,None] = None):
+        # runs while a request is being solved, a client that closes its side will not read the answer
+        # anything it sends meanwhile (a pipelined request) stays in the buffer for later,
+        # with an upload it starts once the body is read, until then the body is what comes in
+        if read is not None:
+            await read.wait()
+        while await self.fill():
+            pass
+        cancel.set()
+    def writeHead(self, status:int, keep_alive:bool, headers:Dict[str,str]):
+        headers = {**headers, "Access-Control-Allow-Origin": "*", "Connection": "keep-alive" if keep_alive else "close"}
+        head = f"HTTP/1.1 {status} {REASONS.get(status, '')}\r\n" + "".join(f"{name}: {value}\r\n" for name, value in headers.items()) + "\r\n"
+        self.writer.write(head.encode("latin-1"))
+    def respond(self, status:int, payload:Dict[str,Any], keep_alive:bool, extra_headers:Union[Dict[str,str],None] = None, accept:Union[str,None] = None):
+        body, content_type = wire.serialize(payload, accept)
+        self.writeHead(status, keep_alive, {"Content-Type": content_type, "Content-Length": str(len(body)), **(extra_headers or {})})
+        self.writer.write(body)
+    def writeChunk(self, data:bytes):
+        self.writer.write(f"{len(data):x}\r\n".encode("latin-1") + data + b"\r\n")
+
+class AsyncServer:
+    def __init__(self, workers:int = solverWorkers, queue:int = solverQueue):
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="solver")
+        self.capacity = workers + queue
+        self.in_flight = 0
+    async def solve(self, connection:Connection, function, *args, read:Union[asyncio.Event,None] = None) -> Tuple[int,Dict[str,Any]]:
+        if self.in_flight >= self.capacity:
+            return 503, {"message": "server busy, try again later"}
+        self.in_flight += 1
+        cancel = threading.Event()
+        watcher = asyncio.ensure_future(connection.watchDisconnect(cancel, read))
+        try:
+            result = await asyncio.get_running_loop().run_in_executor(self.pool, function, *args, cancel)
+            return 200, result
+        except ValueError as error:
+            return 400, {"message": str(error)}
+        except Exception as error:
+            return 500, {'error': 'Error in resolving', 'detail': str(error)}
+        finally:
+            self.in_flight -= 1
+            watcher.cancel()
+            # a cancelled watcher may still have been in the middle of reading, let it settle
+            await asyncio.gather(watcher, return_exceptions=True)
+    async def stream(self, connection:Connection, message:Any, sse:bool, keep_alive:bool) -> bool:
+        # false when the server is too busy to start the search, true once the request is answered
+        if self.in_flight >= self.capacity:
+            return False
+        self.in_flight += 1
+        loop = asyncio.get_running_loop()
+        events:asyncio.Queue = asyncio.Queue(streamBuffer)
+        cancel = threading.Event()
+        def put(event):
+            # blocks the solver thread while the queue is full
+            asyncio.run_coroutine_threadsafe(events.put(event), loop).result()
+        try:
+            # a bad request is answered before the 200, like the other paths
+            generator = await loop.run_in_executor(self.pool, server.streamMessage, message, cancel)
+        except ValueError as error:
+            self.in_flight -= 1
+            connection.respond(400, {"message": str(error)}, keep_alive)
+            return True
+        except Exception as error:
+            self.in_flight -= 1
+            connection.respond(500, {'error': 'Error in resolving', 'detail': str(error)}, keep_alive)
+            return True
+        def produce():
+            try:
+                for event in generator:
+                    if cancel.is_set():
+                        break
+                    put(event)
+            except Exception as error:
+                put({'error': 'Error in resolving', 'detail': str(error)})
+            finally:
+                generator.close()
+                put(None)
+        connection.writeHead(200, keep_alive, {"Content-Type": "text/event-stream" if sse else "application/x-ndjson",
+                "Cache-Control": "no-cache", "Transfer-Encoding": "chunked"})
+        watcher = asyncio.ensure_future(connection.watchDisconnect(cancel))
+        producer = loop.run_in_executor(self.pool, produce)
+        try:
+            while True:
+                event = await events.get()
+                if event is None:
+                    break
+                if cancel.is_set():
+                    # keep draining so the producer is never stuck on a full queue
+                    continue
+                connection.writeChunk(server.streamLine(event, sse))
+                try:
+                    await connection.writer.drain()
+                except ConnectionError:
+                    cancel.set()
+            if not cancel.is_set():
+                connection.writeChunk(b"")
+                await connection.writer.drain()
+        finally:
+            await producer
+            self.in_flight -= 1
+            watcher.cancel()
+            await asyncio.gather(watcher, return_exceptions=True)
+        return True
+    async def dispatch(self, connection:Connection, method:str, path:str, headers:Dict[str,str], body:Union[bytes,None]) -> Tuple[int,Dict[str,Any]]:
+        if method == "OPTIONS":
+            return 200, {}
+        path, _, query = path.partition("?")
+        if method == "GET" and path == "/metrics":
+            return 200, server.metricsMessage({})
+        if method != "POST":
+            return 404, {"message": "not found"}
+        if path == "/upload":
+            session_id = headers.get("x-session-id", server.defaultSession)
+            read = asyncio.Event()
+            lines = connection.bodyLines(asyncio.get_running_loop(), read)
+            return await self.solve(connection, lambda query, cancel: server.uploadMessage(lines, server.uploadOptions(query), session_id, cancel),
+                    query, read=read)
+        try:
+            message = readJSON(headers, body)
+        except BadRequest as error:
+            return error.status, {"message": str(error)}
+        if path == "/":
+            return await self.solve(connection, server.resolveMessage, message)
+        if path == "/metrics":
+            return 200, server.metricsMessage(message)
+        if path == "/resolvent":
+            session_id = headers.get("x-session-id", server.defaultSession)
+            return await self.solve(connection, lambda message, cancel: server.resolventMessage(message, session_id), message)
+        return 200, {}
+    async def handle(self, reader:asyncio.StreamReader, writer:asyncio.StreamWriter):
+        connection = Connection(reader, writer)
+        try:
+            while not connection.closed:
+                try:
+                    request = await asyncio.wait_for(connection.readRequest(), keepAliveSeconds)
+                except asyncio.TimeoutError:
+                    break
+                except BadRequest as error:
+                    connection.respond(error.status, {"message": str(error)}, False)
+                    await writer.drain()
+                    break
+                if request is None:
+                    break
+                method, path, headers, body = request
+                keep_alive = headers.get("connection", "").lower() != "close"
+                if method == "POST" and path == "/stream":
+                    try:
+                        started = await self.stream(connection, readJSON(headers, body), server.wantsEvents(headers.get("accept")), keep_alive)
+                    except BadRequest as error:
+                        started = True
+                        connection.respond(error.status, {"message": str(error)}, keep_alive)
+                    if started:
+                        if connection.closed or not keep_alive:
+                            break
+                        await writer.drain()
+                        continue
+                    status, payload = 503, {"message": "server busy, try again later"}
+                else:
+                    status, payload = await self.dispatch(connection, method, path, headers, body)
+                if connection.closed:
+                    break
+                if connection.unread > 0:
+                    # an upload that was turned away or failed, the rest of its body is not a request
+                    keep_alive = False
+                extra = {}
+                if method == "OPTIONS":
+                    extra = {"Access-Control-Allow-Methods": "GET, OPTIONS, POST",
+                            "Access-Control-Allow-Headers": "X-Requested-With, Content-Type, X-Session-Id"}
+                if status == 503:
+                    extra["Retry-After"] = "1"
+                connection.respond(status, payload, keep_alive, extra, headers.get("accept"))
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+    async def serve(self, host:str, port:int):
+        listener = await asyncio.start_server(self.handle, host, port)
+        print("Server started http://%s:%s" % (host, port))
+        async with listener:
+            await listener.serve_forever()
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(AsyncServer().serve(hostName, serverPort))
+    except KeyboardInterrupt:
+        pass
+    print("Server stopped.")
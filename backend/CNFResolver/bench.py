@@ -0,0 +1,198 @@
+import argparse
+import gc
+import json
+import math
+import platform
+import sys
+import time
+import tracemalloc
+from typing import Any,Callable,Dict,List,Tuple
+
+import clauseTypes as CT
+import resolver
+
+# Benchmarks for the parser, the unifier, the resolution engines and Context stepping.
+# Problems come from generated families, the same family and size always give the same clauses:
+#   pigeonhole  n+1 pigeons in n holes, ground and unsat, hard for resolution
+#   horn        a chain P0(a), Pi(X) -> Pi+1(X) with side rules, goal not(Pn(a))
+#   skolem      literals with Skolem terms nested n deep, unifiable only all the way down
+#   wide        n ground facts and rules over distinct constants, one of them refuted
+# Every stage is timed on its own, the best of --repeat runs is reported with the throughput,
+# and one more run under tracemalloc gives the peak memory. The report is JSON, with a scaling
+# exponent per curve (the slope of log time over log size) to spot changes in complexity.
+
+FAMILIES = ("pigeonhole", "horn", "skolem", "wide")
+STAGES = ("parse", "unify", "resolve", "context")
+SIZES = {"pigeonhole": [2, 3], "horn": [10, 20, 40, 80], "skolem": [8, 16, 32, 64], "wide": [100, 200, 400, 800]}
+QUICK_SIZES = {"pigeonhole": [2], "horn": [10, 20], "skolem": [8, 16], "wide": [50, 100]}
+ENGINES = ("naive", "given_clause")
+
+def pigeonhole(n:int) -> List[str]:
+    holes = [f"h{k}" for k in range(n)]
+    clauses = ["or(" + ",".join(f"In(p{i},{hole})" for hole in holes) + ")" if n > 1 else f"In(p{i},h0)" for i in range(n+1)]
+    for hole in holes:
+        for i in range(n+1):
+            for j in range(i+1, n+1):
+                clauses.append(f"or(not(In(p{i},{hole})),not(In(p{j},{hole})))")
+    return clauses
+
+def hornChain(n:int) -> List[str]:
+    clauses = ["P0(a)"]
+    for i in range(n):
+        clauses.append(f"or(not(P{i}(X)),P{i+1}(X))")
+        clauses.append(f"or(not(P{i}(X)),R{i}(f(X)))")
+    clauses.append(f"not(P{n}(a))")
+    return clauses
+
+def nested(function:str, depth:int, inner:str) -> str:
+    return f"{function}(" * depth + inner + ")" * depth
+
+def deepSkolem(n:int) -> List[str]:
+    # each step peels one f off, only the fully nested instance reaches the goal
+    return [f"P({nested('f', n, 'a')})",
+            "or(not(P(f(X))),Q(X,g(X)))",
+            "or(not(Q(X,Y)),P(X))",
+            f"or(not(P(a)),not(Q({nested('f', 1, 'a')},g({nested('f', 1, 'a')}))))"]
+
+def wideGround(n:int) -> List[str]:
+    clauses = [f"P(c{i})" for i in range(n)]
+    clauses += [f"or(not(P(c{i})),Q(c{i},d{i % 7}))" for i in range(n)]
+    clauses.append(f"not(Q(c{n // 2},d{(n // 2) % 7}))")
+    return clauses
+
+GENERATORS:Dict[str,Callable[[int],List[str]]] = {"pigeonhole": pigeonhole, "horn": hornChain, "skolem": deepSkolem, "wide": wideGround}
+
+def unifyPairs(family:str, n:int) -> List[Tuple[CT.Predicate,CT.Predicate]]:
+    # literal pairs for the unifier, every pair unifies
+    if family == "skolem":
+        left = CT.parseClause(f"P({nested('f', n, 'X')},{nested('g', n, 'Y')},X)")[0]
+        right = CT.parseClause(f"P({nested('f', n, 'h(Z)')},W,h(b))")[0]
+        return [(left, right)]*50
+    clauses = CT.parseClauses(GENERATORS[family](n))
+    pairs = []
+    for clause in clauses:
+        for predicate in clause:
+            renamed = CT.Predicate(predicate.name, tuple(f"V{k}" for k in range(len(predicate.args))), predicate.is_negated)
+            pairs.append((renamed, predicate))
+    return pairs
+
+def timed(function:Callable[[], Any], repeat:int) -> Tuple[float,Any]:
+    best = math.inf
+    result = None
+    for _ in range(repeat):
+        gc.collect()
+        started = time.perf_counter()
+        result = function()
+        best = min(best, time.perf_counter() - started)
+        if isinstance(result, dict) and result.get("message") == "timeout":
+            # another run would only time out again
+            break
+    return best, result
+
+def peakMemory(function:Callable[[], Any]) -> float:
+    gc.collect()
+    tracemalloc.start()
+    try:
+        function()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak / (1024*1024)
+
+def measure(stage:str, family:str, size:int, function:Callable[[], Any], work:Callable[[Any], int], repeat:int, **extra) -> Dict[str,Any]:
+    seconds, result = timed(function, repeat)
+    items = work(result)
+    row:Dict[str,Any] = {"stage": stage, "family": family, "size": size, **extra,
+            "seconds": seconds, "items": items, "per_second": items / seconds if seconds > 0 else None,
+            "peak_mb": peakMemory(function)}
+    if isinstance(result, dict) and "message" in result:
+        row["status"] = result["message"]
+    return row
+
+def steppedContext(clauses:List[CT.Clause], max_steps:int) -> Dict[str,Any]:
+    context = resolver.Context()
+    context.registerClauses(clauses)
+    steps = 0
+    status = "still going on"
+    for _, _, sat in context.steps():
+        steps += 1
+        if sat is not None:
+            status = resolver.STATUS_MESSAGES[sat]
+        if steps >= max_steps:
+            break
+    return {"message": status, "steps": steps}
+
+def runFamily(family:str, sizes:List[int], stages:List[str], engines:List[str], repeat:int, timeout:float, max_steps:int) -> List[Dict[str,Any]]:
+    rows = []
+    limits = resolver.ResourceLimits(max_seconds=timeout)
+    for size in sizes:
+        text = GENERATORS[family](size)
+        clauses = CT.parseClauses(text)
+        if "parse" in stages:
+            rows.append(measure("parse", family, size, lambda: CT.parseClauses(text), len, repeat))
+        if "unify" in stages:
+            pairs = unifyPairs(family, size)
+            rows.append(measure("unify", family, size, lambda: [resolver.unify([pair]) for pair in pairs], len, repeat))
+        if "resolve" in stages:
+            for engine in engines:
+                rows.append(measure("resolve", family, size, lambda: resolver.resolve(clauses, engine, limits=limits),
+                        lambda result: result["stats"]["inferences"], repeat, engine=engine))
+        if "context" in stages:
+            rows.append(measure("context", family, size, lambda: steppedContext(clauses, max_steps), lambda result: result["steps"], repeat))
+    return rows
+
+def scaling(rows:List[Dict[str,Any]]) -> List[Dict[str,Any]]:
+    # least squares slope of log(seconds) over log(size) for every curve with at least two points
+    curves:Dict[Tuple,List[Tuple[float,float]]] = {}
+    for row in rows:
+        if row["seconds"] > 0:
+            key = (row["stage"], row["family"], row.get("engine"))
+            curves.setdefault(key, []).append((math.log(row["size"]), math.log(row["seconds"])))
+    found = []
+    for (stage, family, engine), points in curves.items():
+        if len(points) < 2:
+            continue
+        mean_x = sum(x for x, _ in points) / len(points)
+        mean_y = sum(y for _, y in points) / len(points)
+        spread = sum((x - mean_x)**2 for x, _ in points)
+        if spread == 0:
+            continue
+        slope = sum((x - mean_x)*(y - mean_y) for x, y in points) / spread
+        found.append({"stage": stage, "family": family, "engine": engine, "exponent": slope, "points": len(points)})
+    return found
+
+def main(argv:List[str]) -> int:
+    parser = argparse.ArgumentParser(description="benchmark the parser, unifier and resolution engines")
+    parser.add_argument("--families", nargs="+", choices=FAMILIES, default=list(FAMILIES))
+    parser.add_argument("--stages", nargs="+", choices=STAGES, default=list(STAGES))
+    parser.add_argument("--engines", nargs="+", choices=sorted(resolver.ENGINES), default=list(ENGINES))
+    parser.add_argument("--sizes", nargs="+", type=int, help="sizes for every family instead of the defaults")
+    parser.add_argument("--quick", action="store_true", help="small sizes, for a smoke run")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--timeout", type=float, default=10.0, help="seconds a single resolve may take")
+    parser.add_argument("--max-steps", type=int, default=5000, help="Context steps per run")
+    parser.add_argument("--output", help="write the report here instead of stdout")
+    args = parser.parse_args(argv)
+
+    rows = []
+    for family in args.families:
+        sizes = args.sizes if args.sizes else (QUICK_SIZES if args.quick else SIZES)[family]
+        rows.extend(runFamily(family, sizes, args.stages, args.engines, args.repeat, args.timeout, args.max_steps))
+        print(f"{family} done", file=sys.stderr)
+    report = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "repeat": args.repeat,
+        "results": rows,
+        "scaling": scaling(rows),
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as output:
+            output.write(text + "\n")
+    else:
+        print(text)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,259 @@
+from collections import OrderedDict
+from dataclasses import dataclass,replace
+import hashlib
+import pickle
+import sqlite3
+import threading
+import time
+from typing import Any,Dict,List,Sequence,Set,Tuple,Union
+import clauseTypes as CT
+from indexing import flattenArgs
+import resolver
+
+# Results of resolve for clause sets seen before.
+# A clause set is brought into a canonical form first: the literals of a clause are ordered by
+# everything but the names of their variables, the variables are renamed V0, V1, ... in the order
+# they appear, and the clauses are sorted by their text. Clause sets that only differ in the order
+# of clauses or literals or in variable names mostly end up with the same form (a tie between
+# literals of the same shape can keep two of them apart, never the other way round).
+# The fingerprint is a sha256 of the canonical clauses and the options that change the answer.
+# On a miss resolve runs on the clauses as they were submitted, so the answer is the one an
+# uncached run gives. The entry keeps that submission, how it maps onto the canonical clauses
+# and every derivation of the search. A hit from a submission that only has the same canonical
+# form gets that search with its own clause ids and variable names: a canonical clause has the
+# same variables in both, and a derived clause takes the names of the parent variables it got its
+# own from, renamed apart the way resolution does it. The clauses it derives come in the order of
+# the first search.
+# Only decided results are kept, a timeout says nothing about the next try.
+#
+# The cache is an LRU bounded by the number of entries and by their pickled size, with an
+# optional sqlite file under it so results outlive the process. Only ever point it at a file
+# this server writes, entries are unpickled.
+
+DECIDED = ("sat", "unsat")
+
+def literalShape(predicate:CT.Predicate) -> Tuple[str,bool,str]:
+    # the literal with all its variables alike
+    return (predicate.name, predicate.is_negated, repr(flattenArgs(predicate.args)))
+
+def canonicalClause(clause:Sequence[CT.Predicate]) -> Tuple[CT.Clause,List[str]]:
+    # the clause with its variables renamed V0, V1, ... and their names as submitted, Vk was names[k]
+    substitution = resolver.Substitution()
+    found:Dict[resolver.Slot,None] = {}
+    for predicate in sorted(clause, key=literalShape):
+        for arg in predicate.args:
+            substitution.unboundVariables(arg, 0, found)
+    # renamed all at once, a clause may already have a variable called V0
+    rename = {slot: f"V{k}" for k, slot in enumerate(found)}
+    return (CT.Clause(CT.Predicate(predicate.name, [substitution.apply(arg, 0, rename) for arg in predicate.args], predicate.is_negated)
+            for predicate in clause), [variable for variable, _ in found])
+
+def canonicalClauses(clauses:Sequence[Sequence[CT.Predicate]]) -> Tuple[List[CT.Clause],List[int],List[List[str]]]:
+    # the canonical clauses, for each of them the position it was submitted at and its variable names there
+    canonical = [canonicalClause(clause) for clause in clauses]
+    texts = [CT.clauseToString(clause) for clause, _ in canonical]
+    order = sorted(range(len(canonical)), key=texts.__getitem__)
+    return [canonical[i][0] for i in order], order, [canonical[i][1] for i in order]
+
+def fingerprint(clauses:Sequence[CT.Clause], *options:Any) -> str:
+    digest = hashlib.sha256()
+    for clause in clauses:
+        digest.update(CT.clauseToString(clause).encode("utf-8"))
+        digest.update(b"\n")
+    digest.update(repr(options).encode("utf-8"))
+    return digest.hexdigest()
+
+class ResultCache:
+    def __init__(self, max_entries:int = 1024, max_bytes:int = 64*1024*1024, path:Union[str,None] = None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        # key -> (value, pickled size)
+        self.entries:"OrderedDict[str,Tuple[Any,int]]" = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.disk = None
+        if path is not None:
+            self.disk = sqlite3.connect(path, check_same_thread=False)
+            self.disk.execute("CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, value BLOB, size INTEGER, used REAL)")
+            self.disk.execute("CREATE INDEX IF NOT EXISTS results_used ON results (used)")
+            self.disk.commit()
+    def remember(self, key:str, value:Any, size:int):
+        # in memory, dropping the least recently used entries when over a bound
+        old = self.entries.pop(key, None)
+        if old is not None:
+            self.size -= old[1]
+        self.entries[key] = (value, size)
+        self.size += size
+        while len(self.entries) > self.max_entries or (self.size > self.max_bytes and len(self.entries) > 1):
+            _, (_, dropped) = self.entries.popitem(last=False)
+            self.size -= dropped
+    def get(self, key:str) -> Any:
+        # None on a miss
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            if self.disk is not None:
+                row = self.disk.execute("SELECT value, size FROM results WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    self.disk.execute("UPDATE results SET used = ? WHERE key = ?", (time.time(), key))
+                    self.disk.commit()
+                    value = pickle.loads(row[0])
+                    self.remember(key, value, row[1])
+                    self.hits += 1
+                    return value
+            self.misses += 1
+            return None
+    def put(self, key:str, value:Any):
+        try:
+            data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        except (RecursionError, pickle.PicklingError):
+            # pickle recurses into terms, a very deep one is answered but not kept
+            return
+        with self.lock:
+            if len(data) > self.max_bytes:
+                return
+            self.remember(key, value, len(data))
+            if self.disk is not None:
+                self.disk.execute("INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)", (key, data, len(data), time.time()))
+                # the file has the same bounds as the memory
+                self.disk.execute("DELETE FROM results WHERE key IN (SELECT key FROM results ORDER BY used DESC LIMIT -1 OFFSET ?)", (self.max_entries,))
+                total = self.disk.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+                while total > self.max_bytes:
+                    oldest = self.disk.execute("SELECT key, size FROM results ORDER BY used LIMIT 1").fetchone()
+                    self.disk.execute("DELETE FROM results WHERE key = ?", (oldest[0],))
+                    total -= oldest[1]
+                self.disk.commit()
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+            if self.disk is not None:
+                self.disk.execute("DELETE FROM results")
+                self.disk.commit()
+    def stats(self) -> Dict[str,Any]:
+        return {"entries": len(self.entries), "bytes": self.size, "hits": self.hits, "misses": self.misses}
+
+@dataclass
+class CachedResult:
+    # a decided result, the submission it was found for and all the derivations of its search
+    result:Dict[str,Any]
+    texts:List[str]
+    order:List[int]
+    variables:List[List[str]]
+    proof:resolver.ProofDAG
+
+def renamedTerm(term:resolver.Term, names:Dict[str,str]) -> resolver.Term:
+    return resolver.Substitution().apply(term, 0, {(variable, 0): name for variable, name in names.items()})
+
+def renamedClause(clause:CT.Clause, names:Dict[str,str]) -> CT.Clause:
+    return CT.Clause(CT.Predicate(predicate.name, [renamedTerm(arg, names) for arg in predicate.args], predicate.is_negated)
+            for predicate in clause)
+
+def derivedNames(clause:CT.Clause, made:resolver.Inference, names:Dict[int,Dict[str,str]]) -> Dict[str,str]:
+    # new names for the variables of a derived clause from the new names of its parents' variables,
+    # those of the first parent are kept and those of the second one renamed apart, like renameApart does
+    origin = {variable: slot for slot, variable in (made.rename or {}).items()}
+    found:Dict[resolver.Slot,None] = {}
+    for predicate in clause:
+        for arg in predicate.args:
+            resolver.Substitution().unboundVariables(arg, 0, found)
+    mapping:Dict[str,str] = {}
+    second:List[Tuple[str,str]] = []
+    for variable, _ in found:
+        parent_variable, offset = origin.get(variable, (variable, 0))
+        name = names[made.parents[offset]].get(parent_variable, parent_variable)
+        if offset == 0:
+            mapping[variable] = name
+        else:
+            second.append((variable, name))
+    taken = set(mapping.values())
+    for variable, name in second:
+        renamed = name
+        suffix = 1
+        while renamed in taken:
+            renamed = f"{name}{suffix}"
+            suffix += 1
+        mapping[variable] = renamed
+        taken.add(renamed)
+    return mapping
+
+def renamedInference(made:resolver.Inference, names:Dict[int,Dict[str,str]], clause_names:Dict[str,str]) -> Tuple[resolver.Substitution,Dict[resolver.Slot,str]]:
+    # the unifier of an inference in the new names of its parents and of the clause it made
+    parent_names = [{(variable, 0): name for variable, name in names[parent].items()} for parent in made.parents]
+    def renamed(term:resolver.Term, offset:int) -> resolver.Term:
+        return resolver.Substitution().apply(term, 0, parent_names[offset]) if offset < len(parent_names) else term
+    bindings = {(renamed(variable, offset), offset): (renamed(term, term_offset), term_offset)
+            for (variable, offset), (term, term_offset) in made.substitution.bindings.items()}
+    rename = {(renamed(variable, offset), offset): clause_names.get(name, name) for (variable, offset), name in (made.rename or {}).items()}
+    return resolver.Substitution(bindings), rename
+
+def submitted(entry:CachedResult, clauses:List[CT.Clause], order:List[int], variables:List[List[str]]) -> Dict[str,Any]:
+    # a copy of a cached result for a submission with the same canonical form,
+    # with the ids of its clauses and the names of its variables
+    result = dict(entry.result)
+    if "stats" in result:
+        result["stats"] = dict(result["stats"])
+    if entry.texts == [CT.clauseToString(clause) for clause in clauses]:
+        return result
+    count = len(order)
+    position = {cached_at: order[i] for i, cached_at in enumerate(entry.order)}
+    def clauseId(clause_id:int) -> int:
+        return position[clause_id] if clause_id < count else clause_id
+    # clause id of the cached search -> its variable names there -> the names here
+    names:Dict[int,Dict[str,str]] = {cached_at: dict(zip(entry.variables[i], variables[i])) for i, cached_at in enumerate(entry.order)}
+    added:List[CT.Clause] = []
+    for clause_id, clause in enumerate(result["added"], count):
+        made = entry.proof.derivation(clause_id) if len(clause) > 0 else None
+        if made is None:
+            added.append(clause)
+            continue
+        names[clause_id] = derivedNames(clause, made, names)
+        added.append(renamedClause(clause, names[clause_id]))
+    result["added"] = added
+    if "proof" in result:
+        steps:List[resolver.Inference] = []
+        for step in result["proof"]:
+            if len(step.parents) == 0:
+                steps.append(replace(step, clause=clauses[position[step.clause_id]], clause_id=position[step.clause_id]))
+                continue
+            clause_names = names.get(step.clause_id, {}) if step.clause_id is not None else {}
+            substitution, rename = renamedInference(step, names, clause_names) if step.substitution is not None else (None, None)
+            steps.append(replace(step, clause=renamedClause(step.clause, clause_names), parents=tuple(clauseId(parent) for parent in step.parents),
+                    substitution=substitution, rename=rename))
+        # the registered clauses first, in their submitted order
+        registered = sorted((step for step in steps if len(step.parents) == 0), key=lambda step: step.clause_id)
+        result["proof"] = registered + [step for step in steps if len(step.parents) > 0]
+    return result
+
+def cachedResolve(cache:ResultCache, kb:Sequence[Sequence[CT.Predicate]], engine:str = "naive", workers:Union[int,None] = None,
+        limits:Union[resolver.ResourceLimits,None] = None, cancel:Union[threading.Event,None] = None,
+        strategy:Union[str,None] = None, support:Union[Set[int],None] = None) -> Dict[str,Any]:
+    # resolve through the cache, the strategy by name with the (0 based) positions of its support
+    clauses = [CT.Clause(clause) for clause in kb]
+    canonical, order, variables = canonicalClauses(clauses)
+    at = {submitted_at: i for i, submitted_at in enumerate(order)}
+    if support is not None:
+        # positions that are not a clause mark nothing, the same as without the cache
+        support = {i for i in support if i in at}
+    canonical_support = sorted(at[i] for i in support) if support is not None else None
+    key = fingerprint(canonical, engine, strategy, canonical_support)
+    entry = cache.get(key)
+    if entry is not None:
+        result = submitted(entry, clauses, order, variables)
+        result["cached"] = True
+        return result
+    proof = resolver.ProofDAG()
+    result = resolver.resolve(kb, engine, workers, limits=limits, cancel=cancel,
+            strategy=resolver.makeStrategy(strategy, support) if strategy is not None else None, proof=proof)
+    if result["message"] in DECIDED:
+        cache.put(key, CachedResult(result, [CT.clauseToString(clause) for clause in clauses], order, variables, proof))
+    # the caller may change what it gets, the cached one stays as it is
+    result = dict(result)
+    if "stats" in result:
+        result["stats"] = dict(result["stats"])
+    return result
@@ -1,48 +1,132 @@
 from __future__ import annotations
 from dataclasses import dataclass
 from types import FunctionType
-from typing import Union,List,Literal,Tuple,Any
+from typing import Union,List,Sequence,Tuple,Any,Iterable,Iterator,FrozenSet
+import sys
+import threading
+import weakref
+import metrics
 
-def nestedTupler(l:List[Any])->tuple:
-    return tuple(nestedTupler(i) if isinstance(i, list) else i for i in l)
-
-@dataclass(frozen=True)
+# Terms and literals are hash-consed: every distinct FOLFunction and Predicate
+# exists once, so equality is an identity check and the hash is computed when the
+# object is built. The tables only hold weak references, terms nothing uses anymore go away.
+# Lookups that find the term take no lock, a miss looks again under the lock of the table
+# before adding, so two threads building the same term get the same object.
 class FOLFunction:
+    __slots__ = ("name", "args", "_hash", "__weakref__")
+    _table: "weakref.WeakValueDictionary[Tuple[str,Tuple[Union[str,FOLFunction],...]],FOLFunction]" = weakref.WeakValueDictionary()
+    _lock = threading.Lock()
     name: str
-    args: List[Union[str, FOLFunction]]
+    args: Tuple[Union[str, FOLFunction],...]
+    def __new__(cls, name:str, args:Sequence[Union[str, FOLFunction]]):
+        key = (sys.intern(name), tuple(sys.intern(arg) if type(arg) == str else arg for arg in args))
+        existing = cls._table.get(key)
+        if existing is not None:
+            return existing
+        with cls._lock:
+            existing = cls._table.get(key)
+            if existing is not None:
+                return existing
+            func = object.__new__(cls)
+            object.__setattr__(func, "name", key[0])
+            object.__setattr__(func, "args", key[1])
+            object.__setattr__(func, "_hash", hash(key))
+            cls._table[key] = func
+            return func
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} is immutable")
     def __hash__(self):
-        tupled = nestedTupler
-        return hash((self.name, tupled))
-    def __eq__(self,other):
-        if type(self) != type(other):
-            return False
-        if self.name != other.name or len(self.args) != len(other.args):
-            return False
-        arg_lists_equal = True
-        for i in range(len(self.args)):
-            arg_lists_equal = arg_lists_equal and self.args[i] == other.args[i]
-        return arg_lists_equal
-@dataclass(frozen=True)
+        return self._hash
+    def __eq__(self, other):
+        return self is other
+    def __ne__(self, other):
+        return self is not other
+    def __reduce__(self):
+        # unpickling goes through __new__ so the copy is interned in the receiving process
+        return (FOLFunction, (self.name, self.args))
+    def __repr__(self):
+        return f"FOLFunction(name={self.name!r}, args={self.args!r})"
+
 class Predicate:
+    __slots__ = ("name", "args", "is_negated", "_hash", "__weakref__")
+    _table: "weakref.WeakValueDictionary[Tuple[str,Tuple[Union[str,FOLFunction],...],bool],Predicate]" = weakref.WeakValueDictionary()
+    _lock = threading.Lock()
     name: str
-    args: List[Union[str,FOLFunction]]
+    args: Tuple[Union[str,FOLFunction],...]
     is_negated : bool
+    def __new__(cls, name:str, args:Sequence[Union[str,FOLFunction]], is_negated:bool):
+        key = (sys.intern(name), tuple(sys.intern(arg) if type(arg) == str else arg for arg in args), bool(is_negated))
+        existing = cls._table.get(key)
+        if existing is not None:
+            return existing
+        with cls._lock:
+            existing = cls._table.get(key)
+            if existing is not None:
+                return existing
+            pred = object.__new__(cls)
+            object.__setattr__(pred, "name", key[0])
+            object.__setattr__(pred, "args", key[1])
+            object.__setattr__(pred, "is_negated", key[2])
+            object.__setattr__(pred, "_hash", hash(key))
+            cls._table[key] = pred
+            return pred
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} is immutable")
     def __hash__(self):
-        return hash((self.name, tuple(self.args), self.is_negated))
+        return self._hash
+    def __eq__(self, other):
+        return self is other
+    def __ne__(self, other):
+        return self is not other
+    def __reduce__(self):
+        return (Predicate, (self.name, self.args, self.is_negated))
+    def __repr__(self):
+        return f"Predicate(name={self.name!r}, args={self.args!r}, is_negated={self.is_negated!r})"
 
+class Clause:
+    # A disjunction of literals, kept as a tuple sorted in a canonical order
+    # so the same set of literals always gives the same clause.
+    __slots__ = ("literals", "_hash", "_variables")
+    literals: Tuple[Predicate,...]
+    def __init__(self, literals:Iterable[Predicate]):
+        unique = dict.fromkeys(literals)
+        object.__setattr__(self, "literals", tuple(sorted(unique, key=literalOrder)))
+        object.__setattr__(self, "_hash", hash(self.literals))
+        object.__setattr__(self, "_variables", None)
+    def __setattr__(self, name, value):
+        raise AttributeError("Clause is immutable")
+    @property
+    def variables(self) -> FrozenSet[str]:
+        if self._variables is None:
+            found = set()
+            stack:List[Union[str,FOLFunction]] = [arg for pred in self.literals for arg in pred.args]
+            while len(stack) > 0:
+                arg = stack.pop()
+                if type(arg) == FOLFunction:
+                    stack.extend(arg.args)
+                elif arg.isupper():
+                    found.add(arg)
+            object.__setattr__(self, "_variables", frozenset(found))
+        return self._variables
+    def __len__(self) -> int:
+        return len(self.literals)
+    def __iter__(self) -> Iterator[Predicate]:
+        return iter(self.literals)
+    def __getitem__(self, i):
+        return self.literals[i]
+    def __hash__(self):
+        return self._hash
     def __eq__(self, other):
-        if type(self) != type(other):
-            return False
-        if self.name !=other.name or self.is_negated != other.is_negated or len(self.args) != len(other.args):
-            return False
-        if self.args == other.args and self.is_negated == other.is_negated and self.name == other.name:
-            return True
-        arg_lists_equal = len(self.args) == len(other.args)
-        if not arg_lists_equal:
-            return False
-        for i in range(len(self.args)):
-            arg_lists_equal = arg_lists_equal and self.args[i] == other.args[i]
-        return arg_lists_equal
+        if type(other) != Clause:
+            return NotImplemented
+        return self._hash == other._hash and self.literals == other.literals
+    def __reduce__(self):
+        return (Clause, (self.literals,))
+    def __repr__(self):
+        return f"Clause({list(self.literals)!r})"
+
+def literalOrder(predicate:Predicate) -> Tuple[str,bool,str]:
+    return (predicate.name, predicate.is_negated, predicateToString(predicate))
 
 @dataclass(frozen=True)
 class HornClause:
@@ -59,255 +143,162 @@ class Clauses:
     horns: List[HornClause]
     sats: List[SatClause]
 
+DELIMITERS = "(),"
+OPERATORS = ("or", "not")
+
 def tokenizeClause(clause: str) -> List[str]:
-    tokens = ["or", "not", "(", ")", ","]
+    # names run until the next delimiter, so "or" and "not" come out as whole names
+    # and only act as operators when the parser sees them applied to something
     tokenized = []
     i = 0
     while i < len(clause):
-        if clause[i] in tokens:
+        if clause[i] in DELIMITERS:
             tokenized.append(clause[i])
             i += 1
         else:
             start = i
-            while i < len(clause) and clause[i] not in tokens:
+            while i < len(clause) and clause[i] not in DELIMITERS:
                 i += 1
             tokenized.append(clause[start:i])
     return tokenized
 
-@dataclass(frozen=True)
-class Name:
-    name: str
-
-@dataclass(frozen=True)
-class ArgList:
-    args: List[Union[Name,Tuple[Name,ArgList]]]
-
-@dataclass(frozen=True)
-class Operator:
-    op: Literal["or", "not"]
-
-@dataclass(frozen=True)
-class ClauseTree:
-    node: Union[Name,ArgList,Operator,None]
-    left: Union[ClauseTree,None]
-    right: Union[ClauseTree,None]
-
-def visit(tokens:List[str],first_time:bool=False) -> Tuple[ClauseTree,int]:
-    if tokens[0] == "or":
-        return visitOr(tokens[1:])
-    elif tokens[0] == "not":
-        return visitNot(tokens[1:])
-    elif tokens[0] == "(" and tokens[1] != "or" and tokens[1] != "not":
-        return visitArgList(tokens)
-    elif tokens[0] == ")":
-        tree,num = visit(tokens[1:])
-        return tree,num+1
-    else:
-        # if we start with a name than we need to make sure we parse the whole thing
-        if first_time:
-            name,_ = visitName(tokens)
-            node = name.node
-            assert(type(node) == Name)
-            args,consumed = visitArgList(tokens[1:])
-            return ClauseTree(Name(node.name), args, None), consumed + 1
-        return visitName(tokens)
-
-def visitNot(tokens:List[str]) -> Tuple[ClauseTree,int]:
-    not_ends = 0
-    matching_parentheses = 0
-    while True:
-        if tokens[not_ends] == "(":
-            matching_parentheses += 1
-        elif tokens[not_ends] == ")":
-            matching_parentheses -= 1
-        not_ends += 1
-        if matching_parentheses == 0:
-            break
-
-    inner_tokens = tokens[1:not_ends]
-    inner_tree,consumed = visit(inner_tokens) # Name arglist thing
-    node = inner_tree.node
-    if isinstance(node,Name):
-        print("Hoya")
-        inner_tree_arglist,consumed = visit(inner_tokens[1:])
-        inner_tree = ClauseTree(Name(node.name),inner_tree_arglist,None)
-    tree = ClauseTree(Operator("not"), inner_tree, None)
-    return tree,not_ends
-def visitArgListHelper(tokens:List[str]) -> Tuple[ArgList,int]:
-    matching_parentheses = 0
-    arg_list_ends = 0
-    args: List[Union[Name,Tuple[Name,ArgList]]] = []
-    while True:
-        if tokens[arg_list_ends] == "(":
-            matching_parentheses += 1
-        elif tokens[arg_list_ends] == ")":
-            matching_parentheses -= 1
-        arg_list_ends += 1
-        if matching_parentheses == 0:
-            break
-
-    inner_tokens = tokens[1:arg_list_ends]
-    # We always expect this input style ( )
-    # after we consume the first ( we expect names until we hit another (,
-    # from that point on we expect another arg list
-    # which means we need to keep track of the number of parentheses we have seen
-    # because this arglist has to end with a )
-    last_name_consumed = None
+# Single pass parser over the token list, with an explicit stack instead of recursion
+# so deeply nested or(...) chains and terms do not run into the recursion limit.
+# A frame is an operator ("or", "not") or a symbol applied to arguments, [name, args].
+# A symbol frame becomes a Predicate when it is closed at literal level and a FOLFunction
+# when it is closed inside another symbol frame. not flips the polarity of what it wraps.
+def parseLiterals(tokens:List[str]) -> List[Predicate]:
+    literals:List[Predicate] = []
+    stack:List[Union[str,List[Any]]] = []
+    negations = 0
+    # operands completed at each level, index 0 is the top level
+    operands = [0]
     i = 0
-    while i < len(inner_tokens):
-        if inner_tokens[i] == "(":
-            matching_parentheses += 1
-            if matching_parentheses > 1:
-                args.pop()
-                assert(last_name_consumed)
-                inner_arg_list, ending_position = visitArgListHelper(inner_tokens[i:])
-                args.append((Name(last_name_consumed), inner_arg_list))
-                i += ending_position
-        elif inner_tokens[i] == ",":
-            i += 1
-        elif inner_tokens[i] == ")":
-            i += 1
+    def fail(message:str):
+        raise ValueError(f"{message} at token {i} of {''.join(tokens)!r}")
+    while i < len(tokens):
+        token = tokens[i]
+        if token in DELIMITERS:
+            fail(f"unexpected {token!r}")
+        at_literal = len(stack) == 0 or type(stack[-1]) == str
+        if at_literal and operands[-1] > 0 and (len(stack) == 0 or stack[-1] == "not"):
+            fail("one literal expected")
+        applied = i+1 < len(tokens) and tokens[i+1] == "("
+        if at_literal and applied and token in OPERATORS:
+            if token == "or" and negations > 0:
+                fail("not can only wrap a literal")
+            negations += token == "not"
+            stack.append(token)
+            operands.append(0)
+            i += 2
+            continue
+        if applied:
+            stack.append([token, []])
+            operands.append(0)
+            i += 2
+            if i == len(tokens) or tokens[i] != ")":
+                continue
         else:
-            last_name_consumed = inner_tokens[i]
-            args.append(Name(last_name_consumed))
-            i += 1
-    return (ArgList(args),arg_list_ends)
-
-def visitArgList(tokens:List[str]) -> Tuple[ClauseTree,int]:
-    arglist,consumed_count = visitArgListHelper(tokens)
-    return ClauseTree(arglist, None, None),consumed_count
-
-def visitName(tokens:List[str]) -> Tuple[ClauseTree,int]:
-    return ClauseTree(Name(tokens[0]),None,None), 1
-
-def visitOr(tokens:List[str]) -> Tuple[ClauseTree,int]:
-    or_ends = 0
-    matching_parentheses = 0
-    while True:
-        if tokens[or_ends] == "(":
-            matching_parentheses += 1
-        elif tokens[or_ends] == ")":
-            matching_parentheses -= 1
-        or_ends += 1
-        if matching_parentheses == 0:
-            break
-
-    inner_tokens = tokens[0:or_ends]
-    # We should find the comma that seperates the ored predicates:
-    # or? not? Name ArgList , Name ArgList
-    # this is a top down parser so:
-    end = 0
-    children: List[Union[None,ClauseTree]] = [None,None]
-
-    while end < len(inner_tokens):
-        if inner_tokens[end] == "or":
-            child, consumed_by_child = visitOr(inner_tokens[end+1:])
-            end += consumed_by_child
-            if children[0] == None:
-                children[0] = child
+            # a constant or variable, or a predicate without arguments
+            if at_literal:
+                literals.append(Predicate(token, (), negations % 2 == 1))
             else:
-                children[1] = child
-                break
-        elif inner_tokens[end] == "not":
-            child, consumed_by_child = visitNot(inner_tokens[end+1:])
-            end += consumed_by_child
-            if children[0] == None:
-                children[0] = child
-            else:
-                children[1] = child
-                break
-        elif inner_tokens[end] == ",":
-            end+=1
-        elif inner_tokens[end] == "(":
-            end+=1
-        elif inner_tokens[end] == ")":
-            end+=1
-        else:
-            # Name ArgList
-            assert(inner_tokens[end] != "or" and inner_tokens[end] != "not")
-            print(inner_tokens)
-            name,_ = visitName([inner_tokens[end]])
-            arglist,consumed_by_child = visitArgList(inner_tokens[end+1:])
-            child = ClauseTree(name.node,arglist,None)
-            end+= consumed_by_child + 1
-            if children[0] == None:
-                children[0] = child
+                stack[-1][1].append(token)
+            operands[-1] += 1
+            i += 1
+        # after an operand: commas separate the next one, closing parentheses finish frames
+        while i < len(tokens) and tokens[i] == ")":
+            if len(stack) == 0:
+                fail("unbalanced ')'")
+            frame = stack.pop()
+            count = operands.pop()
+            if type(frame) == str:
+                if count == 0:
+                    fail(f"empty {frame}")
+                negations -= frame == "not"
+            elif len(stack) > 0 and type(stack[-1]) == list:
+                stack[-1][1].append(FOLFunction(frame[0], frame[1]))
             else:
-                children[1] = child
-                break
-    assert(children[0] != None and children[1] != None)
-    return ClauseTree(Operator("or"),children[0],children[1]), or_ends
-
-def nameArgListToFunc(name:Name, args: ArgList)-> FOLFunction:
-    name_of_func = name.name
-    arguments:List[Union[str,FOLFunction]] = []
-    for arg in args.args:
-        if type(arg) == Name:
-            arguments.append(arg.name)
-        else:
-            arguments.append(nameArgListToFunc(arg[0],arg[1]))
-    return FOLFunction(name_of_func,arguments)
-
-def nameArglistToPred(name:Name, args:ArgList,negation:bool)->Predicate:
-    name_of_pred = name.name
-    arguments:List[Union[str,FOLFunction]] = []
-    for arg in args.args:
-        if type(arg) == Name:
-            arguments.append(arg.name)
-        else:
-            arguments.append(nameArgListToFunc(arg[0],arg[1]))
-    return Predicate(name_of_pred,arguments,negation)
-
-def treeToPredList(tree:ClauseTree, current_parent:bool = False) -> List[Predicate]:
-    if type(tree.node) == Name:
-        arglist_child = tree.left
-        print(tree)
-        assert(type(arglist_child) == ClauseTree)
-        arglist = arglist_child.node
-        assert(type(arglist) == ArgList)
-        return [nameArglistToPred(tree.node, arglist,current_parent)]
-    if type(tree.node) == Operator:
-        node = tree.node
-        if node.op == "or":
-            left = tree.left
-            right = tree.right
-            assert(left != None and right != None)
-            return treeToPredList(left) + treeToPredList(right)
-        if node.op == "not":
-            left = tree.left
-            assert(left != None)
-            print(tree)
-            return treeToPredList(left,True)
-    assert(False)
-
-
-
-
+                literals.append(Predicate(frame[0], frame[1], negations % 2 == 1))
+            operands[-1] += 1
+            i += 1
+        if i < len(tokens):
+            if tokens[i] != "," or len(stack) == 0:
+                fail(f"unexpected {tokens[i]!r}")
+            i += 1
+            if i == len(tokens):
+                fail("missing argument")
+    if len(stack) > 0:
+        fail("missing ')'")
+    if operands[0] != 1:
+        fail("one clause expected")
+    return literals
 
+def parseClause(clause: str) -> Clause:
+    return Clause(parseWritten(clause))
 
-def parseClause(clause: str) -> List[Predicate]:
+def parseWritten(clause: str) -> List[Predicate]:
+    # the literals in the order they were written, a Clause sorts them
     clause = clause.replace(" ", "")
-    tokens = tokenizeClause(clause)
-    tree,_ = visit(tokens,True)
-    return treeToPredList(tree)
+    return parseLiterals(tokenizeClause(clause))
 
-def parseClauses(clauses:List[str]) -> List[List[Predicate]]:
-    return [parseClause(clause) for clause in clauses]
+def parseClauses(clauses:List[str], written:bool = False) -> List[Sequence[Predicate]]:
+    # written keeps the literals of every clause in the order they were written, for backward chaining
+    parse = parseWritten if written else parseClause
+    with metrics.timed("parse"):
+        return [parse(clause) for clause in clauses]
 
+# The printers append pieces to a list and join once, so nested terms and long clauses
+# are printed in linear time and without recursion.
+def writeTerm(term:Union[str,FOLFunction], out:List[str]):
+    stack:List[Union[str,FOLFunction]] = [term]
+    while len(stack) > 0:
+        current = stack.pop()
+        if type(current) != FOLFunction:
+            # a name, or the punctuation pushed below
+            out.append(current)
+            continue
+        out.append(current.name)
+        out.append("(")
+        stack.append(")")
+        for k in range(len(current.args)-1, -1, -1):
+            stack.append(current.args[k])
+            if k > 0:
+                stack.append(",")
+def writePredicate(predicate:Predicate, out:List[str]):
+    if predicate.is_negated:
+        out.append("not(")
+    out.append(predicate.name)
+    out.append("(")
+    for k, arg in enumerate(predicate.args):
+        if k > 0:
+            out.append(",")
+        writeTerm(arg, out)
+    out.append(")")
+    if predicate.is_negated:
+        out.append(")")
+def termToString(term:Union[str,FOLFunction]) -> str:
+    if type(term) != FOLFunction:
+        return term
+    out:List[str] = []
+    writeTerm(term, out)
+    return "".join(out)
 def functionToString(func:FOLFunction) -> str:
-    return f"{func.name}({','.join([functionToString(arg) if type(arg) == FOLFunction else arg for arg in func.args])})"
+    return termToString(func)
 def predicateToString(predicate:Predicate) -> str:
-    start = ""
-    end = ""
-    if predicate.is_negated:
-        start = "not("
-        end = ")"
-    return f"{start}{predicate.name}({','.join([functionToString(arg) if type(arg) == FOLFunction else arg for arg in predicate.args])}{end}"
-def clauseToString(clause:List[Predicate]) -> str:
-    if len(clause) == 0:
-        return ""
-    if len(clause) == 1:
-        return predicateToString(clause[0])
-    return f"or({','.join([predicateToString(clause[0]),clauseToString(clause[1:])])})"
-def clausesToString(clauses:List[List[Predicate]]) -> List[str]:
+    out:List[str] = []
+    writePredicate(predicate, out)
+    return "".join(out)
+def clauseToString(clause:Sequence[Predicate]) -> str:
+    # or is binary, the literals nest to the right: or(A,or(B,C))
+    out:List[str] = []
+    for k, predicate in enumerate(clause):
+        if k < len(clause)-1:
+            out.append("or(")
+        writePredicate(predicate, out)
+        if k < len(clause)-1:
+            out.append(",")
+    out.append(")"*max(len(clause)-1, 0))
+    return "".join(out)
+def clausesToString(clauses:Sequence[Sequence[Predicate]]) -> List[str]:
     return [clauseToString(clause) for clause in clauses]
@@ -0,0 +1,208 @@
+from typing import Dict,Iterable,Iterator,List,Sequence,Tuple,Union
+import clauseTypes as CT
+
+# (predicate name, is_negated, arity)
+LiteralKey = Tuple[str,bool,int]
+
+def literalKey(predicate:CT.Predicate) -> LiteralKey:
+    return (predicate.name, predicate.is_negated, len(predicate.args))
+
+def complementKey(predicate:CT.Predicate) -> LiteralKey:
+    return (predicate.name, not predicate.is_negated, len(predicate.args))
+
+class LiteralIndex:
+    # maps every literal key to the clauses containing it,
+    # and for each of those clauses the positions of the literals with that key
+    def __init__(self):
+        self.entries:Dict[LiteralKey,Dict[int,List[int]]] = {}
+    def addClause(self, clause_id:int, clause:CT.Clause):
+        for position, predicate in enumerate(clause):
+            self.entries.setdefault(literalKey(predicate), {}).setdefault(clause_id, []).append(position)
+    def removeClause(self, clause_id:int, clause:CT.Clause):
+        for predicate in clause:
+            key = literalKey(predicate)
+            clauses = self.entries.get(key)
+            if clauses is None:
+                continue
+            clauses.pop(clause_id, None)
+            if len(clauses) == 0:
+                del self.entries[key]
+    def complementary(self, predicate:CT.Predicate) -> Dict[int,List[int]]:
+        return self.entries.get(complementKey(predicate), {})
+    def complementaryIn(self, predicate:CT.Predicate, clause_id:int) -> List[int]:
+        return self.complementary(predicate).get(clause_id, [])
+    def partners(self, clause:CT.Clause) -> Iterator[Tuple[int,int,int]]:
+        # (literal position in clause, partner clause id, literal position in partner)
+        for position, predicate in enumerate(clause):
+            for clause_id, positions in self.complementary(predicate).items():
+                for partner_position in positions:
+                    yield position, clause_id, partner_position
+
+# Discrimination tree over the arguments of a literal.
+# A literal is flattened into the preorder list of its argument symbols,
+# variables become STAR, constants stay as their string and functions become (name, arity).
+# Retrieval walks the tree with the query literal and only returns literals that
+# could unify with it, STAR on either side skips a whole subterm on the other side.
+STAR = "*"
+Symbol = Union[str,Tuple[str,int]]
+
+def symbolArity(symbol:Symbol) -> int:
+    return symbol[1] if type(symbol) == tuple else 0
+
+def flattenArgs(args:Sequence[Union[str,CT.FOLFunction]]) -> List[Symbol]:
+    flat:List[Symbol] = []
+    stack = list(reversed(args))
+    while len(stack) > 0:
+        arg = stack.pop()
+        if type(arg) == CT.FOLFunction:
+            flat.append((arg.name, len(arg.args)))
+            stack.extend(reversed(arg.args))
+        elif arg.isupper():
+            flat.append(STAR)
+        else:
+            flat.append(arg)
+    return flat
+
+def termEnds(flat:List[Symbol]) -> List[int]:
+    # ends[i] is the position right after the subterm starting at i
+    ends = [0]*len(flat)
+    stack:List[Tuple[int,int]] = []
+    for i, symbol in enumerate(flat):
+        stack.append((i, symbolArity(symbol)))
+        while len(stack) > 0 and stack[-1][1] == 0:
+            start,_ = stack.pop()
+            ends[start] = i+1
+            if len(stack) > 0:
+                stack[-1] = (stack[-1][0], stack[-1][1]-1)
+    return ends
+
+class DiscriminationNode:
+    __slots__ = ("children", "entries")
+    def __init__(self):
+        self.children:Dict[Symbol,DiscriminationNode] = {}
+        self.entries:List[Tuple[int,int]] = []
+
+class DiscriminationTree:
+    def __init__(self):
+        self.root = DiscriminationNode()
+    def insert(self, flat:List[Symbol], entry:Tuple[int,int]):
+        node = self.root
+        for symbol in flat:
+            child = node.children.get(symbol)
+            if child is None:
+                child = DiscriminationNode()
+                node.children[symbol] = child
+            node = child
+        node.entries.append(entry)
+    def remove(self, flat:List[Symbol], entry:Tuple[int,int]):
+        node = self.root
+        for symbol in flat:
+            child = node.children.get(symbol)
+            if child is None:
+                return
+            node = child
+        if entry in node.entries:
+            node.entries.remove(entry)
+    def skipTerm(self, node:DiscriminationNode) -> Iterator[DiscriminationNode]:
+        # every node reached after consuming one whole stored term below node
+        stack = [(node, 1)]
+        while len(stack) > 0:
+            current, pending = stack.pop()
+            for symbol, child in current.children.items():
+                remaining = pending - 1 + symbolArity(symbol)
+                if remaining == 0:
+                    yield child
+                else:
+                    stack.append((child, remaining))
+    def unifiable(self, flat:List[Symbol]) -> Iterator[Tuple[int,int]]:
+        ends = termEnds(flat)
+        stack = [(self.root, 0)]
+        while len(stack) > 0:
+            node, i = stack.pop()
+            if i == len(flat):
+                yield from node.entries
+                continue
+            symbol = flat[i]
+            if symbol == STAR:
+                for after in self.skipTerm(node):
+                    stack.append((after, i+1))
+                continue
+            child = node.children.get(STAR)
+            if child is not None:
+                stack.append((child, ends[i]))
+            child = node.children.get(symbol)
+            if child is not None:
+                stack.append((child, i+1))
+
+class TermIndex(LiteralIndex):
+    # literal index that also keeps a discrimination tree per literal key,
+    # complementary only returns literals whose arguments could unify with the query
+    def __init__(self):
+        super().__init__()
+        self.trees:Dict[LiteralKey,DiscriminationTree] = {}
+    def addClause(self, clause_id:int, clause:CT.Clause):
+        super().addClause(clause_id, clause)
+        for position, predicate in enumerate(clause):
+            self.trees.setdefault(literalKey(predicate), DiscriminationTree()).insert(flattenArgs(predicate.args), (clause_id, position))
+    def removeClause(self, clause_id:int, clause:CT.Clause):
+        super().removeClause(clause_id, clause)
+        for position, predicate in enumerate(clause):
+            tree = self.trees.get(literalKey(predicate))
+            if tree is not None:
+                tree.remove(flattenArgs(predicate.args), (clause_id, position))
+    def complementary(self, predicate:CT.Predicate) -> Dict[int,List[int]]:
+        tree = self.trees.get(complementKey(predicate))
+        if tree is None:
+            return {}
+        found:Dict[int,List[int]] = {}
+        for clause_id, position in tree.unifiable(flattenArgs(predicate.args)):
+            found.setdefault(clause_id, []).append(position)
+        return found
+    def complementaryIn(self, predicate:CT.Predicate, clause_id:int) -> List[int]:
+        # a single clause has few literals, the plain key lookup is cheaper than a tree walk
+        return super().complementary(predicate).get(clause_id, [])
+
+# Ground facts of one predicate (name and arity), every fact is the tuple of its arguments.
+# A lookup says which argument positions it knows, the rows are found through a hash index
+# on exactly those positions: the first argument is always indexed, an index on any other
+# set of positions is built the first time a lookup needs it and kept up to date from then on.
+Row = Tuple[Union[str,CT.FOLFunction],...]
+Positions = Tuple[int,...]
+
+class FactTable:
+    def __init__(self, arity:int):
+        self.arity = arity
+        # a dict keeps the rows in the order they were added
+        self.rows:Dict[Row,None] = {}
+        self.indexes:Dict[Positions,Dict[Row,List[Row]]] = {(0,): {}} if arity > 0 else {}
+    def __len__(self) -> int:
+        return len(self.rows)
+    def __contains__(self, row:Row) -> bool:
+        return row in self.rows
+    def __iter__(self) -> Iterator[Row]:
+        return iter(self.rows)
+    def add(self, row:Row) -> bool:
+        # false when the fact was already there
+        if row in self.rows:
+            return False
+        self.rows[row] = None
+        for positions, index in self.indexes.items():
+            index.setdefault(tuple(row[k] for k in positions), []).append(row)
+        return True
+    def index(self, positions:Positions) -> Dict[Row,List[Row]]:
+        index = self.indexes.get(positions)
+        if index is None:
+            index = {}
+            for row in self.rows:
+                index.setdefault(tuple(row[k] for k in positions), []).append(row)
+            self.indexes[positions] = index
+        return index
+    def lookup(self, known:Dict[int,Union[str,CT.FOLFunction]]) -> Iterable[Row]:
+        # the rows with the known arguments at their positions
+        if len(known) == 0:
+            return self.rows
+        if len(known) == self.arity:
+            row = tuple(known[k] for k in range(self.arity))
+            return (row,) if row in self.rows else ()
+        positions = tuple(sorted(known))
+        return self.index(positions).get(tuple(known[k] for k in positions), ())
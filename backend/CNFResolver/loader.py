@@ -0,0 +1,185 @@
+import os
+import re
+from typing import Iterable,Iterator,List,Set,Tuple,Union
+import clauseTypes as CT
+
+# Streaming clause loaders for large clause sets.
+# Every reader takes an iterable of text lines (an open file, an upload body, ...)
+# and yields (clause, role) pairs one statement at a time, so neither the raw text
+# nor a list of intermediate strings has to be kept around.
+#
+#   native  one clause per line in the syntax of parseClause, lines starting with # are comments
+#   tptp    cnf(name, role, formula). statements, % comments, the role is passed on
+#   dimacs  p cnf header and 0 terminated integer literals, literal k is the predicate Pk()
+#
+# Clauses from native and dimacs input have the role "axiom".
+
+FORMATS = ("native", "tptp", "dimacs")
+SUFFIXES = {".cnf": "dimacs", ".dimacs": "dimacs", ".p": "tptp", ".tptp": "tptp", ".ax": "tptp"}
+# the TPTP roles that belong in the set of support
+GOAL_ROLES = ("negated_conjecture", "conjecture")
+
+def guessFormat(path:str) -> str:
+    return SUFFIXES.get(os.path.splitext(path)[1].lower(), "native")
+
+def readNative(lines:Iterable[str]) -> Iterator[Tuple[CT.Clause,str]]:
+    for number, line in enumerate(lines, 1):
+        line = line.strip()
+        if len(line) == 0 or line.startswith("#"):
+            continue
+        try:
+            yield CT.parseClause(line), "axiom"
+        except ValueError as error:
+            raise ValueError(f"line {number}: {error}")
+
+def readDimacs(lines:Iterable[str]) -> Iterator[Tuple[CT.Clause,str]]:
+    # clauses may span lines or share one, only the 0 ends a clause
+    literals:List[CT.Predicate] = []
+    for number, line in enumerate(lines, 1):
+        line = line.strip()
+        if len(line) == 0 or line[0] in "cp":
+            continue
+        if line[0] == "%":
+            # SATLIB files end with a % line
+            break
+        for field in line.split():
+            try:
+                literal = int(field)
+            except ValueError:
+                raise ValueError(f"line {number}: {field!r} is not a literal")
+            if literal == 0:
+                yield CT.Clause(literals), "axiom"
+                literals = []
+            else:
+                literals.append(CT.Predicate(f"P{abs(literal)}", (), literal < 0))
+    if len(literals) > 0:
+        yield CT.Clause(literals), "axiom"
+
+# a comment, a token, or anything else which is an error
+TPTP_TOKEN = re.compile(r"(%.*)|(!=|[(),|~=.]|'(?:[^'\\]|\\.)*'|\"(?:[^\"\\]|\\.)*\"|[$A-Za-z0-9_]+)|(\S)")
+
+def tptpStatements(lines:Iterable[str]) -> Iterator[Tuple[int,List[str]]]:
+    # tokens of one statement at a time, statements end with a . outside parentheses
+    tokens:List[str] = []
+    depth = 0
+    start = 1
+    for number, line in enumerate(lines, 1):
+        for comment, token, bad in TPTP_TOKEN.findall(line):
+            if comment:
+                break
+            if bad:
+                raise ValueError(f"line {number}: unexpected {bad!r}")
+            if len(tokens) == 0:
+                start = number
+            if token == "(":
+                depth += 1
+            elif token == ")":
+                depth -= 1
+            elif token == "." and depth == 0:
+                yield start, tokens
+                tokens = []
+                continue
+            tokens.append(token)
+    if len(tokens) > 0:
+        raise ValueError(f"line {start}: statement is missing its final .")
+
+def splitTopLevel(tokens:List[str], separator:str) -> List[List[str]]:
+    parts:List[List[str]] = [[]]
+    depth = 0
+    for token in tokens:
+        if token == "(":
+            depth += 1
+        elif token == ")":
+            depth -= 1
+        if token == separator and depth == 0:
+            parts.append([])
+        else:
+            parts[-1].append(token)
+    return parts
+
+def wrapped(tokens:List[str]) -> bool:
+    # true if the first parenthesis closes at the very end
+    if len(tokens) < 2 or tokens[0] != "(" or tokens[-1] != ")":
+        return False
+    depth = 0
+    for token in tokens[:-1]:
+        depth += (token == "(") - (token == ")")
+        if depth == 0:
+            return False
+    return True
+
+def tptpName(token:str) -> str:
+    # parseClause treats all upper case names as variables, TPTP variables only start with one,
+    # so their lower case letters become _ and the letter in upper case and _ becomes __,
+    # which keeps Xa, XA and X_A apart
+    if token[0].isupper():
+        return "".join("__" if char == "_" else "_" + char.upper() if char.islower() else char for char in token)
+    if token.isupper():
+        # a quoted name in capitals, a constant and not a variable
+        return "q" + token
+    return token
+
+def tptpLiteral(tokens:List[str]) -> Union[CT.Predicate,None]:
+    # None for $false, the empty disjunct
+    negated = False
+    while len(tokens) > 0 and tokens[0] == "~":
+        negated = not negated
+        tokens = tokens[1:]
+    while wrapped(tokens):
+        tokens = tokens[1:-1]
+    if tokens == ["$false"]:
+        return None
+    for operator in ("=", "!="):
+        sides = splitTopLevel(tokens, operator) if operator in tokens else []
+        if len(sides) == 2:
+            # equality is an ordinary predicate here, without paramodulation
+            tokens = ["=", "("] + sides[0] + [","] + sides[1] + [")"]
+            negated = negated != (operator == "!=")
+            break
+    native = [token if token in CT.DELIMITERS else tptpName(token) for token in tokens]
+    [predicate] = CT.parseLiterals(native)
+    return CT.Predicate(predicate.name, predicate.args, negated)
+
+def readTPTP(lines:Iterable[str]) -> Iterator[Tuple[CT.Clause,str]]:
+    for number, tokens in tptpStatements(lines):
+        try:
+            if len(tokens) < 3 or tokens[1] != "(" or tokens[-1] != ")":
+                raise ValueError("expected name(...)")
+            if tokens[0] == "include":
+                raise ValueError("include is not supported, load the axiom files separately")
+            if tokens[0] != "cnf":
+                raise ValueError(f"only cnf statements are supported, not {tokens[0]}")
+            fields = splitTopLevel(tokens[2:-1], ",")
+            if len(fields) < 3:
+                raise ValueError("expected cnf(name, role, formula)")
+            role = "".join(fields[1])
+            formula = fields[2]
+            while wrapped(formula):
+                formula = formula[1:-1]
+            literals = [tptpLiteral(literal) for literal in splitTopLevel(formula, "|")]
+            yield CT.Clause(literal for literal in literals if literal is not None), role
+        except ValueError as error:
+            raise ValueError(f"line {number}: {error}")
+
+READERS = {"native": readNative, "tptp": readTPTP, "dimacs": readDimacs}
+
+def readClauses(lines:Iterable[str], format:str = "native") -> Iterator[Tuple[CT.Clause,str]]:
+    if format not in READERS:
+        raise ValueError(f"unknown clause format {format}, expected one of {list(FORMATS)}")
+    return READERS[format](lines)
+
+def loadClauses(path:str, format:Union[str,None] = None) -> Iterator[Tuple[CT.Clause,str]]:
+    # the file is read line by line while the clauses are consumed
+    format = format if format is not None else guessFormat(path)
+    with open(path, encoding="utf-8") as lines:
+        yield from readClauses(lines, format)
+
+def collectClauses(loaded:Iterable[Tuple[CT.Clause,str]]) -> Tuple[List[CT.Clause],Set[int]]:
+    # the clauses and the positions of the goal clauses, ready for a set of support strategy
+    clauses:List[CT.Clause] = []
+    goals:Set[int] = set()
+    for clause, role in loaded:
+        if role in GOAL_ROLES:
+            goals.add(len(clauses))
+        clauses.append(clause)
+    return clauses, goals
@@ -0,0 +1,114 @@
+from contextlib import contextmanager, nullcontext
+import threading
+import time
+from typing import Any,Dict,Iterator,List
+
+# Counters and phase timings of the resolver and the server.
+# Nothing is recorded while enabled is false, instrumented code looks at it first
+#     if metrics.enabled:
+#         metrics.count("pairs_tried")
+# so switched off the cost is that one check.
+# There are two places to record to: the process totals, on while recordTotals is set (enable()),
+# and the metrics of a single request, on inside recording() in the thread answering it.
+# enabled is true while either of them is on.
+# Counters:
+#   pairs_tried            literal pairs the engines tried to resolve upon
+#   unify_attempts         literal unifications, from resolution and from backchaining
+#   unify_failures         the ones that did not unify
+#   resolvents_generated   resolvents built
+#   factors_generated      factors built, two literals of a clause merged
+#   resolvents_kept        resolvents and factors kept, the others were subsumed
+#   forward_subsumed       new clauses subsumed by one we had
+#   backward_subsumed      clauses we had subsumed by a new one
+# Timings are the seconds and calls of a phase: parse, unify, substitute and serialize.
+# The parallel engine resolves in other processes, their pairs and unifications are not counted.
+
+class Metrics:
+    def __init__(self):
+        self.counters:Dict[str,int] = {}
+        # name -> [seconds, calls]
+        self.timings:Dict[str,List[float]] = {}
+        self.lock = threading.Lock()
+    def count(self, name:str, n:int = 1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+    def addTime(self, name:str, seconds:float):
+        with self.lock:
+            timing = self.timings.setdefault(name, [0.0, 0])
+            timing[0] += seconds
+            timing[1] += 1
+    def snapshot(self) -> Dict[str,Any]:
+        with self.lock:
+            return {"counters": dict(self.counters),
+                    "timings": {name: {"seconds": seconds, "calls": calls} for name, (seconds, calls) in self.timings.items()}}
+    def reset(self):
+        with self.lock:
+            self.counters.clear()
+            self.timings.clear()
+
+totals = Metrics()
+recordTotals = False
+enabled = False
+# requests in recording() right now
+recordingRequests = 0
+switchLock = threading.Lock()
+local = threading.local()
+
+def update():
+    global enabled
+    enabled = recordTotals or recordingRequests > 0
+
+def enable(on:bool = True):
+    global recordTotals
+    with switchLock:
+        recordTotals = on
+        update()
+
+def count(name:str, n:int = 1):
+    if recordTotals:
+        totals.count(name, n)
+    current = getattr(local, "metrics", None)
+    if current is not None:
+        current.count(name, n)
+
+def addTime(name:str, seconds:float):
+    if recordTotals:
+        totals.addTime(name, seconds)
+    current = getattr(local, "metrics", None)
+    if current is not None:
+        current.addTime(name, seconds)
+
+class Timer:
+    def __init__(self, name:str):
+        self.name = name
+        self.started = 0.0
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+    def __exit__(self, *exc):
+        addTime(self.name, time.perf_counter() - self.started)
+        return False
+
+NOT_TIMED = nullcontext()
+
+def timed(name:str):
+    # for phases that run once per request or so, hot loops check enabled and time themselves
+    return Timer(name) if enabled else NOT_TIMED
+
+@contextmanager
+def recording() -> Iterator[Metrics]:
+    # what this thread does until the block ends, on top of the totals
+    global recordingRequests
+    recorded = Metrics()
+    previous = getattr(local, "metrics", None)
+    local.metrics = recorded
+    with switchLock:
+        recordingRequests += 1
+        update()
+    try:
+        yield recorded
+    finally:
+        with switchLock:
+            recordingRequests -= 1
+            update()
+        local.metrics = previous
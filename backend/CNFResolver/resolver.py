@@ -1,13 +1,25 @@
 from enum import Enum
-from dataclasses import dataclass
+from dataclasses import dataclass, field, replace
 import clauseTypes as CT
+from indexing import FactTable, LiteralIndex, TermIndex, flattenArgs
+import metrics
+from subsumption import SubsumptionIndex
 import z3
-from typing import Dict,List,Set,Tuple,Union
+from typing import Any,Dict,Generator,Iterator,List,Sequence,Set,Tuple,Union
+from array import array
+import heapq
+import multiprocessing
+from multiprocessing.connection import Connection
+import os
+import threading
+import time
+try:
+    import resource
+except ImportError:
+    resource = None
 import re
 from operator import itemgetter
 
-U = z3.DeclareSort("U")
-
 def convertToPrologPred(predicate:CT.Predicate) -> str:
     return predicate.name + "(" + ",".join(predicate.args) + ")"
 
@@ -21,40 +33,103 @@ def convertToPrologHorn(clause:CT.HornClause) -> str:
     prolog_line += "."
     return prolog_line
 
-def convertToZ3Horn(clause:CT.HornClause, fp: z3.Fixedpoint):
-    # We will actually solve the horn clauses using the fixedpoint engine of z3
-    # So we need to convert the horn clauses to datalog rules
-    head = False
-    if type(clause.head) == CT.Predicate:
-        assert(not clause.head.is_negated)
-        # Turn into a z3 function
-        sig = [U]*len(clause.head.args)+[z3.BoolSort()]
-        head = z3.Function(clause.head.name, *sig)(*[z3.Const(arg, U) for arg in clause.head.args])
-
-    fp.rule(head, [z3.Function(pred.name,
-        *[U]*len(pred.args)+[z3.BoolSort()]
-        )(*[z3.Const(arg, U) for arg in pred.args])
-        for pred in clause.predicates])
-
-
-def convertToZ3Sat(clause:CT.SatClause, solver: z3.Solver):
-    z3_preds = []
-    z3_pred_free_vars = {}
-    z3_pred_literals = {}
-    for pred in clause.predicates:
-        # Go throught the arguments of the predicate and create a free variable if uppercase,
-        # otherwise create a constant
-        # Also create a z3 function for the predicate
-        for arg in pred.args:
-            if arg.isupper():
-                if arg not in z3_pred_free_vars:
-                    z3_pred_free_vars[arg] = z3.Const(arg, U)
+def isHorn(clauses:Sequence[Sequence[CT.Predicate]]) -> bool:
+    # at most one positive literal in every clause
+    return all(sum(not predicate.is_negated for predicate in clause) <= 1 for clause in clauses)
+
+class HornTranslation:
+    # Horn clauses as the rules of a z3 Fixedpoint.
+    # Every translation has a z3 context of its own, so searches in different threads share
+    # no state and one of them can be interrupted on its own.
+    # Datalog clauses range over a finite domain holding the constants and go to the bottom up
+    # datalog engine, with function symbols the terms are a datatype with one constructor
+    # per symbol and the rules go to spacer.
+    # A clause without a positive literal is a rule for the nullary goal relation,
+    # the clauses are unsat exactly when goal is derivable.
+    def __init__(self, clauses:Sequence[Sequence[CT.Predicate]]):
+        self.ctx = z3.Context()
+        self.fp = z3.Fixedpoint(ctx=self.ctx)
+        self.relations:Dict[Tuple[str,int],z3.FuncDeclRef] = {}
+        self.variables:Dict[str,z3.ExprRef] = {}
+        self.constants:Dict[str,z3.ExprRef] = {}
+        self.functions:Dict[Tuple[str,int],z3.FuncDeclRef] = {}
+        # terms are shared, each one is translated once
+        self.terms:Dict[CT.FOLFunction,z3.ExprRef] = {}
+        self.goals = 0
+        constants:Set[str] = set()
+        functions:Set[Tuple[str,int]] = set()
+        for clause in clauses:
+            for predicate in clause:
+                stack = list(predicate.args)
+                while len(stack) > 0:
+                    term = stack.pop()
+                    if type(term) == CT.FOLFunction:
+                        functions.add((term.name, len(term.args)))
+                        stack.extend(term.args)
+                    elif not isVariable(term):
+                        constants.add(term)
+        # the domain is never empty, the name cannot come out of the parser
+        names = sorted(constants) if len(constants) > 0 else ["(none)"]
+        self.datalog = len(functions) == 0
+        if self.datalog:
+            self.fp.set(engine="datalog")
+            self.sort = z3.FiniteDomainSort("U", len(names), ctx=self.ctx)
+            self.constants = {name: z3.FiniteDomainVal(k, self.sort) for k, name in enumerate(names)}
+        else:
+            self.fp.set(engine="spacer")
+            datatype = z3.Datatype("U", ctx=self.ctx)
+            for name in names:
+                datatype.declare(name)
+            symbols = sorted(functions)
+            for name, arity in symbols:
+                datatype.declare(f"{name}/{arity}", *[(f"{name}/{arity}.{k}", datatype) for k in range(arity)])
+            self.sort = datatype.create()
+            self.constants = {name: self.sort.constructor(k)() for k, name in enumerate(names)}
+            self.functions = {symbol: self.sort.constructor(len(names)+k) for k, symbol in enumerate(symbols)}
+        self.goal = z3.Function("(goal)", z3.BoolSort(self.ctx))
+        self.fp.register_relation(self.goal)
+        for clause in clauses:
+            self.addClause(clause)
+    def term(self, term:Union[str,CT.FOLFunction]) -> z3.ExprRef:
+        # built bottom up with a stack, Skolem terms can be nested deeper than the recursion limit
+        if type(term) != CT.FOLFunction:
+            return self.leaf(term)
+        stack:List[Tuple[CT.FOLFunction,bool]] = [(term, False)]
+        while len(stack) > 0:
+            current, expanded = stack.pop()
+            if current in self.terms:
+                continue
+            if not expanded:
+                stack.append((current, True))
+                stack.extend((arg, False) for arg in current.args if type(arg) == CT.FOLFunction)
             else:
-                if arg not in z3_pred_literals:
-                    z3_pred_literals[arg] = z3.Const(arg, U)
-        sig = [U]*len(pred.args)+[z3.BoolSort()]
-        z3_preds.append(z3.Function(pred.name, *sig)(*[z3_pred_free_vars[arg] if arg.isupper() else z3_pred_literals[arg] for arg in pred.args]))
-    solver.add(z3.Function(clause.head, z3.BoolSort()) == z3.Or(z3_preds))
+                args = [self.terms[arg] if type(arg) == CT.FOLFunction else self.leaf(arg) for arg in current.args]
+                self.terms[current] = self.functions[(current.name, len(current.args))](*args)
+        return self.terms[term]
+    def leaf(self, term:str) -> z3.ExprRef:
+        if isVariable(term):
+            if term not in self.variables:
+                self.variables[term] = z3.Const(term, self.sort)
+                self.fp.declare_var(self.variables[term])
+            return self.variables[term]
+        return self.constants[term]
+    def atom(self, predicate:CT.Predicate) -> z3.BoolRef:
+        key = (predicate.name, len(predicate.args))
+        if key not in self.relations:
+            self.relations[key] = z3.Function(f"{predicate.name}/{len(predicate.args)}", *[self.sort]*len(predicate.args), z3.BoolSort(self.ctx))
+            self.fp.register_relation(self.relations[key])
+        return self.relations[key](*[self.term(arg) for arg in predicate.args])
+    def addClause(self, clause:Sequence[CT.Predicate]):
+        heads = [predicate for predicate in clause if not predicate.is_negated]
+        body = [self.atom(predicate) for predicate in clause if predicate.is_negated]
+        if len(heads) == 0:
+            self.goals += 1
+            self.fp.rule(self.goal(), body)
+        else:
+            self.fp.rule(self.atom(heads[0]), body)
+    def query(self) -> z3.CheckSatResult:
+        # sat when goal is derivable
+        return self.fp.query(self.goal())
 
 # If horn solver says we can satisfy the horn clauses,
 # we need to ask if the heads of the sat clauses are satisfiable
@@ -73,6 +148,101 @@ class TruthRepresentation(Enum):
 class Satisfaction(Enum):
     SAT = 1
     UNSAT = 2
+    # the search was cut short before reaching an answer
+    TIMEOUT = 3
+    RESOURCE_OUT = 4
+    # whoever asked is not waiting for the answer anymore
+    CANCELLED = 5
+    # the search ran out of clauses without an answer, the strategy is not complete for these clauses
+    UNKNOWN = 6
+
+STATUS_MESSAGES = {
+    Satisfaction.SAT: "sat",
+    Satisfaction.UNSAT: "unsat",
+    Satisfaction.TIMEOUT: "timeout",
+    Satisfaction.RESOURCE_OUT: "resource_out",
+    Satisfaction.CANCELLED: "cancelled",
+    Satisfaction.UNKNOWN: "unknown",
+}
+
+@dataclass(frozen=True)
+class ResourceLimits:
+    # None means no limit
+    max_seconds: Union[float,None] = None
+    max_inferences: Union[int,None] = None
+    max_clauses: Union[int,None] = None
+    max_memory_mb: Union[float,None] = None
+    def capped(self, other:"ResourceLimits") -> "ResourceLimits":
+        # the tighter of the two limits for every resource
+        def tighter(mine, theirs):
+            if mine is None:
+                return theirs
+            if theirs is None:
+                return mine
+            return min(mine, theirs)
+        return ResourceLimits(tighter(self.max_seconds, other.max_seconds),
+                tighter(self.max_inferences, other.max_inferences),
+                tighter(self.max_clauses, other.max_clauses),
+                tighter(self.max_memory_mb, other.max_memory_mb))
+
+def currentMemoryMB() -> float:
+    # resident set size, /proc is only there on linux, elsewhere we fall back to the peak size
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError, AttributeError):
+        if resource is None:
+            return 0.0
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+class Budget:
+    # keeps track of what a single search has used against its limits,
+    # memory is only looked at every MEMORY_CHECK_EVERY inferences since reading it is not free
+    MEMORY_CHECK_EVERY = 256
+    def __init__(self, limits:Union[ResourceLimits,None] = None, cancel:Union[threading.Event,None] = None):
+        self.limits = limits if limits is not None else ResourceLimits()
+        self.cancel = cancel
+        self.started = time.perf_counter()
+        self.inferences = 0
+        self.clauses = 0
+        self.memory_at_start = currentMemoryMB() if self.limits.max_memory_mb is not None else 0.0
+        self.memory_used = 0.0
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+    def deadline(self) -> Union[float,None]:
+        # wall clock time the search has to stop at, for other processes
+        if self.limits.max_seconds is None:
+            return None
+        return time.time() + self.limits.max_seconds - self.elapsed()
+    def spend(self, clause_count:int, inferences:int = 1) -> Union[Satisfaction,None]:
+        self.inferences += inferences
+        self.clauses = clause_count
+        limits = self.limits
+        if self.cancel is not None and self.cancel.is_set():
+            return Satisfaction.CANCELLED
+        if limits.max_seconds is not None and self.elapsed() > limits.max_seconds:
+            return Satisfaction.TIMEOUT
+        if limits.max_inferences is not None and self.inferences > limits.max_inferences:
+            return Satisfaction.RESOURCE_OUT
+        if limits.max_clauses is not None and clause_count > limits.max_clauses:
+            return Satisfaction.RESOURCE_OUT
+        if limits.max_memory_mb is not None and self.inferences % self.MEMORY_CHECK_EVERY < inferences:
+            self.memory_used = currentMemoryMB() - self.memory_at_start
+            if self.memory_used > limits.max_memory_mb:
+                return Satisfaction.RESOURCE_OUT
+        return None
+    def interrupted(self) -> Union[Satisfaction,None]:
+        # the checks that do not depend on the work done, for loops that do not make inferences
+        if self.cancel is not None and self.cancel.is_set():
+            return Satisfaction.CANCELLED
+        if self.limits.max_seconds is not None and self.elapsed() > self.limits.max_seconds:
+            return Satisfaction.TIMEOUT
+        return None
+    def stats(self) -> Dict[str,Any]:
+        stats = {"elapsed": self.elapsed(), "inferences": self.inferences, "clauses": self.clauses}
+        if self.limits.max_memory_mb is not None:
+            stats["memory_mb"] = self.memory_used
+        return stats
 
 @dataclass(frozen=True)
 class Valuation:
@@ -88,19 +258,99 @@ def isConstant(arg:Union[str,CT.FOLFunction]) -> bool:
 def isFunction(arg:Union[str,CT.FOLFunction]) -> bool:
     return type(arg) != str
 
+def isGround(arg:Union[str,CT.FOLFunction]) -> bool:
+    stack = [arg]
+    while len(stack) > 0:
+        term = stack.pop()
+        if type(term) == CT.FOLFunction:
+            stack.extend(term.args)
+        elif isVariable(term):
+            return False
+    return True
+
+
+# (predicate name, arity)
+PredicateKey = Tuple[str,int]
+# a Horn clause as its head and the atoms of its body
+Rule = Tuple[CT.Predicate,Tuple[CT.Predicate,...]]
 
 @dataclass(frozen=True)
 class KnowledgeBase:
-    clauses: CT.Clauses
-    facts: Dict[CT.Predicate,Valuation]
+    # Horn clauses for chaining: the ground facts in one table per predicate,
+    # every other clause with a head as a rule under its head predicate,
+    # and the bodies of the clauses without a head as the goals
+    clauses: Union[CT.Clauses,Sequence[Sequence[CT.Predicate]]]
+    facts: Dict[PredicateKey,FactTable] = field(default_factory=dict, repr=False)
+    rules: Dict[PredicateKey,List[Rule]] = field(default_factory=dict, repr=False)
+    goals: List[Tuple[CT.Predicate,...]] = field(default_factory=list, repr=False)
+    def table(self, key:PredicateKey) -> FactTable:
+        table = self.facts.get(key)
+        if table is None:
+            table = FactTable(key[1])
+            self.facts[key] = table
+        return table
+    def addFact(self, fact:CT.Predicate) -> bool:
+        return self.table((fact.name, len(fact.args))).add(fact.args)
+    def addClause(self, head:Union[CT.Predicate,None], body:Sequence[CT.Predicate]):
+        atoms = tuple(CT.Predicate(atom.name, atom.args, False) for atom in body)
+        if head is None:
+            self.goals.append(atoms)
+        elif len(atoms) == 0 and all(isGround(arg) for arg in head.args):
+            self.addFact(head)
+        else:
+            self.rules.setdefault((head.name, len(head.args)), []).append((head, atoms))
 
 @dataclass(frozen=True)
 class FOLKnowledgeBase:
-    clauses: List[List[CT.Predicate]]
+    clauses: List[CT.Clause]
+    index: LiteralIndex = field(default_factory=TermIndex, compare=False, repr=False)
+    subsumption: SubsumptionIndex = field(default_factory=SubsumptionIndex, compare=False, repr=False)
+    # positions of clauses that were backward subsumed, they stay in clauses so positions do not shift
+    removed: Set[int] = field(default_factory=set, compare=False, repr=False)
+    def __post_init__(self):
+        for i, clause in enumerate(self.clauses):
+            self.index.addClause(i, clause)
+            self.subsumption.add(i, clause)
+    def addClause(self, clause:CT.Clause) -> int:
+        self.clauses.append(clause)
+        self.index.addClause(len(self.clauses)-1, clause)
+        self.subsumption.add(len(self.clauses)-1, clause)
+        return len(self.clauses)-1
+    def removeClause(self, i:int):
+        self.index.removeClause(i, self.clauses[i])
+        self.subsumption.remove(i)
+        self.removed.add(i)
+    def isRedundant(self, clause:CT.Clause) -> bool:
+        # forward subsumption, some clause we already have is at least as general
+        redundant = self.subsumption.forwardSubsumed(clause)
+        if redundant and metrics.enabled:
+            metrics.count("forward_subsumed")
+        return redundant
+    def removeSubsumedBy(self, clause:CT.Clause) -> List[int]:
+        # backward subsumption, drop the clauses the new clause makes redundant
+        subsumed = self.subsumption.backwardSubsumed(clause)
+        for i in subsumed:
+            self.removeClause(i)
+        if len(subsumed) > 0 and metrics.enabled:
+            metrics.count("backward_subsumed", len(subsumed))
+        return subsumed
+    def liveIndices(self) -> List[int]:
+        return [i for i in range(len(self.clauses)) if i not in self.removed]
 
-def prepareForBackchaining(clauses:CT.Clauses) -> KnowledgeBase:
-    facts = {clause.head: Valuation(clause.head, TruthRepresentation.TRUE) for clause in clauses.horns if len(clause.predicates) == 0 and clause.head is not None}
-    return KnowledgeBase(clauses, facts)
+def prepareForBackchaining(clauses:Union[CT.Clauses,Sequence[Sequence[CT.Predicate]]]) -> KnowledgeBase:
+    # from the horn part of CT.Clauses, or from parsed clauses which then all have to be Horn,
+    # a body keeps the order of its literals, pass them as written (CT.parseWritten) rather than as a sorted Clause
+    kb = KnowledgeBase(clauses)
+    if isinstance(clauses, CT.Clauses):
+        for horn in clauses.horns:
+            kb.addClause(horn.head, horn.predicates)
+        return kb
+    if not isHorn(clauses):
+        raise ValueError("chaining needs Horn clauses, at most one positive literal in every clause")
+    for clause in clauses:
+        heads = [predicate for predicate in clause if not predicate.is_negated]
+        kb.addClause(heads[0] if len(heads) > 0 else None, [predicate for predicate in clause if predicate.is_negated])
+    return kb
 
 def prepareForResolution(clauses:CT.Clauses) -> FOLKnowledgeBase:
     resulting_clauses = []
@@ -113,244 +363,1261 @@ def prepareForResolution(clauses:CT.Clauses) -> FOLKnowledgeBase:
                     preds.extend(sclause.predicates)
             preds.append(clause.head)
         preds.extend([CT.Predicate(pred.name, pred.args, True) for pred in clause.predicates])
-        resulting_clauses.append(preds)
+        resulting_clauses.append(CT.Clause(preds))
     return FOLKnowledgeBase(resulting_clauses)
 
-def unifyExp(expressions : Tuple[Union[str,CT.FOLFunction], Union[str,CT.FOLFunction]],
-        substition_till_here:Union[Dict[Union[str,CT.FOLFunction],Union[str,CT.FOLFunction]],None] = {}) -> Union[Dict[Union[str,CT.FOLFunction],Union[str,CT.FOLFunction]],None]:
-    exp1 = expressions[0]
-    exp2 = expressions[1]
-    if exp1 == exp2:
-        return substition_till_here
+Term = Union[str,CT.FOLFunction]
+# A variable together with the offset of the clause it belongs to.
+# Two clauses taking part in one inference get different offsets (0 and 1),
+# so their variables never clash even when they have the same name,
+# this standardizes them apart without building renamed copies of the clauses.
+Slot = Tuple[str,int]
+Bound = Tuple[Term,int]
+
+class Substitution:
+    # Triangular substitution: a variable may be bound to a term that still holds bound variables,
+    # so binding never rewrites earlier bindings and deref follows the chain when reading.
+    # Every binding is pushed on the trail, undo(mark) takes back everything bound after mark.
+    def __init__(self, bindings:Union[Dict[Slot,Bound],None] = None):
+        self.bindings:Dict[Slot,Bound] = bindings if bindings is not None else {}
+        self.trail:List[Slot] = []
+    @staticmethod
+    def fromDict(bindings:Dict[str,Term]) -> "Substitution":
+        return Substitution({(variable, 0): (term, 0) for variable, term in bindings.items()})
+    def toDict(self) -> Dict[str,Term]:
+        # only meaningful when everything lives at offset 0, which is how unify uses it
+        return {variable: term for (variable, _), (term, _) in self.bindings.items()}
+    def deref(self, term:Term, offset:int = 0) -> Bound:
+        while type(term) == str and (term, offset) in self.bindings:
+            term, offset = self.bindings[(term, offset)]
+        return term, offset
+    def bind(self, slot:Slot, bound:Bound):
+        self.bindings[slot] = bound
+        self.trail.append(slot)
+    def mark(self) -> int:
+        return len(self.trail)
+    def undo(self, mark:int):
+        while len(self.trail) > mark:
+            del self.bindings[self.trail.pop()]
+    def occurs(self, slot:Slot, term:Term, offset:int) -> bool:
+        stack = [(term, offset)]
+        while len(stack) > 0:
+            current, current_offset = self.deref(*stack.pop())
+            if type(current) == CT.FOLFunction:
+                stack.extend((arg, current_offset) for arg in current.args)
+            elif (current, current_offset) == slot:
+                return True
+        return False
+    def unify(self, term1:Term, term2:Term, occurs_check:bool = True, offset1:int = 0, offset2:int = 0) -> bool:
+        # on failure every binding made by this call is undone
+        start = self.mark()
+        stack = [(term1, offset1, term2, offset2)]
+        while len(stack) > 0:
+            exp1, off1, exp2, off2 = stack.pop()
+            exp1, off1 = self.deref(exp1, off1)
+            exp2, off2 = self.deref(exp2, off2)
+            if isVariable(exp2) and not isVariable(exp1):
+                exp1, off1, exp2, off2 = exp2, off2, exp1, off1
+            if isVariable(exp1):
+                if exp1 == exp2 and off1 == off2:
+                    continue
+                if occurs_check and self.occurs((exp1, off1), exp2, off2):
+                    self.undo(start)
+                    return False
+                self.bind((exp1, off1), (exp2, off2))
+            elif type(exp1) == CT.FOLFunction and type(exp2) == CT.FOLFunction:
+                # the same shared term only unifies for free when both sides are at the same offset
+                if exp1 is exp2 and off1 == off2:
+                    continue
+                if exp1.name != exp2.name or len(exp1.args) != len(exp2.args):
+                    self.undo(start)
+                    return False
+                stack.extend((arg1, off1, arg2, off2) for arg1, arg2 in zip(exp1.args, exp2.args))
+            elif exp1 != exp2:
+                self.undo(start)
+                return False
+        return True
+    def unifyLiterals(self, pred1:CT.Predicate, offset1:int, pred2:CT.Predicate, offset2:int, occurs_check:bool = True) -> bool:
+        if not metrics.enabled:
+            return self.unifyArgs(pred1, offset1, pred2, offset2, occurs_check)
+        started = time.perf_counter()
+        unified = self.unifyArgs(pred1, offset1, pred2, offset2, occurs_check)
+        metrics.addTime("unify", time.perf_counter() - started)
+        metrics.count("unify_attempts")
+        if not unified:
+            metrics.count("unify_failures")
+        return unified
+    def unifyArgs(self, pred1:CT.Predicate, offset1:int, pred2:CT.Predicate, offset2:int, occurs_check:bool = True) -> bool:
+        if pred1.name != pred2.name or len(pred1.args) != len(pred2.args):
+            return False
+        start = self.mark()
+        for arg1, arg2 in zip(pred1.args, pred2.args):
+            if not self.unify(arg1, arg2, occurs_check, offset1, offset2):
+                self.undo(start)
+                return False
+        return True
+    def unboundVariables(self, term:Term, offset:int, found:Dict[Slot,None]):
+        stack = [(term, offset)]
+        while len(stack) > 0:
+            current, current_offset = self.deref(*stack.pop())
+            if type(current) == CT.FOLFunction:
+                stack.extend((arg, current_offset) for arg in reversed(current.args))
+            elif isVariable(current):
+                found[(current, current_offset)] = None
+    def apply(self, term:Term, offset:int = 0, rename:Union[Dict[Slot,str],None] = None) -> Term:
+        # fully instantiate term, rebuilt bottom up with a stack so deep terms do not recurse,
+        # unbound variables are renamed through rename, subterms that do not change are returned as they are
+        rename = rename if rename is not None else {}
+        term, offset = self.deref(term, offset)
+        if type(term) != CT.FOLFunction:
+            return rename.get((term, offset), term) if isVariable(term) else term
+        stack:List[Tuple[Term,int,bool]] = [(term, offset, False)]
+        results:List[Term] = []
+        while len(stack) > 0:
+            current, current_offset, expanded = stack.pop()
+            if type(current) != CT.FOLFunction:
+                results.append(rename.get((current, current_offset), current) if isVariable(current) else current)
+            elif not expanded:
+                stack.append((current, current_offset, True))
+                for arg in reversed(current.args):
+                    stack.append((*self.deref(arg, current_offset), False))
+            else:
+                count = len(current.args)
+                new_args = results[len(results)-count:]
+                del results[len(results)-count:]
+                if all(new is old for new, old in zip(new_args, current.args)):
+                    results.append(current)
+                else:
+                    results.append(CT.FOLFunction(current.name, new_args))
+        return results[0]
+    def instantiate(self, predicate:CT.Predicate, offset:int = 0, rename:Union[Dict[Slot,str],None] = None) -> CT.Predicate:
+        new_args = [self.apply(arg, offset, rename) for arg in predicate.args]
+        if all(new is old for new, old in zip(new_args, predicate.args)):
+            # literals are shared, no need to look the same one up again
+            return predicate
+        return CT.Predicate(predicate.name, new_args, predicate.is_negated)
+
+def unifyExp(expressions : Tuple[Term, Term],
+        substition_till_here:Union[Dict[str,Term],None] = None, occurs_check:bool = True) -> Union[Dict[str,Term],None]:
     if substition_till_here is None:
         return None
-    if isVariable(exp1):
-        return unifyVar((exp1, exp2), substition_till_here)
-    elif isVariable(exp2):
-        return unifyVar((exp2, exp1), substition_till_here)
-    elif type(exp1) == CT.FOLFunction and type(exp2) == CT.FOLFunction:
-        # we need to check if the function names are the same
-        # then we need to check if the arguments are the same
-        # if they are the same, we need to unify the arguments
-        # if they are not the same, we need to return None
-        # if the function names are not the same, we need to return None
-        if exp1.name != exp2.name or len(exp1.args) != len(exp2.args):
-            return None
-        args1 = exp1.args
-        args2 = exp2.args
-        for i in range(len(args1)):
-            substition_till_here = unifyExp((args1[i], args2[i]), substition_till_here)
-        return substition_till_here
-    return None
-
-def unifyVar(expressions : Tuple[Union[str,CT.FOLFunction], Union[str,CT.FOLFunction]],
-        substition_till_here:Union[Dict[Union[str,CT.FOLFunction],Union[str,CT.FOLFunction]],None] = {}) -> Union[Dict[Union[str,CT.FOLFunction],Union[str,CT.FOLFunction]],None]:
-    exp1 = expressions[0]
-    exp2 = expressions[1]
-    if exp1 == exp2:
-        return substition_till_here
-    if substition_till_here is None:
+    substition = Substitution.fromDict(substition_till_here)
+    if not substition.unify(expressions[0], expressions[1], occurs_check):
         return None
-    if exp1 in substition_till_here:
-        return unifyVar((substition_till_here[exp1], exp2), substition_till_here)
-    elif exp2 in substition_till_here:
-        return unifyVar((exp1, substition_till_here[exp2]), substition_till_here)
-    else:
-        current_substition = substition_till_here.copy()
-        current_substition[exp1] = exp2
-        return current_substition
+    return substition.toDict()
+
+def unifyVar(expressions : Tuple[Term, Term],
+        substition_till_here:Union[Dict[str,Term],None] = None, occurs_check:bool = True) -> Union[Dict[str,Term],None]:
+    # expressions[0] is a variable, binding it is just unification
+    return unifyExp(expressions, substition_till_here, occurs_check)
 
 
 def unify(set_of_pairs_of_clauses: List[Tuple[CT.Predicate,CT.Predicate]],
-        substition_till_here: Union[Dict[Union[str,CT.FOLFunction],Union[str,CT.FOLFunction]],None]={}) -> Union[Dict[Union[str,CT.FOLFunction],Union[str,CT.FOLFunction]],None]:
-    if len(set_of_pairs_of_clauses) == 0:
-        return substition_till_here
-    first_set = set_of_pairs_of_clauses[0]
-    if first_set[0] == first_set[1]:
-        return unify(set_of_pairs_of_clauses[1:], substition_till_here)
-    if first_set[0].name == first_set[1].name:
-        # These predicates have the same name
-        for i in range(len(first_set[0].args)):
-            substition_till_here = unifyExp((first_set[0].args[i], first_set[1].args[i]), substition_till_here)
-        return unify(set_of_pairs_of_clauses[1:], substition_till_here)
-    return None
-
-def substitute(substition:Dict[Union[str,CT.FOLFunction],Union[str,CT.FOLFunction]], predicate:CT.Predicate) -> CT.Predicate:
-    new_args = []
-    for arg in predicate.args:
-        current_sub_for_arg = arg
-        while current_sub_for_arg in substition:
-            current_sub_for_arg = substition[current_sub_for_arg]
-        new_args.append(current_sub_for_arg)
-    return CT.Predicate(predicate.name, new_args, predicate.is_negated)
-
-
-def resolution(kb:FOLKnowledgeBase) -> Tuple[List[List[CT.Predicate]],Satisfaction]:
+        substition_till_here: Union[Dict[str,Term],None] = None, occurs_check:bool = True) -> Union[Dict[str,Term],None]:
+    substition = Substitution.fromDict(substition_till_here if substition_till_here is not None else {})
+    for first, second in set_of_pairs_of_clauses:
+        if first == second:
+            continue
+        if not substition.unifyLiterals(first, 0, second, 0, occurs_check):
+            return None
+    return substition.toDict()
+
+def substitute(substition:Union[Dict[str,Term],Substitution], predicate:CT.Predicate) -> CT.Predicate:
+    if isinstance(substition, dict):
+        substition = Substitution.fromDict(substition)
+    if len(substition.bindings) == 0:
+        return predicate
+    return substition.instantiate(predicate)
+
+def renameApart(substition:Substitution, literals:List[Tuple[CT.Predicate,int]]) -> Dict[Slot,str]:
+    # names for the variables left in a resolvent,
+    # variables of the first clause keep their names, so do those of the second one unless the name is taken
+    found:Dict[Slot,None] = {}
+    for predicate, offset in literals:
+        for arg in predicate.args:
+            substition.unboundVariables(arg, offset, found)
+    taken = {variable for variable, offset in found if offset == 0}
+    rename:Dict[Slot,str] = {}
+    clashing = []
+    for variable, offset in found:
+        if offset == 0:
+            continue
+        if variable in taken:
+            clashing.append((variable, offset))
+        else:
+            rename[(variable, offset)] = variable
+    taken.update(rename.values())
+    for variable, offset in clashing:
+        suffix = 1
+        while f"{variable}{suffix}" in taken:
+            suffix += 1
+        rename[(variable, offset)] = f"{variable}{suffix}"
+        taken.add(rename[(variable, offset)])
+    return rename
+
+def resolveLiterals(clause1:CT.Clause, position1:int, clause2:CT.Clause, position2:int) -> Union[Tuple[CT.Clause,Substitution,Dict[Slot,str]],None]:
+    # resolve clause1 and clause2 upon the literals at the given positions,
+    # the literals are expected to have the same name, arity and opposite polarity
+    # clause1 lives at offset 0 and clause2 at offset 1, so they never share variables
+    measuring = metrics.enabled
+    if measuring:
+        metrics.count("pairs_tried")
+    substition = Substitution()
+    if not substition.unifyLiterals(clause1[position1], 0, clause2[position2], 1):
+        return None
+    started = time.perf_counter() if measuring else 0.0
+    remaining = [(pred, 0) for k, pred in enumerate(clause1) if k != position1]
+    remaining.extend((pred, 1) for k, pred in enumerate(clause2) if k != position2)
+    rename = renameApart(substition, remaining)
+    resolvent = CT.Clause([substition.instantiate(pred, offset, rename) for pred, offset in remaining])
+    if measuring:
+        metrics.addTime("substitute", time.perf_counter() - started)
+        metrics.count("resolvents_generated")
+    return resolvent, substition, rename
+
+def factorLiterals(clause:CT.Clause, position1:int, position2:int) -> Union[Tuple[CT.Clause,Substitution,Dict[Slot,str]],None]:
+    # merge two literals of the same sign of a clause by unifying them, everything lives at offset 0
+    substition = Substitution()
+    if not substition.unifyLiterals(clause[position1], 0, clause[position2], 0):
+        return None
+    remaining = [(pred, 0) for k, pred in enumerate(clause) if k != position2]
+    rename = renameApart(substition, remaining)
+    return CT.Clause([substition.instantiate(pred, offset, rename) for pred, offset in remaining]), substition, rename
+
+def factors(clause:CT.Clause) -> Iterator[Tuple[CT.Clause,Substitution,Dict[Slot,str]]]:
+    # binary factors, without them or(P(X),P(Y)) and or(not(P(U)),not(P(V))) would never resolve to the empty clause,
+    # the literals are sorted by name and sign so the ones that can merge are next to each other
+    for position1, pred1 in enumerate(clause):
+        for position2 in range(position1+1, len(clause)):
+            pred2 = clause[position2]
+            if pred2.name != pred1.name or pred2.is_negated != pred1.is_negated:
+                break
+            if len(pred2.args) == len(pred1.args):
+                factored = factorLiterals(clause, position1, position2)
+                if factored is not None:
+                    if metrics.enabled:
+                        metrics.count("factors_generated")
+                    yield factored
+
+def resolventOn(clause1:CT.Clause, position1:int, clause2:CT.Clause, position2:int) -> Union[CT.Clause,None]:
+    resolved = resolveLiterals(clause1, position1, clause2, position2)
+    return resolved[0] if resolved is not None else None
+
+@dataclass(frozen=True)
+class Inference:
+    # a derived clause, the position it got in the knowledge base (None if it was not kept),
+    # the positions of its parents (two for a resolvent, one for a factor, none for a registered clause)
+    # and the unifier that produced it
+    clause: CT.Clause
+    clause_id: Union[int,None]
+    parents: Tuple[int,...]
+    substitution: Union[Substitution,None] = field(default=None, compare=False, repr=False)
+    rename: Union[Dict[Slot,str],None] = field(default=None, compare=False, repr=False)
+    def unifier(self) -> List[Dict[str,str]]:
+        # for each parent, what its bound variables stand for in the resolvent
+        parents:List[Dict[str,str]] = [{} for _ in self.parents]
+        if self.substitution is None:
+            return parents
+        for variable, offset in self.substitution.bindings:
+            parents[offset][variable] = CT.termToString(self.substitution.apply(variable, offset, self.rename))
+        return parents
+
+class ProofDAG:
+    # How every derived clause was made, indexed by clause id: the parent ids in a flat array,
+    # two per clause, -1 for registered clauses and for the second parent of a factor, and a reference to the unifier used.
+    # The empty clause has no id, its inference is kept on its own.
+    # Only the refutation is ever turned into text, the rest of the derivations stay integers.
+    def __init__(self):
+        self.parents = array("q")
+        self.unifiers:List[Union[Tuple[Substitution,Dict[Slot,str]],None]] = []
+        self.empty:Union[Inference,None] = None
+    def record(self, inference:Inference):
+        if inference.clause_id is None:
+            if len(inference.clause) == 0:
+                self.empty = inference
+            return
+        missing = inference.clause_id + 1 - len(self.unifiers)
+        if missing > 0:
+            self.parents.extend([-1]*(2*missing))
+            self.unifiers.extend([None]*missing)
+        self.parents[2*inference.clause_id] = inference.parents[0]
+        self.parents[2*inference.clause_id+1] = inference.parents[1] if len(inference.parents) > 1 else -1
+        if inference.substitution is not None:
+            self.unifiers[inference.clause_id] = (inference.substitution, inference.rename)
+    def derivation(self, clause_id:int) -> Union[Inference,None]:
+        # the inference that made the clause, None for registered ones
+        if clause_id >= len(self.unifiers) or self.parents[2*clause_id] < 0:
+            return None
+        unifier = self.unifiers[clause_id]
+        parents = tuple(parent for parent in (self.parents[2*clause_id], self.parents[2*clause_id+1]) if parent >= 0)
+        return Inference(CT.Clause([]), clause_id, parents, *(unifier if unifier is not None else (None, None)))
+    def refutation(self, clauses:List[CT.Clause]) -> List[Inference]:
+        # the clauses the empty clause depends on, in the order they were made, the empty clause last
+        if self.empty is None:
+            return []
+        needed:Set[int] = set()
+        stack = list(self.empty.parents)
+        while len(stack) > 0:
+            clause_id = stack.pop()
+            if clause_id in needed:
+                continue
+            needed.add(clause_id)
+            made = self.derivation(clause_id)
+            if made is not None:
+                stack.extend(made.parents)
+        steps:List[Inference] = []
+        for clause_id in sorted(needed):
+            made = self.derivation(clause_id)
+            if made is None:
+                steps.append(Inference(clauses[clause_id], clause_id, ()))
+            else:
+                steps.append(replace(made, clause=clauses[clause_id]))
+        steps.append(self.empty)
+        return steps
+
+# The engines are generators: they yield an Inference for every clause they keep
+# (and for the empty clause) and return the final Satisfaction.
+# collect turns one into the (added, satisfaction) pair the rest of the code works with,
+# and records the derivations when given a ProofDAG.
+# Only the given-clause engine ever listed the empty clause in added, with_empty keeps it that way.
+Inferences = Generator[Inference,None,Satisfaction]
+
+def collect(inferences:Inferences, proof:Union[ProofDAG,None] = None, with_empty:bool = True) -> Tuple[List[CT.Clause],Satisfaction]:
+    added:List[CT.Clause] = []
+    while True:
+        try:
+            inference = next(inferences)
+        except StopIteration as stop:
+            return added, stop.value
+        if with_empty or len(inference.clause) > 0:
+            added.append(inference.clause)
+        if proof is not None:
+            proof.record(inference)
+
+def roundResolvents(clauses:List[CT.Clause], index:LiteralIndex, i:int, clause_count:int) -> Iterator[Tuple[int,int,int,CT.Clause,Substitution,Dict[Slot,str]]]:
+    # resolvents of clause i with the clauses after it that were there when the round started,
+    # the literal index gives us the complementary literals directly
+    candidates = sorted((j, position1, position2)
+            for position1, j, position2 in index.partners(clauses[i])
+            if i < j < clause_count)
+    for j, position1, position2 in candidates:
+        resolved = resolveLiterals(clauses[i], position1, clauses[j], position2)
+        if resolved is not None:
+            yield (j, position1, position2, *resolved)
+
+def roundFactors(kb:FOLKnowledgeBase, start:int, clause_count:int) -> List[Inference]:
+    # factors of the clauses added since the last round
+    return [Inference(factor, None, (i,), substition, rename)
+            for i in range(start, clause_count) if i not in kb.removed
+            for factor, substition, rename in factors(kb.clauses[i])]
+
+def addRound(kb:FOLKnowledgeBase, pending:List[Inference], budget:Budget) -> Generator[Inference,None,bool]:
+    # add what a round derived, skipping redundant clauses, returns true if anything was kept
+    # the subsumption checks of a big round take a while, it stops early on timeout or cancel
+    have_inferred = False
+    for inference in pending:
+        if budget.interrupted() is not None:
+            break
+        if kb.isRedundant(inference.clause):
+            continue
+        kb.removeSubsumedBy(inference.clause)
+        if metrics.enabled:
+            metrics.count("resolvents_kept")
+        yield replace(inference, clause_id=kb.addClause(inference.clause))
+        have_inferred = True
+    return have_inferred
+
+def iterResolution(kb:FOLKnowledgeBase, budget:Union[Budget,None] = None) -> Inferences:
+    budget = budget if budget is not None else Budget()
     have_inferred = True
-    all_clauses_added:List[List[CT.Predicate]] = []
+    factored = 0
     while have_inferred:
         #this is our regular resolution-refutation procedure for FOL
         #we need to check every unifiable pair of clauses
-        have_inferred = False
-        clauses_to_add = []
-        for i in range(len(kb.clauses)):
-            for j in range(i+1, len(kb.clauses)):
-                # we need to check if the clauses are unifiable
-                # if they are, we need to apply the unification and add the new clause to the knowledge base
-                # if they are not, we need to continue
-                for pred1 in kb.clauses[i]:
-                    for pred2 in kb.clauses[j]:
-                        if pred1.name == pred2.name and pred1.is_negated != pred2.is_negated:
-                            # we need to unify these two predicates
-                            substition = unify([(pred1, pred2)])
-                            if substition is not None:
-                                # we need to apply the unification to the clauses
-                                new_clause = []
-                                for pred in kb.clauses[i]:
-                                    new_pred = substitute(substition, pred)
-                                    if new_pred != pred:
-                                        new_clause.append(new_pred)
-                                for pred in kb.clauses[j]:
-                                    new_pred = substitute(substition, pred)
-                                    if new_pred != pred:
-                                        new_clause.append(new_pred)
-
-                                if len(new_clause) == 0:
-                                    return all_clauses_added, Satisfaction.UNSAT
-                                clauses_to_add.append(new_clause)
-                                all_clauses_added.append(new_clause)
-                                have_inferred = True
-        for clause in clauses_to_add:
-            kb.clauses.append(clause)
-    return all_clauses_added,Satisfaction.SAT
-
-
-def backchain(kb: KnowledgeBase, q:CT.Predicate) -> TruthRepresentation:
+        clause_count = len(kb.clauses)
+        pending:List[Inference] = roundFactors(kb, factored, clause_count)
+        factored = clause_count
+        for i in range(clause_count):
+            if i in kb.removed:
+                continue
+            # spend only counts resolvents, a row of failed unifications still looks at the clock
+            stopped = budget.interrupted()
+            if stopped is not None:
+                yield from addRound(kb, pending, budget)
+                return stopped
+            for j, _, _, new_clause, substition, rename in roundResolvents(kb.clauses, kb.index, i, clause_count):
+                inference = Inference(new_clause, None, (i, j), substition, rename)
+                if len(new_clause) == 0:
+                    yield inference
+                    return Satisfaction.UNSAT
+                pending.append(inference)
+                exhausted = budget.spend(len(kb.clauses) + len(pending))
+                if exhausted is not None:
+                    # keep what this round found so far, it is part of the partial answer
+                    yield from addRound(kb, pending, budget)
+                    return exhausted
+        have_inferred = yield from addRound(kb, pending, budget)
+        stopped = budget.interrupted()
+        if stopped is not None:
+            return stopped
+    return Satisfaction.SAT
+
+def resolution(kb:FOLKnowledgeBase, budget:Union[Budget,None] = None) -> Tuple[List[CT.Clause],Satisfaction]:
+    return collect(iterResolution(kb, budget), with_empty=False)
+
+# Parallel version of resolution.
+# Within a round every pair only reads the clauses, so the rows i of the pair space are dealt
+# round robin to worker processes. The workers are started on the first round big enough for them
+# and live until the search ends, each keeps its own copy of the clauses and its own index.
+# A round only sends them what changed since the last one: the clauses added, the ones removed and
+# the rows to resolve. The results are merged back in the order the serial loop would have produced them,
+# so both give the same clauses.
+# The workers are spawned (or started from a fork server) rather than forked, a fork would copy
+# whatever locks other threads of the server hold. While a round runs the budget is checked every
+# PARALLEL_POLL_SECONDS, on a timeout or a cancel the workers are terminated instead of waited for.
+PARALLEL_MIN_CLAUSES = 64
+PARALLEL_POLL_SECONDS = 0.05
+WORKER_CONTEXT = multiprocessing.get_context("forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn")
+
+def resolutionWorker(connection:Connection):
+    clauses:List[CT.Clause] = []
+    removed:Set[int] = set()
+    index = TermIndex()
+    while True:
+        task = connection.recv()
+        if task is None:
+            return
+        added, newly_removed, rows, deadline = task
+        for clause in added:
+            index.addClause(len(clauses), clause)
+            clauses.append(clause)
+        for i in newly_removed:
+            index.removeClause(i, clauses[i])
+            removed.add(i)
+        connection.send(resolveRows(clauses, removed, index, rows, deadline))
+
+def resolveRows(clauses:List[CT.Clause], removed:Set[int], index:LiteralIndex, rows:range,
+        deadline:Union[float,None]) -> Tuple[List[Tuple[int,int,int,int,CT.Clause,Substitution,Dict[Slot,str]]],bool]:
+    # the resolvents of the rows with their unifiers and whether the deadline cut them short
+    found = []
+    for i in rows:
+        if deadline is not None and time.time() > deadline:
+            return found, True
+        if i in removed:
+            continue
+        for j, position1, position2, new_clause, substition, rename in roundResolvents(clauses, index, i, len(clauses)):
+            found.append((i, j, position1, position2, new_clause, substition, rename))
+    return found, False
+
+class ResolutionWorkers:
+    def __init__(self, count:int):
+        self.count = count
+        self.connections:List[Connection] = []
+        self.processes:List[multiprocessing.Process] = []
+        # how many clauses and which removals the workers know about
+        self.sent = 0
+        self.removed:Set[int] = set()
+    def start(self):
+        for _ in range(self.count):
+            mine, theirs = WORKER_CONTEXT.Pipe()
+            process = WORKER_CONTEXT.Process(target=resolutionWorker, args=(theirs,), daemon=True)
+            process.start()
+            theirs.close()
+            self.connections.append(mine)
+            self.processes.append(process)
+    def round(self, kb:FOLKnowledgeBase, clause_count:int, budget:Budget):
+        # what every worker found, or why the budget stopped the round
+        if len(self.processes) == 0:
+            self.start()
+        added = kb.clauses[self.sent:clause_count]
+        newly_removed = sorted(kb.removed - self.removed)
+        for k, connection in enumerate(self.connections):
+            connection.send((added, newly_removed, range(k, clause_count, self.count), budget.deadline()))
+        self.sent = clause_count
+        self.removed.update(newly_removed)
+        results = []
+        for connection in self.connections:
+            while not connection.poll(PARALLEL_POLL_SECONDS):
+                stopped = budget.interrupted()
+                if stopped is not None:
+                    self.terminate()
+                    return [], stopped
+            results.append(connection.recv())
+        return results, None
+    def terminate(self):
+        # the workers are in the middle of a round, they are not asked to stop
+        for connection in self.connections:
+            connection.close()
+        for process in self.processes:
+            process.terminate()
+            process.join(1)
+        self.connections = []
+        self.processes = []
+        self.sent = 0
+        self.removed = set()
+    def close(self):
+        for connection in self.connections:
+            try:
+                connection.send(None)
+            except OSError:
+                pass
+            connection.close()
+        for process in self.processes:
+            process.join(1)
+            if process.is_alive():
+                process.terminate()
+        self.connections = []
+        self.processes = []
+
+def iterParallelResolution(kb:FOLKnowledgeBase, workers:Union[int,None] = None, budget:Union[Budget,None] = None) -> Inferences:
+    workers = workers if workers is not None else (os.cpu_count() or 1)
+    budget = budget if budget is not None else Budget()
+    pool = ResolutionWorkers(workers)
+    try:
+        have_inferred = True
+        factored = 0
+        while have_inferred:
+            clause_count = len(kb.clauses)
+            # factoring is cheap next to the pairs, it stays in this process
+            pending:List[Inference] = roundFactors(kb, factored, clause_count)
+            factored = clause_count
+            truncated = False
+            if workers <= 1 or clause_count < PARALLEL_MIN_CLAUSES:
+                # not worth starting processes for a small round
+                for i in range(clause_count):
+                    if i in kb.removed:
+                        continue
+                    pending.extend(Inference(new_clause, None, (i, j), substition, rename)
+                            for j, _, _, new_clause, substition, rename in roundResolvents(kb.clauses, kb.index, i, clause_count))
+            else:
+                results, stopped = pool.round(kb, clause_count, budget)
+                if stopped is not None:
+                    return stopped
+                merged = sorted((found for rows, _ in results for found in rows), key=lambda found: found[:4])
+                pending.extend(Inference(new_clause, None, (i, j), substition, rename) for i, j, _, _, new_clause, substition, rename in merged)
+                truncated = any(cut for _, cut in results)
+            for inference in pending:
+                if len(inference.clause) == 0:
+                    yield inference
+                    return Satisfaction.UNSAT
+            exhausted = budget.spend(len(kb.clauses) + len(pending), len(pending))
+            have_inferred = yield from addRound(kb, pending, budget)
+            if truncated:
+                return Satisfaction.TIMEOUT
+            if exhausted is not None:
+                return exhausted
+            stopped = budget.interrupted()
+            if stopped is not None:
+                return stopped
+        return Satisfaction.SAT
+    finally:
+        pool.close()
+
+def parallelResolution(kb:FOLKnowledgeBase, workers:Union[int,None] = None, budget:Union[Budget,None] = None) -> Tuple[List[CT.Clause],Satisfaction]:
+    return collect(iterParallelResolution(kb, workers, budget), with_empty=False)
+
+# Clause selection strategies, shared by the given-clause loop and Context.
+# A strategy orders clauses by priority (smaller goes first), may rule out pairs it never resolves,
+# and may leave clauses unsupported: those are only ever used as partners, never picked themselves.
+# start is called once with the registered clauses, every later clause is a resolvent.
+# A strategy that is not complete for the clauses it started with may run out of clauses to pick
+# on unsatisfiable ones, then the search ends with unknown instead of sat.
+class Strategy:
+    # first come first served, the plain given-clause loop
+    name = "fifo"
+    def start(self, kb:FOLKnowledgeBase):
+        self.input_count = len(kb.clauses)
+    def priority(self, clause_id:int, clause:CT.Clause) -> Tuple:
+        return (clause_id,)
+    def supported(self, clause_id:int) -> bool:
+        return True
+    def allowed(self, i:int, j:int) -> bool:
+        return True
+    def complete(self) -> bool:
+        return True
+
+class UnitPreference(Strategy):
+    # shortest clause first, unit clauses make the resolvents shorter
+    name = "unit"
+    def priority(self, clause_id:int, clause:CT.Clause) -> Tuple:
+        return (len(clause), clause_id)
+
+def clauseWeight(clause:CT.Clause) -> int:
+    # symbol count, one for the predicate and one for every symbol in its arguments
+    return sum(1 + len(flattenArgs(pred.args)) for pred in clause)
+
+class WeightedSelection(Strategy):
+    # light clauses first but older clauses catch up: after age_ratio times as many clauses
+    # as were registered, a clause is as bad as one a symbol heavier, so nothing waits forever
+    name = "weighted"
+    def __init__(self, age_ratio:int = 4):
+        self.age_ratio = age_ratio
+    def priority(self, clause_id:int, clause:CT.Clause) -> Tuple:
+        return (clauseWeight(clause) + clause_id/(self.age_ratio*max(self.input_count, 1)), clause_id)
+
+class SetOfSupport(UnitPreference):
+    # every resolution needs a parent from the set of support: the marked clauses and
+    # everything derived from them. Without a marking the goal clauses (all literals negated) are used,
+    # if there are none the clauses are satisfiable anyway, all of them have a positive literal.
+    # That makes the unmarked clauses satisfiable, which the strategy needs to be complete.
+    # A marking given by the caller may leave unsatisfiable clauses unmarked, running out of pairs then proves nothing.
+    name = "sos"
+    def __init__(self, support:Union[Set[int],None] = None):
+        self.marked = support
+    def start(self, kb:FOLKnowledgeBase):
+        super().start(kb)
+        self.support = self.marked if self.marked is not None else {i for i, clause in enumerate(kb.clauses) if all(pred.is_negated for pred in clause)}
+    def supported(self, clause_id:int) -> bool:
+        return clause_id >= self.input_count or clause_id in self.support
+    def allowed(self, i:int, j:int) -> bool:
+        return self.supported(i) or self.supported(j)
+    def complete(self) -> bool:
+        return self.marked is None
+
+class LinearInput(UnitPreference):
+    # input resolution, one parent is always a registered clause, so every derivation is a linear chain
+    # off the input clauses. Complete for Horn clauses only, on other inputs running out of pairs proves nothing.
+    name = "input"
+    def start(self, kb:FOLKnowledgeBase):
+        super().start(kb)
+        self.horn = isHorn(kb.clauses)
+    def allowed(self, i:int, j:int) -> bool:
+        return i < self.input_count or j < self.input_count
+    def complete(self) -> bool:
+        return self.horn
+
+STRATEGIES = {strategy.name: strategy for strategy in (Strategy, UnitPreference, WeightedSelection, SetOfSupport, LinearInput)}
+
+def makeStrategy(name:str, support:Union[Set[int],None] = None) -> Strategy:
+    if name not in STRATEGIES:
+        raise ValueError(f"unknown strategy {name}, expected one of {list(STRATEGIES)}")
+    if name == SetOfSupport.name:
+        return SetOfSupport(support)
+    return STRATEGIES[name]()
+
+def iterGivenClauseResolution(kb:FOLKnowledgeBase, budget:Union[Budget,None] = None, strategy:Union[Strategy,None] = None) -> Inferences:
+    # Otter style given-clause loop:
+    # processed clauses have already been resolved against each other,
+    # each clause taken from unprocessed is factored and resolved against the processed ones exactly once
+    # so every pair of clauses is looked at a single time
+    # the knowledge base holds both sets and does the subsumption checks,
+    # processed_index only knows the processed clauses
+    # the strategy picks the next given clause, unsupported clauses go straight to processed
+    budget = budget if budget is not None else Budget()
+    strategy = strategy if strategy is not None else Strategy()
+    strategy.start(kb)
+    processed_index = TermIndex()
+    unprocessed:List[Tuple[Tuple,int]] = []
+    def keep(inference:Inference) -> Generator[Inference,None,None]:
+        # a new clause goes to unprocessed unless something subsumes it, the clauses it subsumes are dropped
+        if kb.isRedundant(inference.clause):
+            return
+        for i in kb.removeSubsumedBy(inference.clause):
+            processed_index.removeClause(i, kb.clauses[i])
+        if metrics.enabled:
+            metrics.count("resolvents_kept")
+        new_id = kb.addClause(inference.clause)
+        heapq.heappush(unprocessed, (strategy.priority(new_id, inference.clause), new_id))
+        yield replace(inference, clause_id=new_id)
+    unsupported:List[int] = []
+    for i, clause in enumerate(kb.clauses):
+        if len(clause) == 0:
+            return Satisfaction.UNSAT
+        if strategy.supported(i):
+            heapq.heappush(unprocessed, (strategy.priority(i, clause), i))
+        elif i not in kb.removed:
+            processed_index.addClause(i, clause)
+            unsupported.append(i)
+    # unsupported clauses are never given, their factors are made here
+    for i in unsupported:
+        for factor, substition, rename in factors(kb.clauses[i]):
+            yield from keep(Inference(factor, None, (i,), substition, rename))
+    while len(unprocessed) > 0:
+        _, given_id = heapq.heappop(unprocessed)
+        if given_id in kb.removed:
+            continue
+        given = kb.clauses[given_id]
+        for factor, substition, rename in factors(given):
+            exhausted = budget.spend(len(kb.clauses))
+            if exhausted is not None:
+                return exhausted
+            yield from keep(Inference(factor, None, (given_id,), substition, rename))
+        if given_id in kb.removed:
+            # one of its factors subsumes it
+            continue
+        processed_index.addClause(given_id, given)
+        for position1, j, position2 in list(processed_index.partners(given)):
+            if j in kb.removed or given_id in kb.removed or not strategy.allowed(given_id, j):
+                continue
+            # spend only counts resolvents, failed unifications still look at the clock
+            stopped = budget.interrupted()
+            if stopped is not None:
+                return stopped
+            resolved = resolveLiterals(given, position1, kb.clauses[j], position2)
+            if resolved is None:
+                continue
+            new_clause, substition, rename = resolved
+            if len(new_clause) == 0:
+                yield Inference(new_clause, None, (given_id, j), substition, rename)
+                return Satisfaction.UNSAT
+            exhausted = budget.spend(len(kb.clauses))
+            if exhausted is not None:
+                return exhausted
+            yield from keep(Inference(new_clause, None, (given_id, j), substition, rename))
+    return Satisfaction.SAT if strategy.complete() else Satisfaction.UNKNOWN
+
+def givenClauseResolution(kb:FOLKnowledgeBase, budget:Union[Budget,None] = None, strategy:Union[Strategy,None] = None) -> Tuple[List[CT.Clause],Satisfaction]:
+    return collect(iterGivenClauseResolution(kb, budget, strategy))
+
+# how often a running z3 query looks at the budget
+FIXEDPOINT_POLL_SECONDS = 0.05
+# spacer need not terminate once there are function symbols, after this long resolution takes over
+SPACER_SECONDS = 1.0
+
+def fixedpointSatisfaction(clauses:Sequence[CT.Clause], budget:Budget) -> Union[Satisfaction,None]:
+    # None when z3 cannot tell
+    try:
+        translation = HornTranslation(clauses)
+    except (z3.Z3Exception, RecursionError):
+        return None
+    if translation.goals == 0:
+        # nothing to refute, the least model satisfies every clause
+        return Satisfaction.SAT
+    stopped = budget.interrupted()
+    if stopped is not None:
+        return stopped
+    until = None if translation.datalog else budget.elapsed() + SPACER_SECONDS
+    done = threading.Event()
+    def watch():
+        while not done.wait(FIXEDPOINT_POLL_SECONDS):
+            if budget.interrupted() is not None or (until is not None and budget.elapsed() > until):
+                translation.ctx.interrupt()
+                return
+    watcher = threading.Thread(target=watch, daemon=True)
+    watcher.start()
+    try:
+        answer = translation.query()
+    except (z3.Z3Exception, RecursionError):
+        answer = z3.unknown
+    finally:
+        done.set()
+        watcher.join()
+    if answer == z3.sat:
+        return Satisfaction.UNSAT
+    if answer == z3.unsat:
+        return Satisfaction.SAT
+    return budget.interrupted()
+
+def iterFixedpoint(kb:FOLKnowledgeBase, budget:Union[Budget,None] = None) -> Inferences:
+    # Horn clauses go to the z3 fixedpoint engine, which derives no clauses of ours so nothing is yielded.
+    # When z3 gives up or runs out of its time the given-clause loop takes over with what is left of the budget.
+    budget = budget if budget is not None else Budget()
+    sat = fixedpointSatisfaction([kb.clauses[i] for i in kb.liveIndices()], budget)
+    if sat is None:
+        sat = yield from iterGivenClauseResolution(kb, budget)
+    return sat
+
+def iterChaining(kb:FOLKnowledgeBase, budget:Union[Budget,None] = None, written:Union[Sequence[Sequence[CT.Predicate]],None] = None) -> Inferences:
+    # Horn clauses answered by chaining over fact tables (see below) instead of refutation, nothing is yielded.
+    # The rules are made from written, the clauses with their literals as they were submitted,
+    # so backward chaining proves a body in the order it was written.
+    # When backward chaining is cut off at its depth the given-clause loop takes over with what is left of the budget.
+    budget = budget if budget is not None else Budget()
+    sat = chainingSatisfaction(prepareForBackchaining(written if written is not None else [kb.clauses[i] for i in kb.liveIndices()]), budget)
+    if sat is None:
+        sat = yield from iterGivenClauseResolution(kb, budget)
+    return sat
+
+ENGINES = {
+    "naive": iterResolution,
+    "given_clause": iterGivenClauseResolution,
+    "parallel": iterParallelResolution,
+    "fixedpoint": iterFixedpoint,
+    "chain": iterChaining,
+}
+# auto sends Horn clauses to the fixedpoint engine and everything else to naive resolution,
+# it is only used when asked for: the fixedpoint engine derives none of our clauses, so there is no proof to show
+AUTO_ENGINE = "auto"
+
+def chosenEngine(clauses:Sequence[CT.Clause], engine:str, strategy:Union[Strategy,None] = None) -> str:
+    if engine == AUTO_ENGINE:
+        return "given_clause" if strategy is not None else "fixedpoint" if isHorn(clauses) else "naive"
+    return engine
+
+def iterEngine(kb:FOLKnowledgeBase, engine:str = "naive", budget:Union[Budget,None] = None, workers:Union[int,None] = None,
+        strategy:Union[Strategy,None] = None, written:Union[Sequence[Sequence[CT.Predicate]],None] = None) -> Inferences:
+    # strategies only steer the given-clause loop, written is for the chain engine
+    engine = chosenEngine(kb.clauses, engine, strategy)
+    if engine not in ENGINES:
+        raise ValueError(f"unknown resolution engine {engine}, expected one of {[AUTO_ENGINE] + list(ENGINES)}")
+    if engine in ("fixedpoint", "chain") and not isHorn(kb.clauses):
+        raise ValueError(f"the {engine} engine needs Horn clauses, at most one positive literal in every clause")
+    if strategy is not None and engine != "given_clause":
+        raise ValueError(f"strategy {strategy.name} needs the given_clause engine, not {engine}")
+    if engine == "parallel":
+        return iterParallelResolution(kb, workers, budget)
+    if engine == "given_clause":
+        return iterGivenClauseResolution(kb, budget, strategy)
+    if engine == "chain":
+        return iterChaining(kb, budget, written)
+    return ENGINES[engine](kb, budget)
+
+# Chaining over a KnowledgeBase, for Horn clauses without going through refutation.
+# The bindings live in one Substitution, every use of a rule gets a fresh offset
+# so its variables are kept apart without making a renamed copy of the rule.
+
+# nesting of tables being filled, or proof depth without tabling
+CHAIN_MAX_DEPTH = 128
+
+def matchFacts(table:FactTable, atom:CT.Predicate, offset:int, substitution:Substitution) -> Iterator[None]:
+    # yields once for every fact matching the atom with the bindings made, they are taken back before the next one
+    known:Dict[int,Term] = {}
+    for k, arg in enumerate(atom.args):
+        term = substitution.apply(arg, offset)
+        if isGround(term):
+            known[k] = term
+    unknown = [k for k in range(len(atom.args)) if k not in known]
+    mark = substitution.mark()
+    for row in table.lookup(known):
+        # the facts are ground, no occurs check needed
+        if all(substitution.unify(atom.args[k], row[k], False, offset, offset) for k in unknown):
+            yield
+        substitution.undo(mark)
+
+class SearchStopped(Exception):
+    def __init__(self, status:Satisfaction):
+        super().__init__(STATUS_MESSAGES[status])
+        self.status = status
+
+class AnswerTable:
+    __slots__ = ("answers", "seen", "complete", "evaluating", "position")
+    def __init__(self):
+        self.answers:List[CT.Predicate] = []
+        self.seen:Set[CT.Predicate] = set()
+        self.complete = False
+        self.evaluating = False
+        # place in the stack of tables being filled
+        self.position = -1
+
+# the goals still to prove as a linked list: (atom, offset, depth, rest)
+Goals = Union[Tuple[CT.Predicate,int,int,Any],None]
+
+class Backchainer:
+    # SLD resolution: goals are proved left to right, each against the facts of its predicate and then
+    # the rules in order. The search is an explicit stack of choice points, so long proofs do not recurse.
+    # With tabling every call of a predicate that has rules is answered from a table, one per call up to
+    # the names of its variables. A call reaching a table that is still being filled further up reads the
+    # answers found so far, and the outermost table involved is evaluated again until no table grows
+    # (linear tabling), so left recursion terminates and no subgoal is proved twice.
+    # Tables are kept for later queries unless the search was cut short.
+    # Without tabling the search is plain depth first and cut off at max_depth.
+    def __init__(self, kb:KnowledgeBase, tabling:bool = True, max_depth:int = CHAIN_MAX_DEPTH, budget:Union[Budget,None] = None):
+        self.kb = kb
+        self.tabling = tabling
+        self.max_depth = max_depth
+        self.budget = budget if budget is not None else Budget()
+        self.substitution = Substitution()
+        self.offsets = 0
+        self.tables:Dict[CT.Predicate,AnswerTable] = {}
+        self.evaluating:List[AnswerTable] = []
+        # tables whose evaluation depended on one further up, they are complete once that one is
+        self.incomplete:List[AnswerTable] = []
+        # the lowest position in self.evaluating the current evaluation has read from
+        self.low = max_depth
+        self.answer_count = 0
+        self.cut_off = False
+    def fresh(self) -> int:
+        self.offsets += 1
+        return self.offsets
+    def spend(self):
+        stopped = self.budget.spend(len(self.tables))
+        if stopped is not None:
+            raise SearchStopped(stopped)
+    def forget(self):
+        self.tables.clear()
+        self.evaluating.clear()
+        self.incomplete.clear()
+        self.low = self.max_depth
+    def variant(self, atom:CT.Predicate, offset:int) -> CT.Predicate:
+        # the atom as bound now with its variables named V0, V1, ... in order, the same for all variants
+        found:Dict[Slot,None] = {}
+        for arg in atom.args:
+            self.substitution.unboundVariables(arg, offset, found)
+        rename = {slot: f"V{k}" for k, slot in enumerate(found)}
+        return CT.Predicate(atom.name, [self.substitution.apply(arg, offset, rename) for arg in atom.args], False)
+    def goals(self, body:Sequence[Tuple[CT.Predicate,int]], depth:int, rest:Goals) -> Goals:
+        for atom, offset in reversed(body):
+            rest = (atom, offset, depth, rest)
+        return rest
+    def resolvents(self, atom:CT.Predicate, offset:int, depth:int) -> Iterator[Tuple[Tuple[CT.Predicate,int],...]]:
+        # the matching facts and then the rules, each with the body left to prove
+        key = (atom.name, len(atom.args))
+        table = self.kb.facts.get(key)
+        if table is not None:
+            for _ in matchFacts(table, atom, offset, self.substitution):
+                yield ()
+        rules = self.kb.rules.get(key, ())
+        if len(rules) > 0 and depth >= self.max_depth:
+            self.cut_off = True
+            return
+        for head, body in rules:
+            self.spend()
+            fresh = self.fresh()
+            if self.substitution.unifyLiterals(atom, offset, head, fresh):
+                yield tuple((literal, fresh) for literal in body)
+    def tabled(self, atom:CT.Predicate, offset:int) -> Iterator[Tuple[()]]:
+        table = self.evaluate(self.variant(atom, offset))
+        k = 0
+        # a table still being filled can grow while its answers are used
+        while k < len(table.answers):
+            answer = table.answers[k]
+            k += 1
+            self.spend()
+            if self.substitution.unifyLiterals(atom, offset, answer, self.fresh()):
+                yield ()
+    def evaluate(self, call:CT.Predicate) -> AnswerTable:
+        table = self.tables.get(call)
+        if table is not None and (table.complete or table.evaluating):
+            if table.evaluating:
+                self.low = min(self.low, table.position)
+            return table
+        if table is None:
+            table = AnswerTable()
+            self.tables[call] = table
+        if len(self.evaluating) >= self.max_depth:
+            self.cut_off = True
+            return table
+        outer_low = self.low
+        table.evaluating = True
+        table.position = len(self.evaluating)
+        self.evaluating.append(table)
+        pending = len(self.incomplete)
+        mark = self.substitution.mark()
+        while True:
+            self.low = table.position
+            before = self.answer_count
+            offset = self.fresh()
+            for body in self.resolvents(call, offset, 0):
+                for _ in self.solve(self.goals(body, 1, None)):
+                    answer = self.variant(call, offset)
+                    if answer not in table.seen:
+                        table.seen.add(answer)
+                        table.answers.append(answer)
+                        self.answer_count += 1
+                self.substitution.undo(mark)
+            # a table further up was read, it decides when this one is complete
+            if self.low < table.position or self.answer_count == before:
+                break
+        self.evaluating.pop()
+        table.evaluating = False
+        if self.low < table.position:
+            self.incomplete.append(table)
+            self.low = min(outer_low, self.low)
+        else:
+            table.complete = True
+            for inner in self.incomplete[pending:]:
+                inner.complete = True
+            del self.incomplete[pending:]
+            self.low = outer_low
+        return table
+    def alternatives(self, atom:CT.Predicate, offset:int, depth:int) -> Iterator[Tuple[Tuple[CT.Predicate,int],...]]:
+        if self.tabling and (atom.name, len(atom.args)) in self.kb.rules:
+            return self.tabled(atom, offset)
+        return self.resolvents(atom, offset, depth)
+    def solve(self, goals:Goals) -> Iterator[None]:
+        # yields every time all the goals are proved, with the bindings in self.substitution
+        choices:List[Tuple[Iterator[Tuple[Tuple[CT.Predicate,int],...]],Goals,int,int]] = []
+        while True:
+            if goals is None:
+                yield
+            else:
+                atom, offset, depth, rest = goals
+                choices.append((self.alternatives(atom, offset, depth), rest, depth, self.substitution.mark()))
+            # take the next alternative of the newest choice point
+            while True:
+                if len(choices) == 0:
+                    return
+                alternatives, rest, depth, mark = choices[-1]
+                self.substitution.undo(mark)
+                body = next(alternatives, None)
+                if body is not None:
+                    break
+                choices.pop()
+            goals = self.goals(body, depth+1, rest)
+    def answers(self, query:Sequence[CT.Predicate]) -> Iterator[Dict[str,Term]]:
+        # the bindings of the query variables for every proof of all the query atoms
+        offset = self.fresh()
+        names = sorted(CT.Clause(query).variables)
+        mark = self.substitution.mark()
+        self.cut_off = False
+        atoms = [(CT.Predicate(atom.name, atom.args, False), offset) for atom in query]
+        try:
+            for _ in self.solve(self.goals(atoms, 0, None)):
+                yield {name: self.substitution.apply(name, offset) for name in names}
+        except SearchStopped:
+            self.cut_off = True
+            raise
+        finally:
+            self.substitution.undo(mark)
+            if self.cut_off:
+                self.forget()
+    def prove(self, q:CT.Predicate) -> TruthRepresentation:
+        # FALSE when q does not follow from the knowledge base, UNKNOWN when the search was cut short
+        answers = self.answers([q])
+        try:
+            found = next(answers, None) is not None
+        except SearchStopped:
+            return TruthRepresentation.UNKNOWN
+        finally:
+            answers.close()
+        if found:
+            return TruthRepresentation.TRUE
+        return TruthRepresentation.UNKNOWN if self.cut_off else TruthRepresentation.FALSE
+
+def backchain(kb: KnowledgeBase, q:CT.Predicate, tabling:bool = True, limits:Union[ResourceLimits,None] = None) -> TruthRepresentation:
     assert(not q.is_negated)
-    if q.name in kb.facts:
-        return kb.facts[q.name].truth
-    return TruthRepresentation.UNKNOWN
+    return Backchainer(kb, tabling, budget=Budget(limits)).prove(q)
 
-def sortKB(kb: FOLKnowledgeBase) -> List[int]:
-    count_kb = [(i,len(clause)) for i,clause in enumerate(kb.clauses)]
-    s = sorted(count_kb, key=lambda x: x[1])
-    print("e:",s)
-    return [e[0] for e in s]
+def joinFacts(kb:KnowledgeBase, body:Sequence[CT.Predicate], substitution:Substitution,
+        changed_at:int = -1, changed:Union[FactTable,None] = None) -> Iterator[None]:
+    # every match of the body atoms against the facts, the atom at changed_at only against the changed facts
+    order = ([changed_at] if changed_at >= 0 else []) + [k for k in range(len(body)) if k != changed_at]
+    def match(n:int) -> Iterator[None]:
+        if n == len(order):
+            yield
+            return
+        atom = body[order[n]]
+        table = changed if order[n] == changed_at else kb.facts.get((atom.name, len(atom.args)))
+        if table is None:
+            return
+        for _ in matchFacts(table, atom, 0, substitution):
+            yield from match(n+1)
+    return match(0)
 
-def pairIndices(sort_index:List[int]) -> List[Tuple[int,int]]:
-    sorted_pairs = []
-    for i in range(len(sort_index)):
-        for j in range(i+1, len(sort_index)):
-            sorted_pairs.append((sort_index[i],sort_index[j]))
-    return sorted_pairs
+def forwardChain(kb:KnowledgeBase, budget:Union[Budget,None] = None) -> Satisfaction:
+    # Semi-naive evaluation: the facts derived in one round are the delta of the next, and a rule
+    # only fires on matches using at least one delta fact, so no derivation is made twice.
+    # The derived facts go into kb.facts, ground queries are table lookups afterwards.
+    # SAT once nothing new follows and no goal of the knowledge base holds, UNSAT when one does.
+    budget = budget if budget is not None else Budget()
+    rules = [rule for rules in kb.rules.values() for rule in rules]
+    for head, body in rules:
+        if not CT.Clause([head]).variables <= CT.Clause(body).variables:
+            raise ValueError(f"cannot forward chain to {CT.predicateToString(head)}, a variable of the head is not in the body")
+    substitution = Substitution()
+    total = sum(len(table) for table in kb.facts.values())
+    # everything is new in the first round
+    delta = dict(kb.facts)
+    while len(delta) > 0:
+        derived:Dict[PredicateKey,FactTable] = {}
+        for head, body in rules:
+            key = (head.name, len(head.args))
+            for position, atom in enumerate(body):
+                changed = delta.get((atom.name, len(atom.args)))
+                if changed is None:
+                    continue
+                for _ in joinFacts(kb, body, substitution, position, changed):
+                    row = tuple(substitution.apply(arg) for arg in head.args)
+                    stopped = budget.spend(total)
+                    if stopped is not None:
+                        return stopped
+                    if row not in kb.facts.get(key, ()) and derived.setdefault(key, FactTable(key[1])).add(row):
+                        total += 1
+        for key, table in derived.items():
+            facts = kb.table(key)
+            for row in table:
+                facts.add(row)
+        delta = derived
+    for body in kb.goals:
+        for _ in joinFacts(kb, body, substitution):
+            return Satisfaction.UNSAT
+    return Satisfaction.SAT
 
+def forwardChainable(kb:KnowledgeBase) -> bool:
+    # every variable of a head is in its body, which forward chaining needs, and no rule has a function symbol,
+    # so the facts it derives are finitely many
+    rules = [rule for rules in kb.rules.values() for rule in rules]
+    return (all(CT.Clause([head]).variables <= CT.Clause(body).variables for head, body in rules)
+            and all(type(arg) == str for head, body in rules for atom in (head, *body) for arg in atom.args))
 
+def chainingSatisfaction(kb:KnowledgeBase, budget:Union[Budget,None] = None) -> Union[Satisfaction,None]:
+    # UNSAT when a goal of the knowledge base can be proved, by forward chaining when the rules allow it
+    # and by backward chaining with tabling otherwise, None when the backward search was cut off at its depth
+    budget = budget if budget is not None else Budget()
+    if forwardChainable(kb):
+        return forwardChain(kb, budget)
+    chainer = Backchainer(kb, max_depth=CHAIN_MAX_DEPTH, budget=budget)
+    cut_off = False
+    for body in kb.goals:
+        answers = chainer.answers(body)
+        try:
+            if next(answers, None) is not None:
+                return Satisfaction.UNSAT
+        except SearchStopped as stopped:
+            return stopped.status
+        finally:
+            answers.close()
+        cut_off = cut_off or chainer.cut_off
+    return None if cut_off else Satisfaction.SAT
 
 class Context:
-    def __init__(self):
-        self.kb = FOLKnowledgeBase([])
-        self.pairs:Set[Tuple[int,int]] =set()
-        self.have_inferred = False
-    def isUsed(self,pair)->bool:
-        return pair in self.used_pairs or (pair[1],pair[0]) in self.used_pairs
-    def getNextPair(self) -> Tuple[int,int]:
-        while self.isUsed(self.heuristic[self.start]):
-            self.start += 1
-        i = self.start
-        self.start += 1
-        return self.heuristic[i]
-    def heuristicResolve(self) -> Tuple[Tuple[int,int],List[List[CT.Predicate]],Union[Satisfaction,None]]:
-        pair = self.getNextPair()
+    # Interactive resolution, one pair of clauses at a time.
+    # Every clause owns the pairs it makes with the clauses before it. Instead of listing all pairs
+    # the queue keeps one cursor per clause: (strategy priority, clause id, next partner id),
+    # so with unit preference the pairs of short clauses come first, a step costs O(log n) and memory stays linear.
+    # Resolvents are added to the knowledge base as soon as they are found and get a cursor of their own.
+    # A journal (see snapshots.py) is told about every registration and step, to keep the context on disk.
+    def __init__(self, strategy:Union[Strategy,None] = None):
+        self.journal:Any = None
+        self.registerClauses([], strategy)
+    def registerClauses(self, kb_raw:Sequence[Sequence[CT.Predicate]], strategy:Union[Strategy,None] = None):
+        # the strategy is kept for later registrations unless a new one is given
+        if strategy is not None or not hasattr(self, "strategy"):
+            self.strategy = strategy if strategy is not None else UnitPreference()
+        self.kb = FOLKnowledgeBase([CT.Clause(clause) for clause in kb_raw])
+        self.proof = ProofDAG()
+        self.strategy.start(self.kb)
+        self.used_pairs:Set[Tuple[int,int]] = set()
+        self.queue:List[Tuple[Tuple,int,int]] = []
+        for i in range(len(self.kb.clauses)):
+            self.enqueue(i)
+        if self.journal is not None:
+            self.journal.registered(self)
+    def enqueue(self, clause_id:int):
+        if clause_id > 0:
+            heapq.heappush(self.queue, (self.strategy.priority(clause_id, self.kb.clauses[clause_id]), clause_id, 0))
+    def isUsed(self, pair:Tuple[int,int]) -> bool:
+        return (min(pair), max(pair)) in self.used_pairs
+    def canResolve(self, i:int, j:int) -> bool:
+        if i in self.kb.removed or j in self.kb.removed or self.isUsed((i, j)) or not self.strategy.allowed(i, j):
+            return False
+        return any(len(self.kb.index.complementaryIn(pred, j)) > 0 for pred in self.kb.clauses[i])
+    def nextPair(self) -> Union[Tuple[int,int],None]:
+        # the best pair not resolved yet, it stays at the front of the queue until it is used
+        while len(self.queue) > 0:
+            priority, i, j = self.queue[0]
+            if i in self.kb.removed or j >= i:
+                heapq.heappop(self.queue)
+            elif self.canResolve(j, i):
+                return (j, i)
+            else:
+                heapq.heapreplace(self.queue, (priority, i, j+1))
+        return None
+    def heuristicResolve(self) -> Tuple[Union[Tuple[int,int],None],List[CT.Clause],Union[Satisfaction,None]]:
+        if self.proof.empty is not None:
+            # refuted by an earlier step, that stays the answer
+            return None, [], Satisfaction.UNSAT
+        pair = self.nextPair()
+        if pair is None:
+            return None, [], self.saturated()
         adds, sat = self.partialResolve(pair)
         return pair, adds, sat
-    def registerClauses(self, kb_raw:List[List[CT.Predicate]]):
-        self.kb = FOLKnowledgeBase(kb_raw)
-        self.pairs = set([(i,j) for i in range(len(self.kb.clauses)) for j in range(i+1, len(self.kb.clauses))])
-        self.have_inferred = False
-        self.clauses_to_add = []
-        self.heuristic = pairIndices(sortKB(self.kb))
-        self.start = 0
-        self.used_pairs = set()
-    def partialResolve(self, picked:Tuple[int,int]) -> Tuple[List[List[CT.Predicate]],Union[Satisfaction,None]]:
-        # get rid of the pair
-        print(picked)
-        print(self.kb.clauses)
+    def steps(self) -> Iterator[Tuple[Tuple[int,int],List[CT.Clause],Union[Satisfaction,None]]]:
+        # heuristic steps until the context is decided
+        while True:
+            pair, adds, sat = self.heuristicResolve()
+            if pair is None:
+                return
+            yield pair, adds, sat
+            if sat is not None:
+                return
+    def partialResolve(self, picked:Tuple[int,int]) -> Tuple[List[CT.Clause],Union[Satisfaction,None]]:
         assert(picked[0] >= 0 and picked[0] < len(self.kb.clauses))
         assert(picked[1] >= 0 and picked[1] < len(self.kb.clauses))
-        if picked in self.pairs:
-            self.pairs.remove(picked)
-        if (picked[1],picked[0]) in self.pairs:
-            self.pairs.remove((picked[1],picked[0]))
-        self.used_pairs.add(picked)
-        for pred1 in self.kb.clauses[picked[0]]:
-            for pred2 in self.kb.clauses[picked[1]]:
-                if pred1.name == pred2.name and pred1.is_negated != pred2.is_negated:
-                    # we need to unify these two predicates
-                    substition = unify([(pred1, pred2)])
-                    if substition is not None:
-                        # we need to apply the unification to the clauses
-                        new_clause = []
-                        for pred in self.kb.clauses[picked[0]]:
-                            new_pred = substitute(substition, pred)
-                            if new_pred != pred:
-                                new_clause.append(new_pred)
-                        for pred in self.kb.clauses[picked[1]]:
-                            new_pred = substitute(substition, pred)
-                            if new_pred != pred:
-                                new_clause.append(new_pred)
-                        if len(new_clause) == 0:
-                            return [],Satisfaction.UNSAT
-                        self.clauses_to_add.append(new_clause)
-                        self.have_inferred = True
-        if len(self.pairs) == 0:
-            # We have completed the iteration
-            if not self.have_inferred:
-                return [], Satisfaction.SAT
-            for clause in self.clauses_to_add: # There is another iteration to be done
-                self.kb.clauses.append(clause)
-            clauses_to_add = self.clauses_to_add.copy()
-            self.clauses_to_add = []
-            self.have_inferred = False
-            self.pairs = set([(i,j) for i in range(len(self.kb.clauses)) for j in range(i+1, len(self.kb.clauses))])
-            self.heuristic = pairIndices(sortKB(self.kb))
-            print(self.pairs, self.heuristic)
-            self.start = 0
-            return clauses_to_add, None
-        return self.clauses_to_add, None
-    def resolve(self) -> Tuple[List[List[CT.Predicate]],Satisfaction]:
+        if self.proof.empty is not None:
+            return [], Satisfaction.UNSAT
+        self.used_pairs.add((min(picked), max(picked)))
+        clause1 = self.kb.clauses[picked[0]]
+        clause2 = self.kb.clauses[picked[1]]
+        # the positions are taken before anything is added, a resolvent may subsume the parents
+        positions = [(position1, position2) for position1, pred1 in enumerate(clause1)
+                for position2 in self.kb.index.complementaryIn(pred1, picked[1])]
+        added:List[CT.Clause] = []
+        # what the journal needs to make the step again: each inference with the clauses it subsumed
+        kept:List[Tuple[Inference,List[int]]] = []
+        sat = None
+        for position1, position2 in positions:
+            resolved = resolveLiterals(clause1, position1, clause2, position2)
+            if resolved is None:
+                continue
+            new_clause, substition, rename = resolved
+            if len(new_clause) == 0:
+                inference = Inference(new_clause, None, picked, substition, rename)
+                self.proof.record(inference)
+                kept.append((inference, []))
+                sat = Satisfaction.UNSAT
+                break
+            # only the clauses nothing else subsumes are kept
+            if self.kb.isRedundant(new_clause):
+                continue
+            subsumed = self.kb.removeSubsumedBy(new_clause)
+            if metrics.enabled:
+                metrics.count("resolvents_kept")
+            new_id = self.kb.addClause(new_clause)
+            inference = Inference(new_clause, new_id, picked, substition, rename)
+            self.proof.record(inference)
+            kept.append((inference, subsumed))
+            self.enqueue(new_id)
+            added.append(new_clause)
+        if self.journal is not None:
+            self.journal.stepped(self, picked, kept)
+        if sat is None and self.nextPair() is None:
+            sat = self.saturated()
+        return added, sat
+    def saturated(self) -> Satisfaction:
+        # what running out of pairs means. Steps only resolve, they do not factor (the client numbers
+        # the clauses it gets back), so it is only sat when no clause has a factor resolution might need
+        if not self.strategy.complete() or any(next(factors(self.kb.clauses[i]), None) is not None for i in self.kb.liveIndices()):
+            return Satisfaction.UNKNOWN
+        return Satisfaction.SAT
+    def replay(self, picked:Tuple[int,int], kept:Sequence[Tuple[Inference,Sequence[int]]]):
+        # a step from the journal, what partialResolve found is added without resolving again
+        self.used_pairs.add((min(picked), max(picked)))
+        for inference, subsumed in kept:
+            self.proof.record(inference)
+            if inference.clause_id is None:
+                continue
+            for i in subsumed:
+                self.kb.removeClause(i)
+            self.kb.addClause(inference.clause)
+            self.enqueue(inference.clause_id)
+    def refutation(self) -> List[Inference]:
+        return self.proof.refutation(self.kb.clauses)
+    def resolve(self) -> Tuple[List[CT.Clause],Satisfaction]:
         return resolution(self.kb)
 
-
-
-
-def resolve(kb: List[List[CT.Predicate]]):
+def resolve(kb: Sequence[Sequence[CT.Predicate]], engine:str = "naive", workers:Union[int,None] = None, compare_serial:bool = False,
+        limits:Union[ResourceLimits,None] = None, cancel:Union[threading.Event,None] = None, strategy:Union[Strategy,None] = None,
+        proof:Union[ProofDAG,None] = None):
     # if the bool is true, the predicate can be evaluated to true
     # kb  = prepareForResolution(clauses)
-    # print(kb.clauses)
-    added, sat =  resolution(FOLKnowledgeBase(kb))
-    return {"message": "sat", "added": added } if sat == Satisfaction.SAT else {"message": "unsat", "added": added}
+    # on unsat the result has the refutation as "proof", a list of Inference from the used
+    # registered clauses to the empty clause, when the engine made one (the fixedpoint engine does not)
+    # every derivation is recorded in proof when one is given
+    # the clauses as they were given, the chain engine makes its rules from them
+    written = [list(clause) for clause in kb]
+    clauses = [CT.Clause(clause) for clause in written]
+    budget = Budget(limits, cancel)
+    knowledge = FOLKnowledgeBase(list(clauses))
+    proof = proof if proof is not None else ProofDAG()
+    added, sat = collect(iterEngine(knowledge, engine, budget, workers, strategy, written), proof,
+            chosenEngine(clauses, engine, strategy) == "given_clause")
+    result:Dict[str,Any] = {"message": STATUS_MESSAGES[sat], "added": added}
+    if sat == Satisfaction.UNSAT and proof.empty is not None:
+        result["proof"] = proof.refutation(knowledge.clauses)
+    if limits is not None:
+        result["stats"] = budget.stats()
+    if engine == "parallel":
+        stats = result.setdefault("stats", {})
+        stats["workers"] = workers if workers is not None else (os.cpu_count() or 1)
+        stats["elapsed"] = budget.elapsed()
+        if compare_serial:
+            started = time.perf_counter()
+            resolution(FOLKnowledgeBase(list(clauses)), Budget(limits))
+            stats["serial_elapsed"] = time.perf_counter() - started
+            stats["speedup"] = stats["serial_elapsed"] / stats["elapsed"] if stats["elapsed"] > 0 else None
+    return result
 def resolveHornType(clauses: CT.Clauses):
     # if the bool is true, the predicate can be evaluated to true
     kb  = prepareForResolution(clauses)
-    # print(kb.clauses)
-    return {"message": "sat" } if resolution(kb) == Satisfaction.SAT else {"message": "unsat"}
-horn_clauses = [
-        CT.HornClause(None, [CT.Predicate("b", ["g(X)"], False)]),
-        CT.HornClause(CT.Predicate("b", ["f(Y)"], False), [])
-        ]
-sat_clauses = CT.SatClause("a", [CT.Predicate("c", ["X"], False), CT.Predicate("d", ["X"], False)])
-
-# Come up with a simple unsatisfiable CNF
-# a(X) :- b(X)
-# b(X) :- c(X)
-# c(X) :- d(X)
-# c(X) v d(X)
-#
-fol_sentences = CT.Clauses(horn_clauses, [sat_clauses])
-print(unify([(CT.Predicate("P",["X"],False),CT.Predicate("P",["x"],False))]))
-print(unify([(CT.Predicate("Q",["X"],False),CT.Predicate("P",["x"],False))]))
-print(unify([(CT.Predicate("P",["X", "f(X)"],False),CT.Predicate("P",["x","y"],False))]))
-print(unify([(CT.Predicate("P",["X", "Y", "Z"],False),CT.Predicate("P",["x","Z", "y"],False))]))
-print(unify([(CT.Predicate("P",["X", "Y", "Z"],False),CT.Predicate("P",["x", "Z", "f(x)"],False))]))
-
-print(resolveHornType(fol_sentences))
+    return {"message": resolve(kb.clauses, AUTO_ENGINE)["message"]}
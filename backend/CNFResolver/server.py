@@ -1,15 +1,303 @@
-from http.server import BaseHTTPRequestHandler, HTTPServer
-import json, cgi
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl
+import hashlib
+import json
 
 
 import resolver
 import clauseTypes as CT
+import cache
+import loader
+import metrics
+import wire
+from sessions import SessionStore
+import snapshots
 
-context = resolver.Context()
+# one resolution context per client, clients that do not send a session id share the default one,
+# with a snapshot directory every context is also kept on disk (see snapshots.py) and survives restarts,
+# until its session expires, is pushed out or is closed
+snapshotDirectory = None
+snapshotStore = snapshots.SnapshotStore(snapshotDirectory) if snapshotDirectory is not None else None
+sessions = SessionStore(resolver.Context, load=snapshotStore.open if snapshotStore is not None else None,
+        evicted=snapshotStore.remove if snapshotStore is not None else None)
+defaultSession = "default"
 
 # Config
 hostName = "localhost"
 serverPort = 9000
+# Saturation may never finish on satisfiable first order inputs,
+# every / request runs within these limits, a request can only ask for tighter ones
+serverLimits = resolver.ResourceLimits(max_seconds=30, max_inferences=500000, max_clauses=100000, max_memory_mb=1024)
+# decided results of / and parsed registrations, see cache.py, a path keeps them on disk as well
+resultCacheEntries = 1024
+resultCacheBytes = 64*1024*1024
+resultCachePath = None
+results = cache.ResultCache(resultCacheEntries, resultCacheBytes, resultCachePath)
+# counters and phase timings of the search (see metrics.py) for /metrics, off since they cost a little on every
+# unification, a / or /resolvent request with 'metrics': true gets its own in the response either way
+collectMetrics = False
+metrics.enable(collectMetrics)
+
+def requestedLimit(requested, name, kind):
+    # a limit from the request, missing or null is no limit
+    value = requested.get(name)
+    if value is None:
+        return None
+    if isinstance(value, bool) or not isinstance(value, kind) or value < 0:
+        raise ValueError(f"limit {name} must be a non-negative {'integer' if kind is int else 'number'}, not {json.dumps(value)}")
+    return value
+
+def limitsFromRequest(message) -> resolver.ResourceLimits:
+    requested = message.get('limits', {})
+    if not isinstance(requested, dict):
+        raise ValueError("limits must be an object")
+    return serverLimits.capped(resolver.ResourceLimits(
+        requestedLimit(requested, 'seconds', (int, float)),
+        requestedLimit(requested, 'inferences', int),
+        requestedLimit(requested, 'clauses', int),
+        requestedLimit(requested, 'memory_mb', (int, float))))
+
+# 'strategy' picks the clause selection of the given-clause engine, which becomes the default engine then,
+# 'support' lists the (1 based) clauses in the set of support for the sos strategy.
+# Without either the engine is naive resolution, 'engine': 'auto' answers Horn clause sets with the z3 fixedpoint
+# engine instead, which is faster but derives no clauses, so 'added' is empty and there is no 'proof'.
+# 'engine': 'chain' does the same by chaining over fact tables, bodies are proved in the order they were written.
+def supportFromRequest(message):
+    return {int(i)-1 for i in message['support']} if 'support' in message else None
+
+def strategyFromRequest(message):
+    if 'strategy' not in message:
+        return None
+    return resolver.makeStrategy(message['strategy'], supportFromRequest(message))
+
+def engineFromRequest(message):
+    return message.get('engine', 'given_clause' if 'strategy' in message else 'naive')
+
+def usesCache(message) -> bool:
+    # 'cache': false always runs the search, on the clauses exactly as they were sent
+    return message.get('cache', True) is not False and not message.get('compare_serial', False)
+
+def requestKey(message) -> str:
+    # the limits do not change a decided answer, metrics are added to the answer afterwards
+    options = {key: value for key, value in message.items() if key not in ('limits', 'metrics')}
+    return "request:" + hashlib.sha256(json.dumps(options, sort_keys=True).encode('utf-8')).hexdigest()
+
+def parseCached(texts):
+    # the parsed clauses of a registration sent before
+    key = "parse:" + hashlib.sha256("\n".join(texts).encode('utf-8')).hexdigest()
+    clauses = results.get(key)
+    if clauses is None:
+        clauses = CT.parseClauses(texts)
+        results.put(key, clauses)
+    return clauses
+
+# The request handling itself, shared by this server and the asyncio one in asyncServer.py
+# A request sent before is answered with the response it got then, without parsing the clauses again,
+# and clause sets that are the same up to order and variable names share their search (see cache.py).
+# Such answers have 'cached': true.
+def resolveMessage(message, cancel=None):
+    return measured(message, lambda: answerMessage(message, cancel))
+
+def answerMessage(message, cancel=None):
+    #TODO: Format for prolog
+    if not usesCache(message):
+        return resolveClauses(CT.parseClauses(message['clauses'], written=True), message, cancel)
+    # the limits are not part of the key, a bad one is still a bad request
+    limitsFromRequest(message)
+    key = requestKey(message)
+    returnData = results.get(key)
+    if returnData is not None:
+        return {**returnData, 'cached': True}
+    returnData = resolveClauses(CT.parseClauses(message['clauses'], written=True), message, cancel)
+    if returnData.get('message') in cache.DECIDED:
+        results.put(key, returnData)
+    return returnData
+
+def resolveClauses(CNFData, message, cancel=None):
+    #TODO: Parse Prolog data
+    if usesCache(message):
+        prologData = cache.cachedResolve(results, CNFData, engineFromRequest(message), message.get('workers'), limitsFromRequest(message), cancel,
+                message.get('strategy'), supportFromRequest(message))
+    else:
+        prologData = resolver.resolve(CNFData, engineFromRequest(message), message.get('workers'), message.get('compare_serial', False),
+                limitsFromRequest(message), cancel, strategyFromRequest(message)) #Format {'hello': 'world', 'received': 'ok'}
+    if prologData == None:
+        returnData = {'error': 'Error in resolving'}
+    returnData = prologData
+    return encodeClauses(returnData, message, wire.Encoder())
+
+# 'encoding': 'compact' sends clauses as integer lists over a symbol table (see wire.py) instead of strings,
+# the encoder only sends the symbols the client does not have yet, 'symbols' tells how many it has,
+# a count that is not what the server sent it gets the whole table again.
+# On unsat 'proof' lists the steps of the refutation, 'added': false leaves out everything else that was derived.
+def encodeClauses(returnData, message, encoder:wire.Encoder):
+    with metrics.timed("serialize"):
+        return encodeFields(returnData, message, encoder)
+
+def encodeFields(returnData, message, encoder:wire.Encoder):
+    compact = message.get('encoding') == 'compact'
+    if message.get('added', True) is False:
+        returnData.pop('added', None)
+    if 'proof' in returnData:
+        returnData['proof'] = [inferenceFields(step, encoder if compact else None) for step in returnData['proof']]
+    if compact:
+        return encoder.encode(returnData, known=message.get('symbols'))
+    if 'added' in returnData:
+        returnData['added'] = CT.clausesToString(returnData['added'])
+    return returnData
+
+# /stream sends every clause as soon as the engine keeps it, one JSON object per event,
+# the last event has the final message and the stats instead of a clause
+def inferenceFields(inference:resolver.Inference, encoder=None):
+    # ids are 1 based like the pairs of /resolvent, registered clauses have no parents
+    return {'clause': CT.clauseToString(inference.clause) if encoder is None else encoder.clause(inference.clause),
+            'id': inference.clause_id+1 if inference.clause_id is not None else None,
+            'parents': [parent+1 for parent in inference.parents],
+            'unifier': inference.unifier()}
+
+def inferenceEvent(inference:resolver.Inference, encoder=None):
+    event = inferenceFields(inference, encoder)
+    if encoder is not None:
+        event['symbols'] = encoder.delta()
+    return event
+
+def streamMessage(message, cancel=None):
+    # the clauses, engine, strategy and limits are checked here, before anything is sent,
+    # so a bad request still gets a 400 (ValueError), the events come from the generator returned
+    written = CT.parseClauses(message['clauses'], written=True)
+    budget = resolver.Budget(limitsFromRequest(message), cancel)
+    inferences = resolver.iterEngine(resolver.FOLKnowledgeBase([CT.Clause(clause) for clause in written]), engineFromRequest(message), budget,
+            message.get('workers'), strategyFromRequest(message), written)
+    encoder = wire.Encoder() if message.get('encoding') == 'compact' else None
+    return streamEvents(inferences, budget, encoder)
+
+def streamEvents(inferences:resolver.Inferences, budget:resolver.Budget, encoder=None):
+    # once the response has started, a failure is the last event
+    try:
+        while True:
+            try:
+                inference = next(inferences)
+            except StopIteration as stop:
+                yield {'message': resolver.STATUS_MESSAGES[stop.value], 'stats': budget.stats()}
+                return
+            yield inferenceEvent(inference, encoder)
+    except Exception as error:
+        yield {'error': 'Error in resolving', 'detail': str(error)}
+    finally:
+        inferences.close()
+
+def streamLine(event, sse:bool) -> bytes:
+    # a line of NDJSON, or a server sent event when the client asked for text/event-stream
+    line = json.dumps(event)
+    return (f"data: {line}\n\n" if sse else line + "\n").encode('utf-8')
+
+def wantsEvents(accept) -> bool:
+    return 'text/event-stream' in (accept or '')
+
+# /upload takes a clause file as the request body, read line by line while it is parsed.
+# The query string holds the options: format (native, tptp or dimacs), strategy, support,
+# and resolve to run the search like / instead of registering the clauses in the session,
+# which takes the other options of / as well. Goal clauses of a TPTP file make up the set of support unless support is given.
+# Flags are true or false (1 or 0, a bare ?resolve is true), anything else is a bad request.
+FLAGS = {'true': True, '1': True, '': True, 'false': False, '0': False}
+FLAG_OPTIONS = ('resolve', 'cache', 'added', 'compare_serial')
+
+def uploadOptions(query):
+    options = dict(parse_qsl(query, keep_blank_values=True))
+    for name in FLAG_OPTIONS:
+        if name in options:
+            if options[name].lower() not in FLAGS:
+                raise ValueError(f"{name}={options[name]} is neither true nor false")
+            options[name] = FLAGS[options[name].lower()]
+    return options
+
+def uploadMessage(lines, options, session_id, cancel=None):
+    clauses, goals = loader.collectClauses(loader.readClauses(lines, options.get('format', 'native')))
+    if 'support' in options:
+        options['support'] = options['support'].split(',')
+    elif len(goals) > 0:
+        options['support'] = [i+1 for i in goals]
+    if 'workers' in options:
+        options['workers'] = int(options['workers'])
+    if options.get('resolve', False):
+        return resolveClauses(clauses, options, cancel)
+    session = sessions.get(options.get('session', session_id))
+    with session.lock:
+        session.context.registerClauses(clauses, strategyFromRequest(options))
+    return {'session': session.session_id, 'clauses': len(clauses), 'goals': len(goals)}
+
+def bodyLines(stream, length):
+    # the request body as lines of text, without reading all of it at once
+    pending = b""
+    while length > 0:
+        chunk = stream.readline(min(length, 1 << 16))
+        if len(chunk) == 0:
+            break
+        length -= len(chunk)
+        if not chunk.endswith(b"\n") and length > 0:
+            pending += chunk
+            continue
+        yield (pending + chunk).decode('utf-8')
+        pending = b""
+    if len(pending) > 0:
+        yield pending.decode('utf-8')
+
+def resolventMessage(message, session_id):
+    return measured(message, lambda: stepMessage(message, session_id))
+
+# 'close': true ends the session, its context goes and so does its log
+def stepMessage(message, session_id):
+    if message.get('close', False) is True:
+        session_id = message.get('session', session_id)
+        sessions.drop(session_id)
+        return {'session': session_id, 'closed': True}
+    session = sessions.get(message.get('session', session_id))
+    with session.lock:
+        returnData = stepContext(session.context, message)
+        if 'added' in returnData:
+            # one symbol table per session, every step only sends what is new
+            returnData = encodeClauses(returnData, message, session.state.setdefault('encoder', wire.Encoder()))
+    returnData['session'] = session.session_id
+    return returnData
+
+def stepContext(context:resolver.Context, message):
+    returnData = {}
+
+    if "register" in message:
+        context.registerClauses(parseCached(message['register']), strategyFromRequest(message))
+    if "pairs" in message:
+        pair_zero_indexed = (int(message['pairs'][0])-1, int(message['pairs'][1])-1)
+        addeds,sat = context.partialResolve(pair_zero_indexed)
+        sat_str = resolver.STATUS_MESSAGES[sat] if sat is not None else "still going on"
+        returnData = {'added': addeds, 'message': sat_str}
+        if sat == resolver.Satisfaction.UNSAT:
+            returnData['proof'] = context.refutation()
+    if "heuristic" in message:
+        pair,addeds,sat = context.heuristicResolve()
+        sat_str = resolver.STATUS_MESSAGES[sat] if sat is not None else "still going on"
+        returnData = {'added': addeds, 'message': sat_str, 'pair': list(pair) if pair is not None else []}
+        if sat == resolver.Satisfaction.UNSAT:
+            returnData['proof'] = context.refutation()
+    return returnData
+
+# 'metrics': true adds the counters and timings of answering the request to the response,
+# the serialization of the response itself comes after and is not in them
+def measured(message, answer):
+    if not message.get('metrics', False):
+        return answer()
+    with metrics.recording() as recorded:
+        returnData = answer()
+    return {**returnData, 'metrics': recorded.snapshot()}
+
+# /metrics has the totals since they were switched on, with the result cache,
+# a POST can switch them with 'enabled' and start them over with 'reset': true after they are read
+def metricsMessage(message):
+    if 'enabled' in message:
+        metrics.enable(bool(message['enabled']))
+    returnData = {'enabled': metrics.recordTotals, **metrics.totals.snapshot(), 'cache': results.stats()}
+    if message.get('reset', False):
+        metrics.totals.reset()
+    return returnData
 
 # Server HTTP Request Handling
 class Server(BaseHTTPRequestHandler):
@@ -18,51 +306,59 @@ class Server(BaseHTTPRequestHandler):
         self.send_header('Access-Control-Allow-Methods', 'GET, OPTIONS, POST')
         self.send_header("Access-Control-Allow-Headers", "X-Requested-With")
         self.send_header("Access-Control-Allow-Headers", "Content-Type")
+        self.send_header("Access-Control-Allow-Headers", "X-Session-Id")
         self.end_headers()
+    def readMessage(self):
+        length = int(self.headers['Content-Length'])
+        return json.loads(self.rfile.read(length))
     def resolve(self):
         # Read message & convert to python class
-        length = int(self.headers['Content-Length'])
-        message = json.loads(self.rfile.read(length))
-
-        #TODO: Format for prolog
-        CNFData = CT.parseClauses(message['clauses'])
-
-        #TODO: Parse Prolog data
-        prologData = resolver.resolve(CNFData) #Format {'hello': 'world', 'received': 'ok'}
-        if prologData == None:
-            returnData = {'error': 'Error in resolving'}
-        returnData = prologData
-        return returnData
+        return resolveMessage(self.readMessage())
     def getResolvant(self):
-        global context
-        length = int(self.headers['Content-Length'])
-        message = json.loads(self.rfile.read(length))
-        returnData = {}
-
-        if "register" in message:
-            context.registerClauses(CT.parseClauses(message['register']))
-        if "pairs" in message:
-            pair_zero_indexed = (int(message['pairs'][0])-1, int(message['pairs'][1])-1)
-            addeds,sat = context.partialResolve(pair_zero_indexed)
-            if sat == resolver.Satisfaction.SAT:
-                sat_str = "sat"
-            elif sat == resolver.Satisfaction.UNSAT:
-                sat_str = "unsat"
-            else:
-                sat_str = "still going on"
-            returnData = {'added': CT.clausesToString(addeds), 'message': sat_str}
-        if "heuristic" in message:
-            pair,addeds,sat = context.heuristicResolve()
-            if sat == resolver.Satisfaction.SAT:
-                sat_str = "sat"
-            elif sat == resolver.Satisfaction.UNSAT:
-                sat_str = "unsat"
-            else:
-                sat_str = "still going on"
-            returnData = {'added': CT.clausesToString(addeds), 'message': sat_str, 'pair': list(pair)}
-        return returnData
+        return resolventMessage(self.readMessage(), self.headers.get('X-Session-Id', defaultSession))
+    def stream(self, events):
+        # no Content-Length, the response ends when the connection is closed
+        sse = wantsEvents(self.headers.get('Accept'))
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream" if sse else "application/x-ndjson")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        try:
+            for event in events:
+                self.wfile.write(streamLine(event, sse))
+                self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            # the client went away, closing the generator stops the search
+            pass
+        finally:
+            events.close()
+        self.close_connection = True
+    def upload(self, query):
+        length = int(self.headers.get('Content-Length', 0))
+        try:
+            returnData = uploadMessage(bodyLines(self.rfile, length), uploadOptions(query), self.headers.get('X-Session-Id', defaultSession))
+            status = 200
+        except ValueError as error:
+            returnData = {'message': str(error)}
+            status = 400
+            # whatever is left of the body is not a request
+            self.close_connection = True
+        self.reply(status, returnData)
+    def reply(self, status, returnData):
+        # JSON, or msgpack for clients that accept it
+        body, ctype = wire.serialize(returnData, self.headers.get('Accept'))
+        self.send_response(status)
+        self.send_header("Content-Type", ctype)
+        self.end_headers()
+        self.wfile.write(body)
     def do_POST(self): # What to do upon receiving POST Request
-        ctype, pdict = cgi.parse_header(self.headers["Content-Type"])
+        path, _, query = self.path.partition('?')
+        if path == '/upload':
+            self.upload(query)
+            return True
+
+        ctype = self.headers.get_content_type()
 
         # Check correct file type
         if ctype != 'application/json':
@@ -72,22 +368,41 @@ class Server(BaseHTTPRequestHandler):
             return
 
         returnData = {}
-        if self.path == '/':
-            returnData = self.resolve()
-        elif self.path == '/resolvent':
-            returnData = self.getResolvant()
+        try:
+            if self.path == '/stream':
+                # checked before the 200 is sent, the stream itself is written below
+                events = streamMessage(self.readMessage())
+            elif self.path == '/':
+                returnData = self.resolve()
+            elif self.path == '/resolvent':
+                returnData = self.getResolvant()
+            elif self.path == '/metrics':
+                returnData = metricsMessage(self.readMessage())
+        except ValueError as error:
+            # a body that is not JSON or a clause that does not parse, same answers as asyncServer.py
+            self.reply(400, {'message': str(error)})
+            return True
+        except Exception as error:
+            self.reply(500, {'error': 'Error in resolving', 'detail': str(error)})
+            return True
 
+        if self.path == '/stream':
+            self.stream(events)
+            return True
         #TODO: Generate Return
-        self.send_response(200)
-        self.send_header("Content-Type", "text/json")
-        self.end_headers()
-        self.wfile.write(json.dumps(returnData).encode('utf-8'))
+        self.reply(200, returnData)
         return True
+    def do_GET(self):
+        if self.path.partition('?')[0] == '/metrics':
+            self.reply(200, metricsMessage({}))
+        else:
+            self.reply(404, {'message': 'not found'})
     def end_headers(self) -> None:
         self.send_header("Access-Control-Allow-Origin", "*")
         return super().end_headers()
 if __name__ == "__main__":
-    webServer = HTTPServer((hostName, serverPort), Server)
+    webServer = ThreadingHTTPServer((hostName, serverPort), Server)
+    webServer.daemon_threads = True
     print("Server started http://%s:%s" % (hostName, serverPort))
 
     try:
@@ -0,0 +1,78 @@
+from collections import OrderedDict
+from typing import Any,Callable,Dict,Union
+import threading
+import time
+import uuid
+
+# Every client gets its own resolution context, looked up by a session id.
+# The store is an LRU: using a session moves it to the back, when there are too many
+# the least recently used one is dropped, and sessions idle for longer than the ttl expire.
+# Each session has its own lock so requests of one client are serialized
+# while different clients run at the same time.
+# With load the context of a session not in memory comes from load(session id) instead of the factory,
+# the server uses it to pick sessions up from disk after a restart. Loading may read a whole log,
+# so it runs outside the store lock, if two requests load the same session the first one in wins.
+# evicted(session id, context) is called for every session that is dropped, expires or is pushed out,
+# the server closes the journal of the context and removes its log then.
+
+class Session:
+    def __init__(self, session_id:str, context:Any):
+        self.session_id = session_id
+        self.context = context
+        # anything else the server keeps for this client
+        self.state:Dict[str,Any] = {}
+        self.lock = threading.Lock()
+        self.last_used = time.monotonic()
+
+class SessionStore:
+    def __init__(self, factory:Callable[[], Any], max_sessions:int = 256, ttl_seconds:float = 30*60,
+            load:Union[Callable[[str], Any],None] = None, evicted:Union[Callable[[str, Any], None],None] = None):
+        self.factory = factory
+        self.load = load
+        self.evicted = evicted
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        self.sessions:"OrderedDict[str,Session]" = OrderedDict()
+        self.lock = threading.Lock()
+    @staticmethod
+    def newId() -> str:
+        return uuid.uuid4().hex
+    def evict(self, session_id:str):
+        # with the lock held
+        session = self.sessions.pop(session_id)
+        if self.evicted is not None:
+            self.evicted(session_id, session.context)
+    def expire(self, now:float):
+        # the oldest sessions are at the front, stop at the first one still alive
+        while len(self.sessions) > 0:
+            session = next(iter(self.sessions.values()))
+            if now - session.last_used <= self.ttl_seconds:
+                break
+            self.evict(session.session_id)
+    def get(self, session_id:Union[str,None]) -> Session:
+        # the session with this id, made on first use, a new id is picked when there is none
+        session_id = session_id if session_id else self.newId()
+        with self.lock:
+            now = time.monotonic()
+            self.expire(now)
+            session = self.sessions.get(session_id)
+            if session is not None:
+                self.sessions.move_to_end(session_id)
+                session.last_used = now
+                return session
+        context = self.load(session_id) if self.load is not None else self.factory()
+        with self.lock:
+            session = self.sessions.get(session_id)
+            if session is None:
+                session = Session(session_id, context)
+                self.sessions[session_id] = session
+                while len(self.sessions) > self.max_sessions:
+                    self.evict(next(iter(self.sessions)))
+            else:
+                self.sessions.move_to_end(session_id)
+            session.last_used = time.monotonic()
+            return session
+    def drop(self, session_id:str):
+        with self.lock:
+            if session_id in self.sessions:
+                self.evict(session_id)
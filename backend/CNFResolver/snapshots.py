@@ -0,0 +1,208 @@
+import argparse
+import hashlib
+import mmap
+import os
+import pickle
+import struct
+import sys
+import threading
+from array import array
+from typing import Any,Iterator,List,Sequence,Tuple,Union
+import loader
+import resolver
+
+# Contexts kept on disk, one append-only log per context.
+# A record is a pickled tuple behind its length (4 bytes, little endian). A log starts with a state
+# record holding everything the context needs: the strategy after it started, the clauses, the
+# subsumed ones, the used pairs, the pair queue and the proof DAG. Registering clauses writes a new
+# state, every step appends what it found: the pair, and each kept inference with the clauses it subsumed.
+# Replaying a step adds those clauses back without resolving anything again.
+# After compactEvery steps the log is compacted: the current state goes to a temporary file that is
+# renamed over the log, so a crash leaves either the old log or the new one. A record cut short
+# by a crash is dropped when the log is read.
+# Logs are read through mmap, and the server only reads the one of a session when it is asked for.
+# A log is written from the first registration on, and removed when the server drops its session,
+# the journal is closed then so a request still running on the session does not write it again.
+# pickle recurses into terms, a context with a term too deep to pickle is only kept in memory, its log is removed.
+# Records are unpickled, only load logs this code wrote.
+
+compactEvery = 1024
+HEADER = struct.Struct("<I")
+
+State = Tuple[Any,...]
+
+def contextState(context:resolver.Context) -> State:
+    proof = context.proof
+    return ("state", context.strategy, context.kb.clauses, sorted(context.kb.removed), sorted(context.used_pairs),
+            context.queue, proof.parents.tobytes(), proof.unifiers, proof.empty)
+
+def restoreState(context:resolver.Context, state:State):
+    _, strategy, clauses, removed, used_pairs, queue, parents, unifiers, empty = state
+    # the strategy already saw the clauses it started with, it is not started again
+    context.strategy = strategy
+    context.kb = resolver.FOLKnowledgeBase(list(clauses))
+    for i in removed:
+        context.kb.removeClause(i)
+    context.used_pairs = set(used_pairs)
+    context.queue = list(queue)
+    context.proof = resolver.ProofDAG()
+    context.proof.parents = array("q")
+    context.proof.parents.frombytes(parents)
+    context.proof.unifiers = list(unifiers)
+    context.proof.empty = empty
+
+def readRecords(path:str) -> Iterator[Tuple[int,Any]]:
+    # (offset after the record, record) for every whole record
+    with open(path, "rb") as log:
+        if os.fstat(log.fileno()).st_size == 0:
+            return
+        with mmap.mmap(log.fileno(), 0, access=mmap.ACCESS_READ) as view:
+            offset = 0
+            while offset + HEADER.size <= len(view):
+                (length,) = HEADER.unpack_from(view, offset)
+                end = offset + HEADER.size + length
+                if end > len(view):
+                    break
+                yield end, pickle.loads(view[offset+HEADER.size:end])
+                offset = end
+
+def removeLog(path:str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+class Journal:
+    # the log of one context, attached as context.journal
+    def __init__(self, path:str, compact_every:Union[int,None] = None):
+        self.path = path
+        self.compact_every = compact_every if compact_every is not None else compactEvery
+        self.steps = 0
+        # held while writing, a closed journal writes nothing
+        self.lock = threading.Lock()
+        self.closed = False
+    def close(self):
+        with self.lock:
+            self.closed = True
+    def serialized(self, record:Any) -> Union[bytes,None]:
+        try:
+            return pickle.dumps(record, pickle.HIGHEST_PROTOCOL)
+        except (RecursionError, pickle.PicklingError):
+            # the log would miss this record, from here on the context is only in memory
+            self.closed = True
+            removeLog(self.path)
+            return None
+    def append(self, record:Any):
+        data = self.serialized(record)
+        if data is None:
+            return
+        with open(self.path, "ab") as log:
+            log.write(HEADER.pack(len(data)) + data)
+    def compact(self, context:resolver.Context):
+        data = self.serialized(contextState(context))
+        if data is None:
+            return
+        temporary = self.path + ".tmp"
+        with open(temporary, "wb") as log:
+            log.write(HEADER.pack(len(data)) + data)
+            log.flush()
+            os.fsync(log.fileno())
+        os.replace(temporary, self.path)
+        self.steps = 0
+    def registered(self, context:resolver.Context):
+        with self.lock:
+            if not self.closed:
+                self.compact(context)
+    def stepped(self, context:resolver.Context, picked:Tuple[int,int], kept:Sequence[Tuple[resolver.Inference,Sequence[int]]]):
+        with self.lock:
+            if self.closed:
+                return
+            self.steps += 1
+            if self.steps >= self.compact_every or not os.path.exists(self.path):
+                # steps only make sense after a state
+                self.compact(context)
+            else:
+                self.append(("step", picked, list(kept)))
+
+def loadContext(path:str, compact_every:Union[int,None] = None) -> Union[resolver.Context,None]:
+    # the context the log at path ends with and its journal, None if there is no log
+    if not os.path.exists(path):
+        return None
+    context = resolver.Context()
+    journal = Journal(path, compact_every)
+    whole = 0
+    for whole, record in readRecords(path):
+        if record[0] == "state":
+            restoreState(context, record)
+            journal.steps = 0
+        else:
+            _, picked, kept = record
+            context.replay(picked, kept)
+            journal.steps += 1
+    if whole < os.path.getsize(path):
+        # the last record was cut short, later ones go right after the whole ones
+        with open(path, "r+b") as log:
+            log.truncate(whole)
+    context.journal = journal
+    return context
+
+class SnapshotStore:
+    # the logs of the server sessions, one file per session in directory
+    def __init__(self, directory:str, compact_every:Union[int,None] = None):
+        self.directory = directory
+        self.compact_every = compact_every
+        os.makedirs(directory, exist_ok=True)
+    def path(self, session_id:str) -> str:
+        # session ids come from clients, the file name is their hash
+        return os.path.join(self.directory, hashlib.sha256(session_id.encode("utf-8")).hexdigest() + ".log")
+    def open(self, session_id:str) -> resolver.Context:
+        # the context of the session as it was last written, or a new one that is written once it registers clauses
+        path = self.path(session_id)
+        context = loadContext(path, self.compact_every)
+        if context is None:
+            context = resolver.Context()
+            context.journal = Journal(path, self.compact_every)
+        return context
+    def remove(self, session_id:str, context:Union[resolver.Context,None] = None):
+        # the journal of the context is closed first, a step it is writing finishes before the log goes
+        if context is not None and context.journal is not None:
+            context.journal.close()
+        removeLog(self.path(session_id))
+
+def main(argv:List[str]) -> int:
+    # a long saturation that can be stopped and picked up again, run the same command to resume
+    parser = argparse.ArgumentParser(description="step a resolution context with its state kept in a log")
+    parser.add_argument("log", help="the log to resume from, made on the first run")
+    parser.add_argument("clauses", nargs="?", help="clause file for the first run")
+    parser.add_argument("--format", choices=loader.FORMATS, help="clause file format, guessed from the suffix by default")
+    parser.add_argument("--strategy", choices=sorted(resolver.STRATEGIES), default="unit")
+    parser.add_argument("--max-steps", type=int, help="stop after this many steps, the log keeps the state")
+    args = parser.parse_args(argv)
+
+    context = loadContext(args.log)
+    if context is None:
+        if args.clauses is None:
+            parser.error(f"{args.log} does not exist yet, give the clause file to start from")
+        clauses, goals = loader.collectClauses(loader.loadClauses(args.clauses, args.format))
+        context = resolver.Context()
+        context.journal = Journal(args.log)
+        context.registerClauses(clauses, resolver.makeStrategy(args.strategy, goals if len(goals) > 0 else None))
+    steps = 0
+    status = "still going on"
+    if context.proof.empty is not None:
+        # refuted on an earlier run
+        print(f"unsat after {steps} steps, {len(context.kb.clauses)} clauses")
+        return 0
+    for _, _, sat in context.steps():
+        steps += 1
+        if sat is not None:
+            status = resolver.STATUS_MESSAGES[sat]
+        elif args.max_steps is not None and steps >= args.max_steps:
+            break
+    if status == "still going on" and context.nextPair() is None:
+        status = resolver.STATUS_MESSAGES[context.saturated()]
+    print(f"{status} after {steps} steps, {len(context.kb.clauses)} clauses")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
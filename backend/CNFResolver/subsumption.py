@@ -0,0 +1,118 @@
+from typing import Dict,Iterator,List,Set,Tuple,Union
+import clauseTypes as CT
+
+# Clause C subsumes clause D if some substitution maps the literals of C
+# onto distinct literals of D. Such a C makes D redundant for resolution.
+#
+# Candidates are found with a feature vector index (as in E's FVI):
+# every feature below can only grow when going from C to a clause it subsumes,
+# so subsumers of D have vectors <= D's vector and clauses subsumed by C have vectors >= C's.
+# The vectors are stored in a trie with one level per feature.
+
+FEATURE_BUCKETS = 4
+
+Binding = Dict[str,Union[str,CT.FOLFunction]]
+
+def termDepth(term:Union[str,CT.FOLFunction]) -> int:
+    depth = 0
+    stack = [(term, 1)]
+    while len(stack) > 0:
+        current, level = stack.pop()
+        depth = max(depth, level)
+        if type(current) == CT.FOLFunction:
+            stack.extend((arg, level+1) for arg in current.args)
+    return depth
+
+def featureVector(clause:CT.Clause) -> Tuple[int,...]:
+    # positive count, negative count, per bucket literal counts for each polarity, deepest term
+    positives = 0
+    negatives = 0
+    buckets = [0]*(2*FEATURE_BUCKETS)
+    depth = 0
+    for predicate in clause:
+        if predicate.is_negated:
+            negatives += 1
+            buckets[FEATURE_BUCKETS + hash(predicate.name) % FEATURE_BUCKETS] += 1
+        else:
+            positives += 1
+            buckets[hash(predicate.name) % FEATURE_BUCKETS] += 1
+        for arg in predicate.args:
+            depth = max(depth, termDepth(arg))
+    return (positives, negatives, *buckets, depth)
+
+def matchLiteral(pattern:CT.Predicate, target:CT.Predicate, binding:Binding) -> Union[Binding,None]:
+    # one way unification, only the variables of pattern may be bound
+    if pattern.name != target.name or pattern.is_negated != target.is_negated or len(pattern.args) != len(target.args):
+        return None
+    new_binding = binding.copy()
+    stack = list(zip(pattern.args, target.args))
+    while len(stack) > 0:
+        p, t = stack.pop()
+        if type(p) == CT.FOLFunction:
+            if type(t) != CT.FOLFunction or p.name != t.name or len(p.args) != len(t.args):
+                return None
+            stack.extend(zip(p.args, t.args))
+        elif p.isupper():
+            if p not in new_binding:
+                new_binding[p] = t
+            elif new_binding[p] != t:
+                return None
+        elif p != t:
+            return None
+    return new_binding
+
+def subsumes(general:CT.Clause, specific:CT.Clause) -> bool:
+    if len(general) > len(specific):
+        return False
+    def search(i:int, binding:Binding, used:Set[int]) -> bool:
+        if i == len(general):
+            return True
+        for j, target in enumerate(specific):
+            if j in used:
+                continue
+            extended = matchLiteral(general[i], target, binding)
+            if extended is not None:
+                used.add(j)
+                if search(i+1, extended, used):
+                    return True
+                used.remove(j)
+        return False
+    return search(0, {}, set())
+
+class SubsumptionIndex:
+    def __init__(self):
+        self.root:Dict = {}
+        self.clauses:Dict[int,CT.Clause] = {}
+        self.vectors:Dict[int,Tuple[int,...]] = {}
+    def add(self, clause_id:int, clause:CT.Clause):
+        vector = featureVector(clause)
+        node = self.root
+        for value in vector:
+            node = node.setdefault(value, {})
+        node.setdefault(None, set()).add(clause_id)
+        self.clauses[clause_id] = clause
+        self.vectors[clause_id] = vector
+    def remove(self, clause_id:int):
+        vector = self.vectors.pop(clause_id, None)
+        if vector is None:
+            return
+        del self.clauses[clause_id]
+        node = self.root
+        for value in vector:
+            node = node[value]
+        node[None].discard(clause_id)
+    def candidates(self, vector:Tuple[int,...], smaller:bool) -> Iterator[int]:
+        # ids whose vectors are all <= vector (smaller) or all >= vector (not smaller)
+        stack = [(self.root, 0)]
+        while len(stack) > 0:
+            node, level = stack.pop()
+            if level == len(vector):
+                yield from node.get(None, ())
+                continue
+            for value, child in node.items():
+                if (value <= vector[level]) if smaller else (value >= vector[level]):
+                    stack.append((child, level+1))
+    def forwardSubsumed(self, clause:CT.Clause) -> bool:
+        return any(subsumes(self.clauses[i], clause) for i in self.candidates(featureVector(clause), True))
+    def backwardSubsumed(self, clause:CT.Clause) -> List[int]:
+        return [i for i in list(self.candidates(featureVector(clause), False)) if subsumes(clause, self.clauses[i])]
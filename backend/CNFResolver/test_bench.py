@@ -0,0 +1,9 @@
+import json
+import bench
+
+def testQuickRun(tmp_path):
+    output = tmp_path / "report.json"
+    assert bench.main(["--families", "horn", "--sizes", "2", "4", "--repeat", "1", "--max-steps", "20", "--output", str(output)]) == 0
+    report = json.loads(output.read_text())
+    assert {row["family"] for row in report["results"]} == {"horn"}
+    assert {row["stage"] for row in report["results"]} == set(bench.STAGES)
@@ -0,0 +1,80 @@
+import clauseTypes as CT
+import cache
+import resolver
+
+def answer(result):
+    return (result["message"], [CT.clauseToString(clause) for clause in result["added"]],
+            [(CT.clauseToString(step.clause), step.clause_id, step.parents, step.unifier()) for step in result.get("proof", [])])
+
+def testMissIsTheUncachedRun():
+    texts = ["Man(socrates)", "or(not(Man(X)),Mortal(X))", "not(Mortal(socrates))"]
+    results = cache.ResultCache()
+    result = cache.cachedResolve(results, CT.parseClauses(texts))
+    assert answer(result) == answer(resolver.resolve(CT.parseClauses(texts)))
+    assert {"X": "socrates"} in [unifier for step in result["proof"] for unifier in step.unifier()]
+    again = cache.cachedResolve(results, CT.parseClauses(texts))
+    assert again["cached"] and answer(again) == answer(result)
+
+def testHitHasTheSubmittedNames():
+    results = cache.ResultCache()
+    cache.cachedResolve(results, CT.parseClauses(["Man(socrates)", "or(not(Man(X)),Mortal(X))", "not(Mortal(socrates))"]))
+    texts = ["not(Mortal(socrates))", "or(not(Man(WHO)),Mortal(WHO))", "Man(socrates)"]
+    result = cache.cachedResolve(results, CT.parseClauses(texts))
+    assert result["cached"]
+    _, _, steps = answer(result)
+    registered = [(text, clause_id) for text, clause_id, parents, _ in steps if len(parents) == 0]
+    assert registered == [(CT.clauseToString(CT.parseClause(text)), i) for i, text in enumerate(texts)]
+    unifiers = [unifier for step in result["proof"] for unifier in step.unifier()]
+    assert {"WHO": "socrates"} in unifiers
+    assert not any(name.startswith("V") for unifier in unifiers for name in unifier)
+
+def testDerivedClausesKeepTheSubmittedNames():
+    first = ["or(not(P(X,Y)),Q(Y,X))", "or(not(Q(A,B)),R(A))", "P(a,Z)", "not(R(b))"]
+    second = ["not(R(b))", "P(a,W)", "or(not(Q(C,D)),R(C))", "or(not(P(U,V)),Q(V,U))"]
+    results = cache.ResultCache()
+    cache.cachedResolve(results, CT.parseClauses(first))
+    hit = cache.cachedResolve(results, CT.parseClauses(second))
+    assert hit["cached"] and hit["message"] == "unsat"
+    # the same search, read with the variables of the second submission
+    uncached = resolver.resolve(CT.parseClauses(first))
+    swap = {"X": "U", "Y": "V", "A": "C", "B": "D", "Z": "W"}
+    expected = [CT.clauseToString(cache.renamedClause(clause, swap)) for clause in uncached["added"]]
+    assert [CT.clauseToString(clause) for clause in hit["added"]] == expected
+    assertProofHolds(hit)
+
+def assertProofHolds(result):
+    # every step is what its unifier makes of its parents
+    clauses = {step.clause_id: step.clause for step in result["proof"]}
+    for step in result["proof"]:
+        if step.substitution is None:
+            continue
+        made = {step.substitution.instantiate(predicate, offset, step.rename)
+                for offset, parent in enumerate(step.parents) for predicate in clauses[parent]}
+        assert set(step.clause) <= made, CT.clauseToString(step.clause)
+
+def testRenamedApartOnAHit():
+    # the resolvent of the first two clauses has an X from each of them
+    first = ["or(not(P(a)),Q(X))", "or(P(a),S(X))", "not(Q(b))", "not(S(c))"]
+    second = ["not(S(c))", "or(P(a),S(N))", "or(not(P(a)),Q(M))", "not(Q(b))"]
+    results = cache.ResultCache()
+    assert "or(Q(X),S(X1))" in [CT.clauseToString(clause) for clause in cache.cachedResolve(results, CT.parseClauses(first))["added"]]
+    hit = cache.cachedResolve(results, CT.parseClauses(second))
+    assert hit["cached"] and hit["message"] == "unsat"
+    added = [CT.clauseToString(clause) for clause in hit["added"]]
+    assert "or(Q(M),S(N))" in added
+    assert not any("X" in text for text in added)
+    assertProofHolds(hit)
+
+def testDeepTermsAreAnsweredButNotKept():
+    deep = "f("*3000 + "a" + ")"*3000
+    results = cache.ResultCache()
+    texts = [f"P({deep})", f"not(P({deep}))"]
+    assert cache.cachedResolve(results, CT.parseClauses(texts))["message"] == "unsat"
+    assert results.stats()["entries"] == 0
+    assert "cached" not in cache.cachedResolve(results, CT.parseClauses(texts))
+
+def testSupportOutOfRangeIsIgnored():
+    texts = ["P(a)", "or(not(P(X)),Q(X))", "not(Q(a))"]
+    uncached = resolver.resolve(CT.parseClauses(texts), "given_clause", strategy=resolver.makeStrategy("sos", {2, 7, -1}))
+    result = cache.cachedResolve(cache.ResultCache(), CT.parseClauses(texts), "given_clause", strategy="sos", support={2, 7, -1})
+    assert answer(result) == answer(uncached)
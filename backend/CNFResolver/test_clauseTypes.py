@@ -0,0 +1,40 @@
+import threading
+import clauseTypes as CT
+
+def testSameTermIsSameObject():
+    assert CT.FOLFunction("f", ["X"]) is CT.FOLFunction("f", ("X",))
+    assert CT.Predicate("P", [CT.FOLFunction("f", ["a"])], False) is CT.Predicate("P", [CT.FOLFunction("f", ["a"])], False)
+    assert CT.Predicate("P", ["a"], False) is not CT.Predicate("P", ["a"], True)
+
+def testInternedAcrossThreads():
+    # every thread builds the same fresh terms at once, they all have to get the same objects
+    threads = 8
+    barrier = threading.Barrier(threads)
+    built = [None]*threads
+    def build(k):
+        barrier.wait()
+        built[k] = [CT.Predicate("Race", [CT.FOLFunction("g", [f"c{i}"])], False) for i in range(2000)]
+    workers = [threading.Thread(target=build, args=(k,)) for k in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    for terms in built[1:]:
+        assert all(mine is theirs for mine, theirs in zip(terms, built[0]))
+    assert len(set(term for terms in built for term in terms)) == 2000
+
+def testClauseIsCanonical():
+    assert CT.parseClause("or(P(a),not(Q(X)))") == CT.parseClause("or(not(Q(X)),P(a))")
+    assert len(CT.parseClause("or(P(a),P(a))")) == 1
+
+def testParseErrors():
+    for text in ["P(a", "or(P(a))x", "not(or(P(a),Q(a)))", "P(a),Q(b)"]:
+        try:
+            CT.parseClause(text)
+        except ValueError:
+            continue
+        assert False, text
+
+def testDeepTermsRoundTrip():
+    text = "P(" + "f("*5000 + "a" + ")"*5000 + ")"
+    assert CT.clauseToString(CT.parseClause(text)) == text
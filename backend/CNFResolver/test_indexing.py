@@ -0,0 +1,37 @@
+import clauseTypes as CT
+from indexing import FactTable, LiteralIndex, TermIndex
+
+CLAUSES = CT.parseClauses(["or(P(a),Q(X))", "not(P(b))", "not(P(Y))", "or(not(Q(f(Z))),R(Z))", "not(Q(g(a)))"])
+
+def partnersOf(index, clause):
+    return sorted(index.partners(clause))
+
+def testLiteralIndexPartners():
+    index = LiteralIndex()
+    for i, clause in enumerate(CLAUSES):
+        index.addClause(i, clause)
+    # P(a) against not(P(b)) and not(P(Y)), Q(X) against both negative Q literals
+    assert partnersOf(index, CLAUSES[0]) == [(0, 1, 0), (0, 2, 0), (1, 3, 0), (1, 4, 0)]
+    index.removeClause(2, CLAUSES[2])
+    assert partnersOf(index, CLAUSES[0]) == [(0, 1, 0), (1, 3, 0), (1, 4, 0)]
+
+def testTermIndexOnlyUnifiable():
+    index = TermIndex()
+    for i, clause in enumerate(CLAUSES):
+        index.addClause(i, clause)
+    # P(b) does not unify with P(a), f(Z) and g(a) with X do
+    assert partnersOf(index, CLAUSES[0]) == [(0, 2, 0), (1, 3, 0), (1, 4, 0)]
+    assert index.complementary(CT.parseClause("Q(f(c))")[0]) == {3: [0]}
+
+def testFactTableLookup():
+    table = FactTable(2)
+    for row in [("a", "b"), ("a", "c"), ("b", "c")]:
+        assert table.add(row)
+    assert not table.add(("a", "b"))
+    assert sorted(table.lookup({0: "a"})) == [("a", "b"), ("a", "c")]
+    assert sorted(table.lookup({1: "c"})) == [("a", "c"), ("b", "c")]
+    assert list(table.lookup({0: "b", 1: "c"})) == [("b", "c")]
+    assert list(table.lookup({0: "c"})) == []
+    # indexes built on demand keep up with later rows
+    table.add(("d", "c"))
+    assert sorted(table.lookup({1: "c"})) == [("a", "c"), ("b", "c"), ("d", "c")]
@@ -0,0 +1,34 @@
+import clauseTypes as CT
+import loader
+import resolver
+
+def tptp(text):
+    return loader.collectClauses(loader.readClauses(text.splitlines(True), "tptp"))
+
+def testTPTPVariablesStayApart():
+    clauses, _ = tptp("cnf(a, axiom, p(Xa, XA, X_A)).\n")
+    [[literal]] = clauses
+    assert len(set(literal.args)) == 3
+    assert all(resolver.isVariable(arg) for arg in literal.args)
+    # p(a,b,c) is no instance of p(X,X,X), merging the variables would make this unsat
+    clauses, _ = tptp("cnf(a, axiom, ~p(Xa, XA, X_A)).\ncnf(b, negated_conjecture, p(a, b, c)).\n")
+    assert resolver.resolve(clauses)["message"] == "unsat"
+    clauses, _ = tptp("cnf(a, axiom, ~p(Xa, XA, Xa)).\ncnf(b, negated_conjecture, p(a, b, c)).\n")
+    assert resolver.resolve(clauses)["message"] == "sat"
+
+def testTPTPQuotedCapitalsAreConstants():
+    clauses, _ = tptp("cnf(a, axiom, p('FOO')).\n")
+    assert not resolver.isVariable(clauses[0][0].args[0])
+
+def testTPTPGoals():
+    clauses, goals = tptp("% a comment\ncnf(a, axiom, p(X) | ~q(X)).\ncnf(b, negated_conjecture, ~p(a)).\n")
+    assert CT.clausesToString(clauses) == ["or(p(X),not(q(X)))", "not(p(a))"]
+    assert goals == {1}
+
+def testNativeErrorsHaveTheLine():
+    try:
+        list(loader.readClauses(["P(a)\n", "# comment\n", "P(a\n"]))
+    except ValueError as error:
+        assert str(error).startswith("line 3:")
+    else:
+        assert False
@@ -0,0 +1,40 @@
+import threading
+import clauseTypes as CT
+import metrics
+import resolver
+
+def testOffByDefault():
+    assert not metrics.enabled
+
+def testRecordingCountsTheSearch():
+    with metrics.recording() as recorded:
+        assert metrics.enabled
+        resolver.resolve(CT.parseClauses(["or(P(X),P(Y))", "or(not(P(U)),not(P(V)))"]), "given_clause")
+    counters = recorded.snapshot()["counters"]
+    assert counters["pairs_tried"] > 0 and counters["factors_generated"] > 0
+    assert not metrics.enabled
+
+def testRecordingIsPerThread():
+    other = []
+    def work():
+        with metrics.recording() as recorded:
+            metrics.count("pairs_tried", 5)
+        other.append(recorded.snapshot()["counters"])
+    with metrics.recording() as mine:
+        worker = threading.Thread(target=work)
+        worker.start()
+        worker.join()
+    assert other == [{"pairs_tried": 5}]
+    assert mine.snapshot()["counters"] == {}
+
+def testTotals():
+    metrics.enable()
+    try:
+        metrics.totals.reset()
+        with metrics.timed("parse"):
+            CT.parseClauses(["P(a)"])
+        assert metrics.totals.snapshot()["timings"]["parse"]["calls"] >= 1
+    finally:
+        metrics.enable(False)
+        metrics.totals.reset()
+    assert not metrics.enabled
@@ -0,0 +1,215 @@
+import threading
+import time
+import pytest
+import clauseTypes as CT
+import resolver
+
+HORN_UNSAT = ["Man(socrates)", "or(not(Man(X)),Mortal(X))", "not(Mortal(socrates))"]
+HORN_SAT = ["Man(socrates)", "or(not(Man(X)),Mortal(X))", "not(Mortal(plato))"]
+# unsat, but not by input resolution
+NON_HORN_UNSAT = ["or(P(a),Q(a))", "or(not(P(a)),Q(a))", "or(P(a),not(Q(a)))", "or(not(P(a)),not(Q(a)))"]
+
+def resolved(texts, engine="given_clause", strategy=None):
+    return resolver.resolve(CT.parseClauses(texts), engine, strategy=resolver.makeStrategy(strategy) if strategy is not None else None)["message"]
+
+@pytest.mark.parametrize("strategy", sorted(resolver.STRATEGIES))
+def testStrategiesOnHorn(strategy):
+    assert resolved(HORN_UNSAT, strategy=strategy) == "unsat"
+    assert resolved(HORN_SAT, strategy=strategy) == "sat"
+
+@pytest.mark.parametrize("strategy", ["fifo", "unit", "weighted", "sos"])
+def testCompleteStrategiesOnNonHorn(strategy):
+    assert resolved(NON_HORN_UNSAT, strategy=strategy) == "unsat"
+
+def testInputResolutionIsUndecidedOnNonHorn():
+    assert resolved(NON_HORN_UNSAT, strategy="input") == "unknown"
+
+def testContextWithInputResolution():
+    context = resolver.Context()
+    context.registerClauses(CT.parseClauses(NON_HORN_UNSAT), resolver.makeStrategy("input"))
+    statuses = [sat for _, _, sat in context.steps()]
+    assert statuses[-1] == resolver.Satisfaction.UNKNOWN
+
+# unsat, but only with factoring
+NEEDS_FACTORING = ["or(P(X),P(Y))", "or(not(P(U)),not(P(V)))"]
+
+@pytest.mark.parametrize("engine", ["naive", "given_clause", "parallel", "auto"])
+def testEnginesFactor(engine):
+    assert resolved(NEEDS_FACTORING, engine) == "unsat"
+    assert resolved(NON_HORN_UNSAT, engine) == "unsat"
+    assert resolved(HORN_UNSAT, engine) == "unsat"
+    assert resolved(HORN_SAT, engine) == "sat"
+
+@pytest.mark.parametrize("strategy", ["fifo", "unit", "weighted", "sos"])
+def testStrategiesFactor(strategy):
+    assert resolved(NEEDS_FACTORING, strategy=strategy) == "unsat"
+
+def testFactorInProof():
+    result = resolver.resolve(CT.parseClauses(NEEDS_FACTORING), "given_clause")
+    factored = [step for step in result["proof"] if len(step.parents) == 1]
+    assert len(factored) > 0
+    assert all(len(step.unifier()) == 1 and len(step.unifier()[0]) == 1 for step in factored)
+
+def testContextDoesNotClaimSatWithoutFactoring():
+    context = resolver.Context()
+    context.registerClauses(CT.parseClauses(NEEDS_FACTORING))
+    statuses = [sat for _, _, sat in context.steps()]
+    assert statuses[-1] == resolver.Satisfaction.UNKNOWN
+
+def testContextStaysRefuted():
+    context = resolver.Context()
+    context.registerClauses(CT.parseClauses(["P(a)", "not(P(a))", "Q(b)"]))
+    _, _, sat = context.heuristicResolve()
+    assert sat == resolver.Satisfaction.UNSAT
+    assert context.heuristicResolve() == (None, [], resolver.Satisfaction.UNSAT)
+    assert context.partialResolve((0, 2)) == ([], resolver.Satisfaction.UNSAT)
+    assert len(context.refutation()) == 3
+
+def proofText(result):
+    return [(CT.clauseToString(step.clause), step.parents, step.unifier()) for step in result["proof"]]
+
+def testParallelProofHasUnifiers(monkeypatch):
+    # enough clauses for the worker processes, every rule needs a unifier to fire
+    monkeypatch.setattr(resolver, "PARALLEL_MIN_CLAUSES", 4)
+    texts = [f"P{i}(c)" for i in range(8)] + [f"or(not(P{i}(X)),Q{i}(X))" for i in range(8)] + ["not(Q5(c))"]
+    clauses = CT.parseClauses(texts)
+    parallel = resolver.resolve(clauses, "parallel", workers=2)
+    serial = resolver.resolve(clauses, "naive")
+    assert parallel["message"] == serial["message"] == "unsat"
+    assert proofText(parallel) == proofText(serial)
+    assert {"X": "c"} in [unifier for step in parallel["proof"] for unifier in step.unifier()]
+
+def testParallelWorkersLastTheWholeSearch(monkeypatch):
+    monkeypatch.setattr(resolver, "PARALLEL_MIN_CLAUSES", 4)
+    starts = []
+    start = resolver.ResolutionWorkers.start
+    monkeypatch.setattr(resolver.ResolutionWorkers, "start", lambda workers: starts.append(1) or start(workers))
+    rounds = []
+    work = resolver.ResolutionWorkers.round
+    monkeypatch.setattr(resolver.ResolutionWorkers, "round", lambda workers, *args: rounds.append(1) or work(workers, *args))
+    texts = ["P0(a)"] + [f"or(not(P{i}(X)),P{i+1}(X))" for i in range(6)] + ["not(P6(a))"]
+    assert resolver.resolve(CT.parseClauses(texts), "parallel", workers=2)["message"] == "unsat"
+    assert len(rounds) > 1 and len(starts) == 1
+
+@pytest.mark.parametrize("engine", ["naive", "given_clause"])
+def testFailedUnificationsSeeTheCancel(engine):
+    # no pair resolves, so nothing is ever spent
+    cancel = threading.Event()
+    cancel.set()
+    assert resolver.resolve(CT.parseClauses(["P(X,X)", "not(P(a,b))"]), engine, cancel=cancel)["message"] == "cancelled"
+
+def testHangingWorkersAreTerminatedOnTimeout(monkeypatch):
+    # workers that never answer, the round gives up when the budget runs out
+    monkeypatch.setattr(resolver, "PARALLEL_MIN_CLAUSES", 4)
+    unused = []
+    processes = []
+    def start(workers):
+        for _ in range(workers.count):
+            mine, theirs = resolver.WORKER_CONTEXT.Pipe()
+            process = resolver.WORKER_CONTEXT.Process(target=time.sleep, args=(60,), daemon=True)
+            process.start()
+            unused.append(theirs)
+            processes.append(process)
+            workers.connections.append(mine)
+            workers.processes.append(process)
+    monkeypatch.setattr(resolver.ResolutionWorkers, "start", start)
+    texts = [f"P{i}(c)" for i in range(8)] + ["not(Q(c))"]
+    started = time.perf_counter()
+    result = resolver.resolve(CT.parseClauses(texts), "parallel", workers=2, limits=resolver.ResourceLimits(max_seconds=0.3))
+    assert result["message"] == "timeout" and time.perf_counter() - started < 10
+    assert not any(process.is_alive() for process in processes)
+
+def testDefaultEngineGivesProofOnHorn():
+    result = resolver.resolve(CT.parseClauses(HORN_UNSAT))
+    assert result["message"] == "unsat"
+    assert len(result["added"]) > 0
+    assert [CT.clauseToString(step.clause) for step in result["proof"]][-1] == ""
+
+def testOnlyGivenClauseListsTheEmptyClause():
+    assert all(len(clause) > 0 for clause in resolver.resolve(CT.parseClauses(HORN_UNSAT))["added"])
+    assert len(resolver.resolve(CT.parseClauses(HORN_UNSAT), "given_clause")["added"][-1]) == 0
+
+def testAutoUsesFixedpointOnHorn():
+    result = resolver.resolve(CT.parseClauses(HORN_UNSAT), resolver.AUTO_ENGINE)
+    assert result["message"] == "unsat" and result["added"] == []
+    assert resolved(HORN_SAT, resolver.AUTO_ENGINE) == "sat"
+
+def testFixedpointOnDeepTerms():
+    deep = "f("*3000 + "a" + ")"*3000
+    assert resolved([f"P({deep})", f"not(P({deep}))"], "fixedpoint") == "unsat"
+    assert resolved([f"P({deep})", "or(not(P(f(X))),Q(X))", "not(Q(b))"], "fixedpoint") == "sat"
+
+def testFixedpointFallsBackWhenTranslationFails(monkeypatch):
+    def failing(clauses):
+        raise RecursionError("too deep")
+    monkeypatch.setattr(resolver, "HornTranslation", failing)
+    result = resolver.resolve(CT.parseClauses(HORN_UNSAT), "fixedpoint")
+    assert result["message"] == "unsat" and "proof" in result
+
+@pytest.mark.parametrize("texts,expected", [(HORN_UNSAT, "unsat"), (HORN_SAT, "sat"),
+        # backward chaining, the rule builds terms
+        (["Nat(z)", "or(not(Nat(X)),Nat(s(X)))", "not(Nat(s(s(z))))"], "unsat"),
+        (["Nat(z)", "or(not(Nat(X)),Nat(s(X)))", "not(Nat(s(a)))"], "sat"),
+        # a fact with a variable
+        (["Likes(X,cake)", "not(Likes(bob,cake))"], "unsat")])
+def testChainEngine(texts, expected):
+    result = resolver.resolve(CT.parseClauses(texts, written=True), "chain")
+    assert result["message"] == expected and result["added"] == []
+
+def testChainEngineNeedsHorn():
+    with pytest.raises(ValueError):
+        resolved(NON_HORN_UNSAT, "chain")
+
+def testChainEngineFallsBackWhenCutOff(monkeypatch):
+    monkeypatch.setattr(resolver, "CHAIN_MAX_DEPTH", 2)
+    texts = ["P0(f(a))"] + [f"or(not(P{i}(f(X))),P{i+1}(f(X)))" for i in range(6)] + ["not(P6(f(a)))"]
+    result = resolver.resolve(CT.parseClauses(texts), "chain")
+    assert result["message"] == "unsat" and len(result["proof"]) > 0
+
+def testRulesKeepTheWrittenBodyOrder():
+    kb = resolver.prepareForBackchaining(CT.parseClauses(["or(not(Zeta(X)),not(Alpha(X)),Head(X))"], written=True))
+    [(head, body)] = kb.rules[("Head", 1)]
+    assert [atom.name for atom in body] == ["Zeta", "Alpha"]
+
+def testUnifyWithOccursCheck():
+    substitution = resolver.Substitution()
+    assert not substitution.unify("X", CT.FOLFunction("f", ["X"]))
+    substitution = resolver.Substitution()
+    assert substitution.unify(CT.FOLFunction("g", ["X", "Y"]), CT.FOLFunction("g", [CT.FOLFunction("f", ["Y"]), "a"]))
+    assert CT.termToString(substitution.apply("X")) == "f(a)"
+
+def testOffsetsKeepClausesApart():
+    # the same variable name in both clauses, standardized apart by the offsets
+    resolvent, _, _ = resolver.resolveLiterals(CT.parseClause("or(P(X),Q(X))"), 0, CT.parseClause("or(not(P(f(X))),R(X))"), 0)
+    assert CT.clauseToString(resolvent) == "or(Q(f(X)),R(X))"
+
+def testLimitsStopTheSearch():
+    # satisfiable with an infinite Herbrand universe, saturation never ends
+    texts = ["Nat(z)", "or(not(Nat(X)),Nat(s(X)))", "not(Nat(a))"]
+    result = resolver.resolve(CT.parseClauses(texts), "given_clause", limits=resolver.ResourceLimits(max_inferences=50))
+    assert result["message"] == "resource_out" and result["stats"]["inferences"] > 50
+
+def testRefutationIsADAG():
+    result = resolver.resolve(CT.parseClauses(HORN_UNSAT), "given_clause")
+    ids = set()
+    for step in result["proof"]:
+        assert all(parent in ids for parent in step.parents)
+        if step.clause_id is not None:
+            ids.add(step.clause_id)
+    assert len(result["proof"][-1].clause) == 0
+
+def testBackchainQuery():
+    kb = resolver.prepareForBackchaining(CT.parseClauses(["Edge(a,b)", "Edge(b,c)", "Edge(c,a)",
+            "or(not(Edge(X,Y)),Path(X,Y))", "or(not(Path(X,Z)),not(Edge(Z,Y)),Path(X,Y))"], written=True))
+    assert resolver.backchain(kb, CT.parseClause("Path(a,a)")[0]) == resolver.TruthRepresentation.TRUE
+    assert resolver.backchain(kb, CT.parseClause("Path(a,d)")[0]) == resolver.TruthRepresentation.FALSE
+    chainer = resolver.Backchainer(kb)
+    assert sorted(answer["Y"] for answer in chainer.answers(CT.parseClause("Path(a,Y)"))) == ["a", "b", "c"]
+
+def testMarkedSupportIsUndecided():
+    # the contradiction is outside the marked support, saturating the supported clauses proves nothing
+    clauses = CT.parseClauses(["P(a)", "not(P(a))", "Q(b)"])
+    assert resolver.resolve(clauses, "given_clause", strategy=resolver.makeStrategy("sos", {2}))["message"] == "unknown"
+    context = resolver.Context()
+    context.registerClauses(clauses, resolver.makeStrategy("sos", {2}))
+    assert context.heuristicResolve() == (None, [], resolver.Satisfaction.UNKNOWN)
@@ -0,0 +1,159 @@
+import asyncio
+import http.client
+import json
+import threading
+from http.server import ThreadingHTTPServer
+import pytest
+import asyncServer
+import server
+
+def threadedServer():
+    httpd = ThreadingHTTPServer(("localhost", 0), server.Server)
+    httpd.daemon_threads = True
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    return httpd.server_address[1], httpd.shutdown
+
+def asyncioServer():
+    loop = asyncio.new_event_loop()
+    started = threading.Event()
+    ports = []
+    async def serve():
+        listener = await asyncio.start_server(asyncServer.AsyncServer().handle, "localhost", 0)
+        ports.append(listener.sockets[0].getsockname()[1])
+        started.set()
+        async with listener:
+            await listener.serve_forever()
+    threading.Thread(target=loop.run_until_complete, args=(serve(),), daemon=True).start()
+    started.wait(5)
+    return ports[0], lambda: None
+
+@pytest.fixture(params=[threadedServer, asyncioServer], ids=["threaded", "asyncio"])
+def port(request):
+    port, stop = request.param()
+    yield port
+    stop()
+
+def post(port, path, body, content_type="application/json", headers=None):
+    connection = http.client.HTTPConnection("localhost", port, timeout=30)
+    data = json.dumps(body) if not isinstance(body, (str, bytes)) else body
+    connection.request("POST", path, data, {"Content-Type": content_type, **(headers or {})})
+    response = connection.getresponse()
+    payload = json.loads(response.read())
+    connection.close()
+    return response.status, payload
+
+def testResolve(port):
+    status, payload = post(port, "/", {"clauses": ["P(a)", "not(P(a))"], "cache": False})
+    assert status == 200 and payload["message"] == "unsat"
+
+def testMalformedClause(port):
+    status, payload = post(port, "/", {"clauses": ["P(a", "not(P(a))"]})
+    assert status == 400 and len(payload["message"]) > 0
+
+@pytest.mark.parametrize("limits", [{"seconds": "5"}, {"inferences": -1}, {"clauses": 2.5}, {"memory_mb": True}, [5]])
+def testBadLimits(port, limits):
+    status, payload = post(port, "/", {"clauses": ["P(a)", "not(P(a))"], "limits": limits})
+    assert status == 400 and "limit" in payload["message"]
+
+def testMalformedRegistration(port):
+    status, payload = post(port, "/resolvent", {"register": ["or(P(a)"]}, headers={"X-Session-Id": "malformed"})
+    assert status == 400 and len(payload["message"]) > 0
+
+def testBodyNotJSON(port):
+    assert post(port, "/", "{", )[0] == 400
+    assert post(port, "/", "{}", "text/plain")[0] == 400
+
+def upload(port, query, lines, session="upload"):
+    return post(port, "/upload?" + query, "".join(line + "\n" for line in lines), "text/plain", {"X-Session-Id": session})
+
+UNSAT_FILE = ["Man(socrates)", "or(not(Man(X)),Mortal(X))", "not(Mortal(socrates))"]
+
+def testUploadFlags(port):
+    status, payload = upload(port, "resolve=true&added=false&cache=false", UNSAT_FILE)
+    assert status == 200 and payload["message"] == "unsat"
+    assert "added" not in payload and "cached" not in payload
+    status, payload = upload(port, "resolve=1&added=0&cache=0", UNSAT_FILE)
+    assert "cached" not in payload
+    status, payload = upload(port, "resolve&compare_serial=0&engine=parallel", UNSAT_FILE)
+    assert status == 200 and "serial_elapsed" not in payload.get("stats", {})
+    status, payload = upload(port, "resolve=false", UNSAT_FILE)
+    assert status == 200 and payload["clauses"] == 3
+
+def testUploadUnknownFlag(port):
+    status, payload = upload(port, "resolve=yes", UNSAT_FILE)
+    assert status == 400 and "resolve" in payload["message"]
+
+def testUploadMalformedClause(port):
+    status, payload = upload(port, "resolve=true", ["P(a)", "P(a"])
+    assert status == 400 and payload["message"].startswith("line 2:")
+
+def testLargeUpload(port):
+    # many lines, so the body comes in many chunks
+    lines = ["P0(a)"] + [f"or(not(P{i}(X)),P{i+1}(X))" for i in range(20000)] + ["not(P20000(a))"]
+    status, payload = upload(port, "", lines, session=f"large{port}")
+    assert status == 200 and payload["clauses"] == 20002
+
+def testCloseSession(port):
+    session = {"X-Session-Id": f"closing{port}"}
+    status, payload = post(port, "/resolvent", {"register": ["P(a)", "not(P(a))"]}, headers=session)
+    assert status == 200
+    assert post(port, "/resolvent", {"close": True}, headers=session)[1] == {"session": f"closing{port}", "closed": True}
+    assert f"closing{port}" not in server.sessions.sessions
+
+def testChainEngine(port):
+    status, payload = post(port, "/", {"clauses": ["Man(socrates)", "or(not(Man(X)),Mortal(X))", "not(Mortal(socrates))"], "engine": "chain"})
+    assert status == 200 and payload["message"] == "unsat" and payload["added"] == []
+    status, payload = post(port, "/", {"clauses": ["or(P(a),P(b))", "not(P(a))"], "engine": "chain"})
+    assert status == 400
+
+def stream(port, body):
+    connection = http.client.HTTPConnection("localhost", port, timeout=30)
+    connection.request("POST", "/stream", json.dumps(body) if not isinstance(body, str) else body, {"Content-Type": "application/json"})
+    response = connection.getresponse()
+    events = [json.loads(line) for line in response.read().decode("utf-8").splitlines() if len(line) > 0]
+    connection.close()
+    return response.status, events
+
+def testStream(port):
+    status, events = stream(port, {"clauses": ["P(a)", "or(not(P(X)),Q(X))", "not(Q(a))"]})
+    assert status == 200
+    assert events[-1]["message"] == "unsat"
+    assert events[-2]["clause"] == "" and all("parents" in event for event in events[:-1])
+
+def testStreamChecksTheRequestFirst(port):
+    assert stream(port, "{")[0] == 400
+    assert stream(port, {"clauses": ["P(a"]})[0] == 400
+    assert stream(port, {"clauses": ["P(a)"], "engine": "nope"})[0] == 400
+    assert stream(port, {"clauses": ["P(a)"], "strategy": "nope"})[0] == 400
+
+def testStreamFailureIsTheLastEvent(port, monkeypatch):
+    def failing(kb, budget):
+        raise RuntimeError("broken engine")
+        yield
+    monkeypatch.setitem(server.resolver.ENGINES, "naive", failing)
+    status, events = stream(port, {"clauses": ["P(a)", "not(P(a))"]})
+    assert status == 200 and events == [{"error": "Error in resolving", "detail": "broken engine"}]
+
+def testStepsInASession(port):
+    session = {"X-Session-Id": f"steps{port}"}
+    post(port, "/resolvent", {"register": ["P(a)", "or(not(P(X)),Q(X))", "not(Q(a))"]}, headers=session)
+    status, payload = post(port, "/resolvent", {"pairs": [1, 2]}, headers=session)
+    assert status == 200 and payload["added"] == ["Q(a)"] and payload["message"] == "still going on"
+    status, payload = post(port, "/resolvent", {"pairs": [3, 4]}, headers=session)
+    assert payload["message"] == "unsat" and payload["proof"][-1]["clause"] == ""
+
+def testCompactEncoding(port):
+    status, payload = post(port, "/", {"clauses": ["P(a)", "or(not(P(X)),Q(X))"], "encoding": "compact", "cache": False})
+    assert status == 200 and payload["message"] == "sat"
+    assert payload["symbols"]["base"] == 0
+    assert all(type(number) == int for clause in payload["added"] for number in clause)
+
+def testMetrics(port):
+    status, payload = post(port, "/", {"clauses": ["P(a)", "not(P(a))"], "metrics": True, "cache": False})
+    assert status == 200 and payload["metrics"]["counters"]["pairs_tried"] > 0
+    connection = http.client.HTTPConnection("localhost", port, timeout=30)
+    connection.request("GET", "/metrics")
+    response = connection.getresponse()
+    payload = json.loads(response.read())
+    connection.close()
+    assert response.status == 200 and "cache" in payload and payload["enabled"] is False
@@ -0,0 +1,59 @@
+import threading
+import time
+from sessions import SessionStore
+
+def testSameIdSameSession():
+    store = SessionStore(dict)
+    assert store.get("a") is store.get("a")
+    assert store.get(None).session_id != store.get(None).session_id
+
+def testEvictedOnOverflowExpiryAndDrop():
+    evicted = []
+    store = SessionStore(dict, max_sessions=2, ttl_seconds=0.05, evicted=lambda session_id, context: evicted.append(session_id))
+    store.get("a")
+    store.get("b")
+    store.get("a")
+    store.get("c")
+    assert evicted == ["b"]
+    store.drop("a")
+    store.drop("missing")
+    assert evicted == ["b", "a"]
+    time.sleep(0.1)
+    store.get("d")
+    assert evicted == ["b", "a", "c"]
+
+def testLoadOutsideTheLock():
+    # a slow load of one session does not hold up the others
+    loading = threading.Event()
+    release = threading.Event()
+    def load(session_id):
+        if session_id == "slow":
+            loading.set()
+            release.wait(5)
+        return {"id": session_id}
+    store = SessionStore(dict, load=load)
+    slow = threading.Thread(target=store.get, args=("slow",))
+    slow.start()
+    assert loading.wait(5)
+    assert store.get("fast").context == {"id": "fast"}
+    release.set()
+    slow.join()
+    assert store.get("slow").context == {"id": "slow"}
+
+def testConcurrentLoadsShareTheSession():
+    threads = 8
+    barrier = threading.Barrier(threads)
+    got = [None]*threads
+    def load(session_id):
+        # every thread misses before any of them gets to insert
+        barrier.wait(5)
+        return {}
+    store = SessionStore(dict, load=load)
+    def get(k):
+        got[k] = store.get("same")
+    workers = [threading.Thread(target=get, args=(k,)) for k in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    assert all(session is got[0] for session in got)
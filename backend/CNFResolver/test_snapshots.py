@@ -0,0 +1,50 @@
+import os
+import clauseTypes as CT
+import resolver
+import snapshots
+from sessions import SessionStore
+
+def testNoLogBeforeRegistration(tmp_path):
+    store = snapshots.SnapshotStore(str(tmp_path))
+    context = store.open("client")
+    assert os.listdir(tmp_path) == []
+    context.registerClauses(CT.parseClauses(["P(a)", "or(not(P(X)),Q(X))", "not(Q(a))"]))
+    assert os.path.exists(store.path("client"))
+
+def testReloadedContextGoesOn(tmp_path):
+    store = snapshots.SnapshotStore(str(tmp_path), compact_every=2)
+    context = store.open("client")
+    context.registerClauses(CT.parseClauses(["P0(a)", "or(not(P0(X)),P1(X))", "or(not(P1(X)),P2(X))", "not(P2(a))"]))
+    context.heuristicResolve()
+    reloaded = store.open("client")
+    assert CT.clausesToString(reloaded.kb.clauses) == CT.clausesToString(context.kb.clauses)
+    statuses = [sat for _, _, sat in reloaded.steps()]
+    assert statuses[-1] == resolver.Satisfaction.UNSAT
+
+def testLogRemovedWithItsSession(tmp_path):
+    store = snapshots.SnapshotStore(str(tmp_path))
+    sessions = SessionStore(resolver.Context, max_sessions=1, load=store.open, evicted=store.remove)
+    sessions.get("first").context.registerClauses(CT.parseClauses(["P(a)"]))
+    sessions.get("second").context.registerClauses(CT.parseClauses(["Q(a)"]))
+    assert not os.path.exists(store.path("first"))
+    assert os.path.exists(store.path("second"))
+    sessions.drop("second")
+    assert os.listdir(tmp_path) == []
+
+def testEvictedSessionIsNotWrittenAgain(tmp_path):
+    # a step still running when its session goes must not bring the log back
+    store = snapshots.SnapshotStore(str(tmp_path))
+    sessions = SessionStore(resolver.Context, load=store.open, evicted=store.remove)
+    context = sessions.get("gone").context
+    context.registerClauses(CT.parseClauses(["P0(a)", "or(not(P0(X)),P1(X))", "not(P1(a))"]))
+    sessions.drop("gone")
+    context.heuristicResolve()
+    assert os.listdir(tmp_path) == []
+
+def testTooDeepToPickleStaysInMemory(tmp_path):
+    deep = "f("*1200 + "a" + ")"*1200
+    context = snapshots.SnapshotStore(str(tmp_path)).open("deep")
+    context.registerClauses(CT.parseClauses([f"P({deep})", f"or(not(P({deep})),Q(b))", "not(Q(b))"]))
+    assert os.listdir(tmp_path) == []
+    statuses = [sat for _, _, sat in context.steps()]
+    assert statuses[-1] == resolver.Satisfaction.UNSAT and os.listdir(tmp_path) == []
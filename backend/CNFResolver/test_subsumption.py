@@ -0,0 +1,25 @@
+import clauseTypes as CT
+from subsumption import SubsumptionIndex, subsumes
+
+def clause(text):
+    return CT.parseClause(text)
+
+def testSubsumes():
+    assert subsumes(clause("P(X)"), clause("or(P(a),Q(b))"))
+    assert subsumes(clause("or(P(X),Q(Y))"), clause("or(P(a),Q(a))"))
+    # one variable, two different constants
+    assert not subsumes(clause("or(P(X),Q(X))"), clause("or(P(a),Q(b))"))
+    # a clause does not subsume its own factor
+    assert not subsumes(clause("or(P(X),P(Y))"), clause("P(Z)"))
+    assert not subsumes(clause("P(a)"), clause("P(X)"))
+
+def testForwardAndBackward():
+    index = SubsumptionIndex()
+    index.add(0, clause("or(P(a),Q(b))"))
+    index.add(1, clause("R(f(c))"))
+    assert index.forwardSubsumed(clause("or(P(a),Q(b),S(c))"))
+    assert not index.forwardSubsumed(clause("P(a)"))
+    assert index.backwardSubsumed(clause("P(X)")) == [0]
+    index.remove(0)
+    assert index.backwardSubsumed(clause("P(X)")) == []
+    assert index.backwardSubsumed(clause("R(X)")) == [1]
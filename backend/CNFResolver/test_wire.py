@@ -0,0 +1,41 @@
+import json
+import clauseTypes as CT
+import server
+import wire
+
+TEXTS = ["or(P(f(X,g(a))),not(Q(X)))", "not(R)", "S(b,Y)"]
+
+def testRoundTrip():
+    encoder = wire.Encoder()
+    clauses = CT.parseClauses(TEXTS)
+    encoded = encoder.clauses(clauses)
+    table = encoder.delta()["new"]
+    assert [wire.decodeClause(numbers, table) for numbers in encoded] == clauses
+
+def testOnlyNewSymbolsAreSent():
+    encoder = wire.Encoder()
+    first = encoder.encode({"added": CT.parseClauses(TEXTS[:1])})
+    second = encoder.encode({"added": CT.parseClauses(TEXTS[:2])})
+    assert first["symbols"]["base"] == 0
+    assert second["symbols"]["base"] == len(first["symbols"]["new"])
+    assert second["symbols"]["new"] == [("R", 0)]
+    # a client that lost its table asks for all of it
+    assert encoder.encode({"added": []}, known=0)["symbols"]["base"] == 0
+
+def testDeepTerm():
+    text = "P(" + "f("*5000 + "a" + ")"*5000 + ")"
+    encoder = wire.Encoder()
+    [numbers] = encoder.clauses([CT.parseClause(text)])
+    assert CT.clauseToString(wire.decodeClause(numbers, encoder.delta()["new"])) == text
+
+def testSerializeJSON():
+    body, content_type = wire.serialize({"message": "sat"})
+    assert content_type == wire.JSON_TYPE and json.loads(body) == {"message": "sat"}
+
+def testOverClaimedSymbolsGetTheWholeTable():
+    reply = server.resolveMessage({"clauses": ["P(a)", "or(not(P(X)),Q(X))"], "encoding": "compact", "symbols": 3, "cache": False})
+    assert reply["symbols"]["base"] == 0
+    assert [CT.clauseToString(wire.decodeClause(numbers, reply["symbols"]["new"])) for numbers in reply["added"]] == ["Q(a)"]
+    encoder = wire.Encoder()
+    encoder.encode({"added": CT.parseClauses(TEXTS)})
+    assert encoder.encode({"added": []}, known=len(encoder.table) + 5)["symbols"] == {"base": 0, "new": encoder.table}
@@ -0,0 +1,103 @@
+import json
+from typing import Any,Dict,List,Sequence,Tuple,Union
+import clauseTypes as CT
+import metrics
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+# Compact clause encoding for the servers.
+# Symbols are interned in a table that only grows, a symbol is a name with its arity,
+# None for the constants and variables. A response carries the symbols the client
+# has not seen yet: {"base": number of symbols it already has, "new": [[name, arity], ...]}.
+# A clause is a flat list of integers, literal after literal: 2*symbol + negated
+# followed by the symbols of the arguments in preorder, the arities tell where terms end.
+# Variables keep the convention of the text format, their names are all upper case.
+# With Accept: application/x-msgpack the payload is sent as msgpack when it is installed.
+
+MSGPACK_TYPE = "application/x-msgpack"
+JSON_TYPE = "text/json"
+
+Symbol = Tuple[str,Union[int,None]]
+
+class Encoder:
+    def __init__(self):
+        self.ids:Dict[Symbol,int] = {}
+        self.table:List[Symbol] = []
+        # symbols the client is known to have
+        self.sent = 0
+    def symbol(self, name:str, arity:Union[int,None]) -> int:
+        key = (name, arity)
+        symbol = self.ids.get(key)
+        if symbol is None:
+            symbol = len(self.table)
+            self.ids[key] = symbol
+            self.table.append(key)
+        return symbol
+    def clause(self, clause:Sequence[CT.Predicate]) -> List[int]:
+        out:List[int] = []
+        for predicate in clause:
+            out.append(2*self.symbol(predicate.name, len(predicate.args)) + predicate.is_negated)
+            stack:List[Union[str,CT.FOLFunction]] = list(reversed(predicate.args))
+            while len(stack) > 0:
+                term = stack.pop()
+                if type(term) == CT.FOLFunction:
+                    out.append(self.symbol(term.name, len(term.args)))
+                    stack.extend(reversed(term.args))
+                else:
+                    out.append(self.symbol(term, None))
+        return out
+    def clauses(self, clauses:Sequence[Sequence[CT.Predicate]]) -> List[List[int]]:
+        return [self.clause(clause) for clause in clauses]
+    def delta(self, known:Union[int,None] = None) -> Dict[str,Any]:
+        # the symbols not sent yet, known is how many the client says it has:
+        # when that is not what we sent, it gets the whole table again
+        base = self.sent if known is None or int(known) == self.sent else 0
+        self.sent = len(self.table)
+        return {"base": base, "new": self.table[base:]}
+    def encode(self, payload:Dict[str,Any], keys:Sequence[str] = ("added",), known:Union[int,None] = None) -> Dict[str,Any]:
+        # the payload with the clauses under keys encoded, and the symbols they need
+        encoded = dict(payload)
+        for key in keys:
+            if key in encoded:
+                encoded[key] = self.clauses(encoded[key])
+        encoded["symbols"] = self.delta(known)
+        return encoded
+
+def decodeClause(encoded:Sequence[int], table:Sequence[Sequence[Any]]) -> CT.Clause:
+    literals:List[CT.Predicate] = []
+    i = 0
+    while i < len(encoded):
+        name, arity = table[encoded[i] >> 1]
+        negated = bool(encoded[i] & 1)
+        i += 1
+        # frames of [name, arity, args], the literal itself is the bottom one
+        stack:List[List[Any]] = [[name, arity, []]]
+        while len(stack) > 0:
+            name, arity, args = stack[-1]
+            if len(args) == arity:
+                stack.pop()
+                if len(stack) == 0:
+                    literals.append(CT.Predicate(name, args, negated))
+                else:
+                    stack[-1][2].append(CT.FOLFunction(name, args))
+                continue
+            name, arity = table[encoded[i]]
+            i += 1
+            if arity is None:
+                args.append(name)
+            else:
+                stack.append([name, arity, []])
+    return CT.Clause(literals)
+
+def wantsBinary(accept:Union[str,None]) -> bool:
+    return MSGPACK_TYPE in (accept or "")
+
+def serialize(payload:Dict[str,Any], accept:Union[str,None] = None) -> Tuple[bytes,str]:
+    # the body and its content type, msgpack only when asked for and available
+    with metrics.timed("serialize"):
+        if msgpack is not None and wantsBinary(accept):
+            return msgpack.packb(payload), MSGPACK_TYPE
+        return json.dumps(payload, separators=(",", ":") if "symbols" in payload else None).encode("utf-8"), JSON_TYPE